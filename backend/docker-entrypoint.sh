@@ -3,13 +3,25 @@
 set -e
 # export DJANGO_SETTINGS_MODULE=${DJANGO_SETTINGS_MODULE}
 
+# CONTAINER_ROLE=consumer runs the SQS consumer instead of the web server
+if [ "${CONTAINER_ROLE}" = "consumer" ]; then
+    echo "Starting SQS consumer"
+    exec python manage.py run_consumer
+fi
+
 # Apply database migrations
 echo "Apply database migrations"
 python manage.py migrate
 python manage.py collectstatic --noinput
 # Start server
 echo "Starting server"
+# Threaded workers only on deployments that serve upload progress streams (UPLOAD_PROGRESS_MAX_STREAMS)
+GUNICORN_WORKER_ARGS=""
+if [ -n "${GUNICORN_THREADS}" ]; then
+    GUNICORN_WORKER_ARGS="--worker-class=gthread --threads=${GUNICORN_THREADS}"
+fi
 gunicorn elexis_dashboard.wsgi:application --bind ${HOST}:${PORT} --log-level=debug \
                           --timeout=0 \
+                          ${GUNICORN_WORKER_ARGS} \
                           --access-logfile=-\
                           --log-file=-
\ No newline at end of file
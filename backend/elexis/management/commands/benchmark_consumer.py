@@ -0,0 +1,86 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from elexis.services.consumer_benchmark import ConsumerBenchmark, FakeLatency, DEFAULT_MIX, format_report, parse_mix
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the SQS consumer offline: run a message mix through process_message against a "
+            "freshly created test database, with S3, Gemini, Pinecone and SQS faked")
+
+    # The system checks import the URLconf, and with it the real Pinecone client
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', default=",".join(f"{t}={n}" for t, n in DEFAULT_MIX.items()),
+                            help="Messages to seed per type, e.g. 'ai_job_resume_evaluation=100,generate_embedding=50'")
+        parser.add_argument('--workers', type=int, default=settings.SQS_CONSUMER_WORKERS,
+                            help="Threads calling process_message")
+        parser.add_argument('--jobs', type=int, default=5, help="Jobs the seeded candidates are spread over")
+        parser.add_argument('--bulk-files', type=int, default=10, help="Files per process_bulk_resumes message")
+        parser.add_argument('--s3-latency-ms', type=float, default=50, help="Latency of S3 and resume downloads")
+        parser.add_argument('--gemini-latency-ms', type=float, default=1000, help="Latency of Gemini generate calls")
+        parser.add_argument('--embedding-latency-ms', type=float, default=200, help="Latency of Gemini embed calls")
+        parser.add_argument('--pinecone-latency-ms', type=float, default=50)
+        parser.add_argument('--sqs-latency-ms', type=float, default=20)
+        parser.add_argument('--jitter', type=float, default=0.25, help="Latency jitter, as a fraction of the latency")
+        parser.add_argument('--no-follow-ups', action='store_true',
+                            help="Drop the messages published by handlers instead of handling them too")
+        parser.add_argument('--trace-memory', action='store_true',
+                            help="Also report the tracemalloc peak (slows the run down)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the report as JSON to this file, to use as a baseline later")
+        parser.add_argument('--baseline', help="JSON report of an earlier run to compare against")
+        parser.add_argument('--migrate', action='store_true',
+                            help="Build the test database with the migrations instead of from the models")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database after the run")
+        parser.add_argument('--verbose', action='store_true', help="Show the output of the handlers")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not mix:
+            raise CommandError("The message mix is empty")
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        latency = FakeLatency(
+            s3=options['s3_latency_ms'] / 1000,
+            gemini=options['gemini_latency_ms'] / 1000,
+            embedding=options['embedding_latency_ms'] / 1000,
+            pinecone=options['pinecone_latency_ms'] / 1000,
+            sqs=options['sqs_latency_ms'] / 1000,
+            jitter=options['jitter'],
+        )
+
+        # Seeded in the test database of the configured server (test_<DB_NAME>), never in DB_NAME itself
+        connection.settings_dict.setdefault('TEST', {})['MIGRATE'] = options['migrate']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = ConsumerBenchmark(
+                mix,
+                workers=options['workers'],
+                latency=latency,
+                jobs=options['jobs'],
+                bulk_files=options['bulk_files'],
+                follow_ups=not options['no_follow_ups'],
+                trace_memory=options['trace_memory'],
+                verbose=options['verbose'],
+                seed=options['seed'],
+            ).run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        self.stdout.write(format_report(report, baseline))
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,70 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from elexis.services.pdf_parsing_service import configure_pdf_parsing, get_pdf_parsing_service
+from elexis.services.sqs_async_consumer import AsyncSQSConsumer
+from elexis.services.sqs_consumer_pool import SQSConsumerPool, SQSConsumerProcessPool
+from elexis.services.sqs_queues import SQSQueue, get_consumer_queues, STANDARD_PRIORITY
+
+
+class Command(BaseCommand):
+    help = "Run the SQS consumer as a dedicated process with a pool of thread or process workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['thread', 'process', 'async'], default=settings.SQS_CONSUMER_MODE,
+                            help="Run workers as threads in this process, as separate processes, or as asyncio tasks")
+        parser.add_argument('--workers', type=int, default=settings.SQS_CONSUMER_WORKERS,
+                            help="Number of worker threads (per process in process mode)")
+        parser.add_argument('--processes', type=int, default=settings.SQS_CONSUMER_PROCESSES,
+                            help="Number of consumer processes in process mode")
+        parser.add_argument('--concurrency', type=int, default=settings.SQS_CONSUMER_CONCURRENCY,
+                            help="Messages handled at once in async mode")
+        parser.add_argument('--sync-threads', type=int, default=settings.SQS_CONSUMER_SYNC_THREADS,
+                            help="Executor threads for ORM calls and sync handlers in async mode")
+        parser.add_argument('--batch-size', type=int, default=settings.SQS_CONSUMER_BATCH_SIZE,
+                            help="Messages requested per receive_message call (max 10)")
+        parser.add_argument('--pdf-processes', type=int, default=settings.PDF_PARSER_PROCESSES,
+                            help="PDF parsing processes, split across the consumer processes in process mode")
+        parser.add_argument('--queue-url', default=None,
+                            help="Poll only this queue instead of the interactive/standard/bulk queues")
+
+    def handle(self, *args, **options):
+        if options['queue_url']:
+            queues = [SQSQueue(priority=STANDARD_PRIORITY, url=options['queue_url'], weight=1)]
+        else:
+            queues = get_consumer_queues()
+        if not queues:
+            raise CommandError("SQS_QUEUE_URL is not set")
+
+        if options['mode'] == 'process':
+            pool = SQSConsumerProcessPool(
+                queues,
+                processes=options['processes'],
+                workers_per_process=options['workers'],
+                batch_size=options['batch_size'],
+                pdf_parser_processes=(max(1, options['pdf_processes'] // max(1, options['processes']))
+                                      if options['pdf_processes'] > 0 else 0),
+            )
+        elif options['mode'] == 'async':
+            configure_pdf_parsing(options['pdf_processes'])
+            pool = AsyncSQSConsumer(
+                queues,
+                concurrency=options['concurrency'],
+                batch_size=options['batch_size'],
+                sync_threads=options['sync_threads'],
+            )
+        else:
+            configure_pdf_parsing(options['pdf_processes'])
+            pool = SQSConsumerPool(
+                queues,
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+            )
+
+        signal.signal(signal.SIGTERM, lambda *_: pool.stop())
+        signal.signal(signal.SIGINT, lambda *_: pool.stop())
+        self.stdout.write(f"Starting SQS consumer in {options['mode']} mode")
+        pool.run()
+        get_pdf_parsing_service().shutdown()
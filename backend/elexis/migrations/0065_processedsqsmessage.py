@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:44
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elexis', '0064_resumeuploadtracker_ai_failed_files_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedSQSMessage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('modified_date', models.DateTimeField(auto_now=True)),
+                ('dedup_key', models.CharField(max_length=100, unique=True)),
+                ('message_id', models.CharField(db_index=True, max_length=100)),
+                ('payload_hash', models.CharField(db_index=True, max_length=64)),
+                ('message_type', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='processing', max_length=20)),
+                ('attempts', models.IntegerField(default=1)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_created_%(class)s', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_modified_%(class)s', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:05
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elexis', '0065_processedsqsmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumeUploadItem',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('modified_date', models.DateTimeField(auto_now=True)),
+                ('index', models.IntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('s3_bucket', models.CharField(max_length=255)),
+                ('s3_key', models.CharField(max_length=1024)),
+                ('content_type', models.CharField(default='application/pdf', max_length=100)),
+                ('size', models.IntegerField(blank=True, null=True)),
+                ('content_hash', models.CharField(blank=True, db_index=True, max_length=64, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('candidate', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_items', to='elexis.candidate')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_created_%(class)s', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_modified_%(class)s', to=settings.AUTH_USER_MODEL)),
+                ('tracker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='elexis.resumeuploadtracker')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tracker', 'status'], name='elexis_resu_tracker_c4abd3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tracker', 'index'), name='unique_upload_item_index')],
+            },
+        ),
+    ]
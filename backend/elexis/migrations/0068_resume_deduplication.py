@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elexis', '0067_resumeextraction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumeuploaditem',
+            name='deduplicated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='resumeuploadtracker',
+            name='deduplicated_files',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='candidate',
+            index=models.Index(fields=['organization', 'resume_content_hash'], name='elexis_cand_organiz_036671_idx'),
+        ),
+    ]
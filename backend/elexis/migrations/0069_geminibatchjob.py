@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:39
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elexis', '0068_resume_deduplication'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumeuploaditem',
+            name='extraction',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='GeminiBatchJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('modified_date', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('state', models.CharField(choices=[('submitted', 'Submitted'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='submitted', max_length=20)),
+                ('request_count', models.IntegerField(default=0)),
+                ('polls', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('submitted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_created_%(class)s', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_modified_%(class)s', to=settings.AUTH_USER_MODEL)),
+                ('tracker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gemini_batch_jobs', to='elexis.resumeuploadtracker')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='resumeuploaditem',
+            name='gemini_batch_job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='elexis.geminibatchjob'),
+        ),
+    ]
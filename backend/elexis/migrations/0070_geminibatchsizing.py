@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:46
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elexis', '0069_geminibatchjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeminiBatchSizing',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('modified_date', models.DateTimeField(auto_now=True)),
+                ('api_key_hash', models.CharField(max_length=64, unique=True)),
+                ('batch_size', models.IntegerField()),
+                ('jobs', models.IntegerField(default=0)),
+                ('quota_errors', models.IntegerField(default=0)),
+                ('last_quota_error_at', models.DateTimeField(blank=True, null=True)),
+                ('success_rate', models.FloatField(default=1.0)),
+                ('latency_seconds', models.FloatField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_created_%(class)s', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='has_modified_%(class)s', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
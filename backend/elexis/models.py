@@ -1,11 +1,14 @@
 import uuid
-from django.db import models
+import hashlib
+from datetime import timedelta
+from django.db import models, transaction
+from django.db.models.functions import Cast, Concat, Greatest
 from django.db.models import JSONField
 from django.utils.translation import gettext as _
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
-from typing import Optional
+from typing import List, Optional
 from typing_extensions import Self
 
 LANG_CHOICES = [
@@ -105,10 +108,45 @@ class Candidate(BaseModel):
         max_length=255, blank=True, null=True,
         help_text="ID of the resume embedding in the vector database."
     )
+    resume_content_hash = models.CharField(
+        max_length=64, blank=True, null=True, db_index=True,
+        help_text="SHA-256 of the resume file, the key of its ResumeExtraction."
+    )
     class Meta:
         ordering = ['-created_date'] 
+        indexes = [
+            # Bulk uploads look up an existing candidate with the same resume file
+            models.Index(fields=['organization', 'resume_content_hash']),
+        ]
+    def save(self, *args, **kwargs):
+        # A newly assigned resume file is hashed while it is still in memory
+        if not self.resume:
+            self.resume_content_hash = None
+        elif not self.resume._committed:
+            digest = hashlib.sha256()
+            for chunk in self.resume.chunks():
+                digest.update(chunk)
+            self.resume_content_hash = digest.hexdigest()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'resume_content_hash'}
+        super().save(*args, **kwargs)
     def __str__(self):
         return self.name
+
+
+class ResumeExtraction(BaseModel):
+    """
+    What Gemini extracted from one resume file, keyed by its content hash: the plain text used for
+    evaluations and embeddings, the experience list and the summary. Produced once per resume version,
+    see elexis.services.resume_text_store.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    text = models.TextField(blank=True, null=True)
+    experience = models.JSONField(blank=True, null=True)
+    summary = models.JSONField(blank=True, null=True)
+
+    def __str__(self):
+        return self.content_hash
 class Job(BaseModel):
     recruiter = models.ForeignKey(
         Recruiter, on_delete=models.CASCADE, related_name="jobs"
@@ -456,6 +494,8 @@ class ResumeUploadTracker(BaseModel):
     processed_files = models.IntegerField(default=0)
     successful_files = models.IntegerField(default=0)
     failed_files = models.IntegerField(default=0)
+    # Files identical to the resume of an existing candidate, attached to that candidate instead
+    deduplicated_files = models.IntegerField(default=0)
     
     # AI processing tracking (separate from file upload success)
     ai_processed_files = models.IntegerField(default=0)
@@ -481,12 +521,14 @@ class ResumeUploadTracker(BaseModel):
         self.status = 'processing'
         self.started_at = timezone.now()
         self.save(update_fields=['status', 'started_at'])
+        self._publish_progress()
     
     def complete_processing(self):
         """Mark job as completed"""
         self.status = 'completed' if self.failed_files == 0 else 'partially_failed'
         self.completed_at = timezone.now()
         self.save(update_fields=['status', 'completed_at'])
+        self._publish_progress()
     
     def fail_processing(self, error_message):
         """Mark job as failed"""
@@ -494,6 +536,7 @@ class ResumeUploadTracker(BaseModel):
         self.error_message = error_message
         self.completed_at = timezone.now()
         self.save(update_fields=['status', 'error_message', 'completed_at'])
+        self._publish_progress()
     
     def update_progress(self, processed=None, successful=None, failed=None):
         """Update processing progress"""
@@ -504,6 +547,7 @@ class ResumeUploadTracker(BaseModel):
         if failed is not None:
             self.failed_files = failed
         self.save(update_fields=['processed_files', 'successful_files', 'failed_files'])
+        self._publish_progress()
     
     def update_ai_progress(self, ai_processed=None, ai_successful=None, ai_failed=None):
         """Update AI processing progress separately"""
@@ -514,17 +558,89 @@ class ResumeUploadTracker(BaseModel):
         if ai_failed is not None:
             self.ai_failed_files = ai_failed
         self.save(update_fields=['ai_processed_files', 'ai_successful_files', 'ai_failed_files'])
-        
-        # Update overall status if AI processing is complete
-        if self.ai_processed_files >= self.successful_files and self.status == 'processing':
-            if self.ai_failed_files > 0:
-                self.status = 'partially_failed'
-                self.error_message = f"AI processing failed for {self.ai_failed_files} out of {self.successful_files} files"
-            else:
-                self.status = 'completed'
-            self.completed_at = timezone.now()
-            self.save(update_fields=['status', 'error_message', 'completed_at'])
+        self._complete_if_done()
+    
+    def increment_ai_progress(self, succeeded: bool) -> bool:
+        """
+        Count one finished AI evaluation. AI evaluations run concurrently, so the counters are incremented
+        in the database (no read-modify-write on this possibly stale instance, and no row lock held).
+        Returns True if this evaluation completed the upload.
+        """
+        ResumeUploadTracker.objects.filter(pk=self.pk).update(
+            ai_processed_files=models.F('ai_processed_files') + 1,
+            ai_successful_files=models.F('ai_successful_files') + (1 if succeeded else 0),
+            ai_failed_files=models.F('ai_failed_files') + (0 if succeeded else 1),
+        )
+        return self._complete_if_done()
     
+    def _complete_if_done(self) -> bool:
+        """
+        Complete the upload once every file was processed (completed_at is set when the file stage ends)
+        and, for an upload to a job, every successful file was evaluated (without a job nothing is
+        evaluated). One conditional UPDATE, so concurrent callers can not both complete it or overwrite
+        each other's outcome. Returns True for the caller that completed it.
+        """
+        completed = ResumeUploadTracker.objects.filter(
+            models.Q(job__isnull=True) | models.Q(ai_processed_files__gte=models.F('successful_files')),
+            pk=self.pk,
+            status='processing',
+            completed_at__isnull=False,
+            processed_files__gte=models.F('total_files'),
+        ).update(
+            status=models.Case(
+                models.When(models.Q(failed_files__gt=0) | models.Q(ai_failed_files__gt=0), then=models.Value('partially_failed')),
+                default=models.Value('completed'),
+                output_field=models.CharField(),
+            ),
+            error_message=models.Case(
+                models.When(ai_failed_files__gt=0, then=Concat(
+                    models.Value('AI processing failed for '), Cast('ai_failed_files', models.TextField()),
+                    models.Value(' out of '), Cast('successful_files', models.TextField()), models.Value(' files'),
+                )),
+                default=models.F('error_message'),
+                output_field=models.TextField(),
+            ),
+            completed_at=timezone.now(),
+        )
+        self.refresh_from_db()
+        self._publish_progress()
+        return bool(completed)
+    
+    def refresh_file_totals(self) -> bool:
+        """
+        Recompute the file counters of a bulk upload from its items, with one aggregate query.
+        Items are finished by concurrent workers, so counters only ever move up (a worker that aggregated
+        earlier can not overwrite newer totals), and a conditional UPDATE lets exactly one caller end the
+        file stage. Returns True for that caller.
+        """
+        totals = self.items.aggregate(
+            total=models.Count('id'),
+            processed=models.Count('id', filter=models.Q(status__in=ResumeUploadItem.FINISHED_STATUSES)),
+            # Deduplicated files created no candidate, so they are not waiting for an AI evaluation either
+            successful=models.Count('id', filter=models.Q(status='succeeded', deduplicated=False)),
+            failed=models.Count('id', filter=models.Q(status='failed')),
+            deduplicated=models.Count('id', filter=models.Q(status='succeeded', deduplicated=True)),
+        )
+        trackers = ResumeUploadTracker.objects.filter(pk=self.pk)
+        trackers.update(
+            total_files=totals['total'],
+            processed_files=Greatest(models.F('processed_files'), totals['processed']),
+            successful_files=Greatest(models.F('successful_files'), totals['successful']),
+            failed_files=Greatest(models.F('failed_files'), totals['failed']),
+            deduplicated_files=Greatest(models.F('deduplicated_files'), totals['deduplicated']),
+        )
+        # Conditional, so only one of the workers finishing at the same time ends the file stage
+        finished = trackers.filter(
+            status='processing', completed_at__isnull=True, processed_files__gte=models.F('total_files')
+        ).update(completed_at=timezone.now())
+        if finished:
+            # AI progress may already be complete, e.g. if the last files failed
+            self._complete_if_done()
+        else:
+            self.refresh_from_db()
+            self._publish_progress()
+        return bool(finished)
+
     def complete_processing(self):
         """Mark job as completed"""
         # Only mark as completed if no file upload failures
@@ -535,6 +651,12 @@ class ResumeUploadTracker(BaseModel):
             self.status = 'partially_failed'
         self.completed_at = timezone.now()
         self.save(update_fields=['status', 'completed_at'])
+        self._publish_progress()
+    
+    def _publish_progress(self):
+        """Push the new progress to the open upload progress streams"""
+        from elexis.services.upload_progress import publish_progress
+        publish_progress(self)
     
     @property
     def progress_percentage(self):
@@ -552,4 +674,207 @@ class ResumeUploadTracker(BaseModel):
     
     def __str__(self):
         return f"Upload Tracker {self.upload_type} - {self.status} ({self.processed_files}/{self.total_files})"
-        return f"{self.upload_type} - {self.status} - {self.progress_percentage:.1f}%"
\ No newline at end of file
+        return f"{self.upload_type} - {self.status} - {self.progress_percentage:.1f}%"
+
+class GeminiBatchJob(BaseModel):
+    """
+    A Gemini Batch API job extracting the resumes of bulk upload items. Submitted and polled by consumer
+    messages, so no worker waits for it; its items are processed once it finished.
+    """
+    STATE_CHOICES = [
+        ('submitted', 'Submitted'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATES = ('submitted',)
+
+    tracker = models.ForeignKey(
+        ResumeUploadTracker, on_delete=models.CASCADE, related_name="gemini_batch_jobs"
+    )
+    # Gemini's name of the job, "batches/..."
+    name = models.CharField(max_length=255, unique=True)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='submitted')
+    request_count = models.IntegerField(default=0)
+    polls = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    submitted_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.state})"
+
+
+class GeminiBatchSizing(BaseModel):
+    """
+    What the batch sizer learned about one Gemini API key (see AdaptiveBatchSizer): the number of resumes
+    per batch job, and the recent quota errors, success rate and latency of its jobs.
+    """
+    # SHA-256 of the API key, the key itself is never stored
+    api_key_hash = models.CharField(max_length=64, unique=True)
+    batch_size = models.IntegerField()
+    jobs = models.IntegerField(default=0)
+    quota_errors = models.IntegerField(default=0)
+    last_quota_error_at = models.DateTimeField(null=True, blank=True)
+    # Moving averages over the recent jobs
+    success_rate = models.FloatField(default=1.0)
+    latency_seconds = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.api_key_hash[:12]}: {self.batch_size} per job"
+
+
+class ResumeUploadItem(BaseModel):
+    """
+    One file of a bulk upload. Workers claim items with SELECT ... FOR UPDATE SKIP LOCKED, so a batch
+    interrupted by a crash or deploy is resumed by queueing its unfinished items again.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    FINISHED_STATUSES = ('succeeded', 'failed')
+
+    # An item still processing after this long belongs to a worker that died, and can be claimed again
+    CLAIM_TIMEOUT = timedelta(minutes=10)
+    MAX_ATTEMPTS = 3
+    # Written when an item succeeds or fails
+    RESULT_FIELDS = ['status', 'candidate', 'error_message', 'content_hash', 'deduplicated', 'completed_at', 'modified_date']
+
+    tracker = models.ForeignKey(
+        ResumeUploadTracker, on_delete=models.CASCADE, related_name="items"
+    )
+    index = models.IntegerField()
+    name = models.CharField(max_length=255)
+    s3_bucket = models.CharField(max_length=255)
+    s3_key = models.CharField(max_length=1024)
+    content_type = models.CharField(max_length=100, default='application/pdf')
+    size = models.IntegerField(null=True, blank=True)
+    # SHA-256 of the file, hex
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    candidate = models.ForeignKey(
+        Candidate, on_delete=models.SET_NULL, null=True, blank=True, related_name="upload_items"
+    )
+    # The file is identical to the resume of an existing candidate, `candidate` is that candidate
+    deduplicated = models.BooleanField(default=False)
+    # Extracted by a Gemini batch job: {"name", "email", "phone"}, its text is in the ResumeExtraction
+    gemini_batch_job = models.ForeignKey(
+        GeminiBatchJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="items"
+    )
+    extraction = models.JSONField(blank=True, null=True)
+
+    # Timing
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tracker', 'index'], name='unique_upload_item_index'),
+        ]
+        indexes = [
+            models.Index(fields=['tracker', 'status']),
+        ]
+
+    @classmethod
+    def unfinished(cls):
+        """
+        Items that still need a worker: pending, or processing by a worker that timed out.
+        Items waiting for their Gemini batch job are not, the job's poll queues them once it finished.
+        """
+        return cls.objects.filter(
+            models.Q(status='pending')
+            | models.Q(status='processing', started_at__lt=timezone.now() - cls.CLAIM_TIMEOUT)
+        ).exclude(gemini_batch_job__state__in=GeminiBatchJob.ACTIVE_STATES)
+
+    @classmethod
+    def claim(cls, item_id) -> Optional[Self]:
+        """
+        Claim an unfinished item for this worker. Returns None if it is finished, or being processed by
+        another worker (its row is locked, or its claim has not timed out yet).
+        An item whose workers died MAX_ATTEMPTS times is failed instead, and returned with status 'failed'.
+        The row lock is only held for the claim, not while the file is processed.
+        """
+        items = cls.claim_many([item_id])
+        return items[0] if items else None
+
+    @classmethod
+    def claim_many(cls, item_ids) -> List[Self]:
+        """`claim` for the items of a chunk, with one locking query and one update. Returns the claimed items by index."""
+        with transaction.atomic():
+            # Only the items are locked, not the batch jobs joined by `unfinished`
+            items = list(cls.unfinished().select_for_update(skip_locked=True, of=('self',)).filter(pk__in=item_ids).order_by('index'))
+            now = timezone.now()
+            for item in items:
+                if item.attempts >= cls.MAX_ATTEMPTS:
+                    item.fail(f"Gave up after {item.attempts} attempts", save=False)
+                else:
+                    item.status = 'processing'
+                    item.attempts += 1
+                    item.error_message = None
+                    item.started_at = now
+                # bulk_update does not apply auto_now
+                item.modified_date = now
+            cls.objects.bulk_update(items, ['status', 'attempts', 'error_message', 'started_at', 'completed_at', 'modified_date'])
+            return items
+
+    def succeed(self, candidate, content_hash: str = None, deduplicated: bool = False, save: bool = True):
+        self.status = 'succeeded'
+        self.candidate = candidate
+        self.content_hash = content_hash or self.content_hash
+        self.deduplicated = deduplicated
+        self.completed_at = timezone.now()
+        if save:
+            self.save(update_fields=self.RESULT_FIELDS)
+
+    def fail(self, error_message: str, content_hash: str = None, save: bool = True):
+        self.status = 'failed'
+        self.error_message = error_message
+        self.content_hash = content_hash or self.content_hash
+        self.completed_at = timezone.now()
+        if save:
+            self.save(update_fields=self.RESULT_FIELDS)
+
+    @classmethod
+    def save_results(cls, items):
+        """Store the outcome of items finished with `save=False`, with one query"""
+        now = timezone.now()
+        for item in items:
+            item.modified_date = now
+        cls.objects.bulk_update(items, cls.RESULT_FIELDS)
+
+    @property
+    def duration_seconds(self):
+        if not self.started_at or not self.completed_at:
+            return None
+        return (self.completed_at - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"{self.tracker_id} #{self.index} {self.name} - {self.status}"
+
+class ProcessedSQSMessage(BaseModel):
+    """
+    Ledger of SQS messages handled by the consumer, used to skip redelivered and duplicate messages.
+    Entries expire; expired entries are ignored and purged.
+    """
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    # SQS MessageId for handlers deduplicating per message, payload hash for handlers deduplicating per payload
+    dedup_key = models.CharField(max_length=100, unique=True)
+    message_id = models.CharField(max_length=100, db_index=True)
+    payload_hash = models.CharField(max_length=64, db_index=True)
+    message_type = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    attempts = models.IntegerField(default=1)
+    error_message = models.TextField(blank=True, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.message_type} - {self.message_id} - {self.status}"
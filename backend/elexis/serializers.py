@@ -416,7 +416,7 @@ class ResumeUploadTrackerSerializer(serializers.ModelSerializer):
         model = ResumeUploadTracker
         fields = [
             'id', 'batch_job_id', 'upload_type', 'status', 
-            'total_files', 'processed_files', 'successful_files', 'failed_files',
+            'total_files', 'processed_files', 'successful_files', 'failed_files', 'deduplicated_files',
             'ai_processed_files', 'ai_successful_files', 'ai_failed_files',
             'error_message', 'processing_details', 'job_title', 'job_id',
             'started_at', 'completed_at', 'created_date', 'modified_date',
@@ -6,6 +6,7 @@ from typing import TypeVar, Generic
 from typing import Type
 import json
 import os
+from elexis.services.consumer_metrics import record_dependency_call
 dotenv.load_dotenv()
 
 T = TypeVar('T')
@@ -43,10 +44,36 @@ class QueryGemini:
                     response_schema=responseSchema,
                 ),
             )
-            return responseSchema.model_validate(json.loads(response.text)) 
+            result = responseSchema.model_validate(json.loads(response.text)) 
+            record_dependency_call('gemini', succeeded=True)
+            return result
             
         except Exception as e:
             print(f"Error in QueryGemini.query: {e}")
+            record_dependency_call('gemini', succeeded=False)
+            return ""  
+
+    async def aquery(self, prompt: str, logIdentifier: str, responseSchema: T) -> T :
+        """
+        Async version of `query`, for the asyncio consumer runtime.
+        """
+        try:
+
+            response = await self.client.aio.models.generate_content(
+                model=model, 
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=responseSchema,
+                ),
+            )
+            result = responseSchema.model_validate(json.loads(response.text)) 
+            record_dependency_call('gemini', succeeded=True)
+            return result
+            
+        except Exception as e:
+            print(f"Error in QueryGemini.aquery: {e}")
+            record_dependency_call('gemini', succeeded=False)
             return ""  
 GeminiClient = QueryGemini(api_key=os.environ.get('GEMINI_API_KEY'))
     
@@ -0,0 +1,89 @@
+"""
+Concurrency limits for external dependencies in the asyncio consumer runtime
+Every call to SQS, S3, Gemini, Pinecone or plain HTTP goes through the semaphore of its dependency,
+so hundreds of in-flight messages never turn into hundreds of concurrent requests against one service.
+boto3 and the Pinecone client have no async API; their calls run in the default executor, like the ORM.
+"""
+
+import asyncio
+import os
+import weakref
+from typing import Callable, Dict
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SQS = 'sqs'
+S3 = 's3'
+GEMINI = 'gemini'
+PINECONE = 'pinecone'
+HTTP = 'http'
+
+DEPENDENCY_LIMITS = {
+    SQS: int(os.getenv("ASYNC_SQS_CONCURRENCY", 50)),
+    S3: int(os.getenv("ASYNC_S3_CONCURRENCY", 32)),
+    GEMINI: int(os.getenv("ASYNC_GEMINI_CONCURRENCY", 16)),
+    PINECONE: int(os.getenv("ASYNC_PINECONE_CONCURRENCY", 16)),
+    HTTP: int(os.getenv("ASYNC_HTTP_CONCURRENCY", 32)),
+}
+
+# asyncio primitives belong to the loop they were created on
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def dependency_limit(dependency: str) -> asyncio.Semaphore:
+    """Semaphore bounding the concurrent calls to `dependency` on the running loop."""
+    semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if dependency not in semaphores:
+        semaphores[dependency] = asyncio.Semaphore(DEPENDENCY_LIMITS[dependency])
+    return semaphores[dependency]
+
+
+async def run_blocking(dependency: str, func: Callable, *args, **kwargs):
+    """
+    Run a blocking client call (boto3, Pinecone) on an executor thread, within the dependency's limit.
+    The call still holds a thread while it waits; the limit only keeps it from crowding out the others.
+    """
+    async with dependency_limit(dependency):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def _call_with_fresh_connection(func: Callable, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_orm(func: Callable, *args, **kwargs):
+    """
+    Run Django ORM code from a coroutine. Not thread sensitive: ORM calls of different messages run in
+    parallel on executor threads, each with its own connection, instead of queueing on one thread.
+    """
+    return await sync_to_async(_call_with_fresh_connection, thread_sensitive=False)(func, *args, **kwargs)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Connection pooled HTTP client shared by the coroutines of the running loop."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = _http_clients[loop] = httpx.AsyncClient(timeout=60, follow_redirects=True)
+    return client
+
+
+async def http_get(url: str) -> httpx.Response:
+    async with dependency_limit(HTTP):
+        return await get_http_client().get(url)
+
+
+async def close_http_client():
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
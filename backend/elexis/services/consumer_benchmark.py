@@ -0,0 +1,642 @@
+"""
+Offline consumer benchmark
+Feeds `process_message` from an in-memory queue against a seeded database, with S3, Gemini, Pinecone and
+SQS replaced by fakes of configurable latency. Messages published by the handlers go back on the queue,
+like they would through SQS. Reports throughput, p50/p95 latency per message type, DB queries and peak
+memory, so a consumer change can be compared against a saved baseline without any network access.
+"""
+
+import contextlib
+import io
+import json
+import os
+import queue
+import random
+import resource
+import threading
+import time
+import tracemalloc
+import types
+import typing
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from pydantic import BaseModel
+
+from elexis.models import Candidate, Job, JobMatchingResumeScore, Organization, Recruiter, ResumeUploadTracker
+
+DEFAULT_MIX = {
+    'job_resume_matching_score': 50,
+    'ai_job_resume_evaluation': 50,
+    'generate_embedding': 50,
+    'generate_candidate_suggestion': 10,
+    'rank-resumes': 10,
+    'process_bulk_resumes': 2,
+}
+BENCHMARK_MESSAGE_TYPES = tuple(DEFAULT_MIX)
+
+FAKE_BUCKET = 'benchmark-bucket'
+FAKE_PDF = b"%PDF-1.4\n% consumer benchmark resume\n%%EOF\n"
+FAKE_EMBEDDING_DIMENSION = 768
+FAKE_RESUME_TEXT = "\n".join(
+    ["Benchmark Candidate", "benchmark.candidate@benchmark.local", "+91 98765 43210"]
+    + [f"Experience {i}: built and operated Django services, SQS consumers and data pipelines." for i in range(40)]
+)
+
+# Queries of threads that are not handling a message (rank scheduler, embedding batcher, ...)
+BACKGROUND = 'background'
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """'ai_job_resume_evaluation=100,generate_embedding=50' -> {'ai_job_resume_evaluation': 100, ...}"""
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        message_type, _, count = item.partition('=')
+        if message_type not in BENCHMARK_MESSAGE_TYPES:
+            raise ValueError(f"Unsupported message type '{message_type}', expected one of {', '.join(BENCHMARK_MESSAGE_TYPES)}")
+        mix[message_type] = int(count or 1)
+    return mix
+
+
+@dataclass
+class FakeLatency:
+    """Simulated latency per dependency call, in seconds, +/- `jitter` (a fraction of the latency)"""
+    s3: float = 0.05
+    gemini: float = 1.0
+    embedding: float = 0.2
+    pinecone: float = 0.05
+    sqs: float = 0.02
+    jitter: float = 0.25
+
+    def sleep(self, dependency: str):
+        latency = getattr(self, dependency)
+        if latency > 0:
+            time.sleep(latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def asleep(self, dependency: str):
+        import asyncio
+        latency = getattr(self, dependency)
+        if latency > 0:
+            await asyncio.sleep(latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+def fake_instance(schema: typing.Type[BaseModel]) -> BaseModel:
+    """A valid instance of a pydantic response schema, like the one Gemini would return"""
+    return schema.model_validate({
+        name: _fake_value(name, model_field.annotation) for name, model_field in schema.model_fields.items()
+    })
+
+
+def _fake_value(name: str, annotation):
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+        origin = typing.get_origin(annotation)
+    if origin is list:
+        return [_fake_value(name, typing.get_args(annotation)[0])]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_instance(annotation)
+    if annotation is bool:
+        return True
+    if annotation in (int, float):
+        return annotation(random.randint(40, 95))
+    if 'email' in name.lower():
+        return f"candidate-{uuid.uuid4().hex[:12]}@benchmark.local"
+    if 'phone' in name.lower():
+        return "9876543210"
+    if name == 'raw_text':
+        return FAKE_RESUME_TEXT
+    return f"benchmark {name}"
+
+
+class DependencyCalls:
+    """Thread safe call counter per faked dependency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def record(self, dependency: str, count: int = 1):
+        with self._lock:
+            self.calls[dependency] += count
+
+
+class _FakeBody:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class FakeS3Client:
+    def __init__(self, latency: FakeLatency, calls: DependencyCalls):
+        self.latency = latency
+        self.calls = calls
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.calls.record('s3')
+        self.latency.sleep('s3')
+        return {'Body': _FakeBody(FAKE_PDF), 'ContentLength': len(FAKE_PDF)}
+
+    def put_object(self, Bucket, Key, Body=None, **kwargs):
+        self.calls.record('s3')
+        self.latency.sleep('s3')
+        return {'ETag': uuid.uuid4().hex}
+
+
+class FakeSQSClient:
+    """send_message_batch puts the bodies on the benchmark queue instead of sending them to SQS"""
+
+    def __init__(self, latency: FakeLatency, calls: DependencyCalls, on_message):
+        self.latency = latency
+        self.calls = calls
+        self.on_message = on_message
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.record('sqs')
+        self.latency.sleep('sqs')
+        for entry in Entries:
+            self.on_message(entry['MessageBody'])
+        return {'Successful': [{'Id': entry['Id'], 'MessageId': str(uuid.uuid4())} for entry in Entries]}
+
+
+class FakeGenerativeModel:
+    """Stands in for google.generativeai.GenerativeModel; every answer is the fake resume text"""
+
+    latency: FakeLatency = FakeLatency()
+    calls: DependencyCalls = DependencyCalls()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, *args, **kwargs):
+        self.calls.record('gemini')
+        self.latency.sleep('gemini')
+        return types.SimpleNamespace(text=FAKE_RESUME_TEXT)
+
+    async def generate_content_async(self, *args, **kwargs):
+        self.calls.record('gemini')
+        await self.latency.asleep('gemini')
+        return types.SimpleNamespace(text=FAKE_RESUME_TEXT)
+
+
+class FakeEmbeddingClient:
+    """Stands in for the google.genai client of the embedding service"""
+
+    def __init__(self, latency: FakeLatency, calls: DependencyCalls):
+        self.latency = latency
+        self.calls = calls
+        self.models = self
+
+    def embed_content(self, model, contents, **kwargs):
+        self.calls.record('embedding')
+        self.latency.sleep('embedding')
+        contents = contents if isinstance(contents, list) else [contents]
+        return types.SimpleNamespace(embeddings=[
+            types.SimpleNamespace(values=np.random.rand(FAKE_EMBEDDING_DIMENSION).tolist()) for _ in contents
+        ])
+
+
+class FakePineconeIndex:
+    def __init__(self, latency: FakeLatency, calls: DependencyCalls):
+        self.latency = latency
+        self.calls = calls
+
+    def upsert(self, vectors, namespace=None):
+        self.calls.record('pinecone')
+        self.latency.sleep('pinecone')
+        return types.SimpleNamespace(upserted_count=len(vectors))
+
+    def fetch(self, ids, namespace=None):
+        self.calls.record('pinecone')
+        self.latency.sleep('pinecone')
+        return types.SimpleNamespace(vectors={
+            vector_id: types.SimpleNamespace(values=np.random.rand(FAKE_EMBEDDING_DIMENSION).tolist()) for vector_id in ids
+        })
+
+    def query(self, namespace=None, vector=None, top_k=5, include_metadata=False, filter=None):
+        self.calls.record('pinecone')
+        self.latency.sleep('pinecone')
+        ids = (filter or {}).get('resume_id', {}).get('$in', [])[:1] or [f"resume-{uuid.uuid4()}"]
+        return types.SimpleNamespace(matches=[
+            types.SimpleNamespace(id=vector_id, score=random.random(), metadata={}) for vector_id in ids[:top_k]
+        ])
+
+
+class FakePinecone:
+    """Stands in for pinecone.Pinecone while the Pinecone client singleton is created"""
+
+    def __init__(self, index: FakePineconeIndex, **kwargs):
+        self.index = index
+
+    def list_indexes(self):
+        return types.SimpleNamespace(names=lambda: [settings.PINECONE_INDEX_NAME])
+
+    def Index(self, name):
+        return self.index
+
+
+class QueryCounter:
+    """Counts the queries of every connection, attributed to the message type its thread is handling"""
+
+    def __init__(self):
+        self.queries = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def message_type(self) -> str:
+        return getattr(self._local, 'message_type', BACKGROUND)
+
+    @message_type.setter
+    def message_type(self, value: str):
+        self._local.message_type = value
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.queries[self.message_type] += 1
+        return execute(sql, params, many, context)
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    @contextlib.contextmanager
+    def installed(self):
+        connection_created.connect(self._on_connection_created)
+        connection.execute_wrappers.append(self)
+        try:
+            yield self
+        finally:
+            connection_created.disconnect(self._on_connection_created)
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def seed_messages(mix: Dict[str, int], jobs: int = 5, bulk_files: int = 10, rng: random.Random = None) -> List[str]:
+    """
+    Create the rows every message of the mix refers to and return the message bodies, shuffled.
+    Each message gets its own candidate, so no two messages of a type work on the same rows.
+    """
+    rng = rng or random.Random()
+    organization = Organization.objects.create(org_name="Benchmark")
+    recruiter = Recruiter.objects.create_user(
+        email=f"recruiter-{uuid.uuid4().hex[:12]}@benchmark.local",
+        organization=organization,
+        name="Benchmark Recruiter",
+    )
+    seeded_jobs = [
+        Job.objects.create(
+            recruiter=recruiter,
+            organization=organization,
+            job_name=f"Benchmark job {i}",
+            job_description="Backend engineer: Python, Django, PostgreSQL, SQS, Pinecone and Gemini. " * 20,
+            job_description_embedding_id=f"jd-{uuid.uuid4()}",
+        )
+        for i in range(max(1, jobs))
+    ]
+
+    def seed_candidates(count: int, embedded: bool, with_score: bool):
+        candidates = []
+        for i in range(count):
+            candidate = Candidate(
+                recruiter=recruiter,
+                organization=organization,
+                name=f"Benchmark Candidate {i}",
+                email=f"candidate-{uuid.uuid4().hex[:12]}@benchmark.local",
+                resume=f"resumes/benchmark-{uuid.uuid4().hex}.pdf",
+            )
+            if embedded:
+                candidate.resume_embedding_id = f"resume-{candidate.id}"
+            candidates.append(candidate)
+        Candidate.objects.bulk_create(candidates)
+        scores = []
+        if with_score:
+            scores = JobMatchingResumeScore.objects.bulk_create([
+                JobMatchingResumeScore(job=seeded_jobs[i % len(seeded_jobs)], candidate=candidate, organization=organization)
+                for i, candidate in enumerate(candidates)
+            ])
+        return candidates, scores
+
+    def body(message_type: str, data: dict) -> str:
+        return json.dumps({'type': message_type, 'data': data})
+
+    bodies = []
+    if mix.get('job_resume_matching_score'):
+        _, scores = seed_candidates(mix['job_resume_matching_score'], embedded=True, with_score=True)
+        bodies += [body('job_resume_matching_score', {"id": str(score.id)}) for score in scores]
+    if mix.get('ai_job_resume_evaluation'):
+        _, scores = seed_candidates(mix['ai_job_resume_evaluation'], embedded=True, with_score=True)
+        bodies += [body('ai_job_resume_evaluation', {"id": str(score.id)}) for score in scores]
+    if mix.get('generate_embedding'):
+        candidates, _ = seed_candidates(mix['generate_embedding'], embedded=False, with_score=True)
+        bodies += [body('generate_embedding', {
+            "candidate_id": str(candidate.id),
+            "organization_namespace": f"{organization.org_name}_{organization.id}",
+        }) for candidate in candidates]
+    if mix.get('generate_candidate_suggestion'):
+        candidates, _ = seed_candidates(mix['generate_candidate_suggestion'], embedded=True, with_score=False)
+        bodies += [body('generate_candidate_suggestion', {
+            "jobId": str(seeded_jobs[i % len(seeded_jobs)].id),
+            "candidateId": str(candidate.id),
+        }) for i, candidate in enumerate(candidates)]
+    for i in range(mix.get('rank-resumes', 0)):
+        bodies.append(body('rank-resumes', {"jobId": str(seeded_jobs[i % len(seeded_jobs)].id)}))
+    for i in range(mix.get('process_bulk_resumes', 0)):
+        job = seeded_jobs[i % len(seeded_jobs)]
+        tracker = ResumeUploadTracker.objects.create(
+            organization=organization,
+            upload_type='bulk',
+            job=job,
+            total_files=bulk_files,
+            processing_details={'files': [{
+                'name': f"benchmark_resume_{n}.pdf",
+                's3_bucket': FAKE_BUCKET,
+                's3_key': f"bulk/{uuid.uuid4().hex}.pdf",
+                'content_type': 'application/pdf',
+            } for n in range(bulk_files)]},
+        )
+        bodies.append(body('process_bulk_resumes', {
+            "batch_job_id": str(tracker.batch_job_id),
+            "organization_id": str(organization.id),
+            "user_id": str(recruiter.id),
+            "job_id": str(job.id),
+            "file_count": bulk_files,
+        }))
+    rng.shuffle(bodies)
+    return bodies
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)) * 1000, 1) if values else 0.0
+
+
+class ConsumerBenchmark:
+    """
+    Runs the message mix through `process_message` on `workers` threads until the queue is drained
+    and every follow-up message published by the handlers was handled as well.
+    """
+
+    def __init__(self, mix: Dict[str, int], workers: int = 8, latency: FakeLatency = None, jobs: int = 5,
+                 bulk_files: int = 10, follow_ups: bool = True, trace_memory: bool = False, verbose: bool = False,
+                 seed: int = 0):
+        self.mix = mix
+        self.workers = max(1, workers)
+        self.latency = latency or FakeLatency()
+        self.jobs = jobs
+        self.bulk_files = bulk_files
+        self.follow_ups = follow_ups
+        self.trace_memory = trace_memory
+        self.verbose = verbose
+        self.seed = seed
+        self.calls = DependencyCalls()
+        self.query_counter = QueryCounter()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._durations: Dict[str, List[float]] = {}
+        self._durations_lock = threading.Lock()
+        self._pending_sends = 0
+        self._pending_lock = threading.Lock()
+
+    def _on_message_published(self, body: str):
+        if self.follow_ups:
+            self._queue.put(body)
+        else:
+            self.calls.record('sqs_dropped')
+
+    @contextlib.contextmanager
+    def _fake_dependencies(self):
+        """Swap every external dependency of the consumer for its fake, for the duration of the run"""
+        FakeGenerativeModel.latency = self.latency
+        FakeGenerativeModel.calls = self.calls
+        index = FakePineconeIndex(self.latency, self.calls)
+        s3_client = FakeS3Client(self.latency, self.calls)
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(override_settings(
+                PINECONE_API_KEY=settings.PINECONE_API_KEY or 'benchmark',
+                PINECONE_ENVIRONMENT=settings.PINECONE_ENVIRONMENT or 'benchmark',
+                PINECONE_INDEX_NAME=settings.PINECONE_INDEX_NAME or 'benchmark',
+                STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}},
+            ))
+            stack.enter_context(mock.patch.dict('os.environ', {
+                key: value for key, value in {
+                    'GEMINI_API_KEY': 'benchmark',
+                    'SQS_QUEUE_URL': 'https://sqs.benchmark.local/queue',
+                }.items() if not os.getenv(key)
+            }))
+            stack.enter_context(mock.patch('pinecone.Pinecone', lambda **kwargs: FakePinecone(index, **kwargs)))
+
+            # Imported here: importing the consumer creates the Gemini, Pinecone and S3 clients
+            import elexis.sqs_consumer as sqs_consumer
+            from elexis.services import gemini_embedding_service
+            from elexis.services.pinecone_service import pinecone_client
+            from elexis.services.QueryGemini import GeminiClient
+            from elexis.services.sqs_producer import sqs_producer
+            from elexis.utils import get_file_data_from_s3
+
+            def fake_query(prompt, logIdentifier, responseSchema):
+                self.calls.record('gemini')
+                self.latency.sleep('gemini')
+                return fake_instance(responseSchema)
+
+            async def fake_aquery(prompt, logIdentifier, responseSchema):
+                self.calls.record('gemini')
+                await self.latency.asleep('gemini')
+                return fake_instance(responseSchema)
+
+            def fake_http_get(url, *args, **kwargs):
+                self.calls.record('http')
+                self.latency.sleep('s3')
+                return types.SimpleNamespace(status_code=200, content=FAKE_PDF)
+
+            original_enqueue = sqs_producer._enqueue
+
+            def tracked_enqueue(pending):
+                # Counted until SQS (the fake) accepted the message, so the run does not end in between
+                with self._pending_lock:
+                    self._pending_sends += 1
+                pending.future.add_done_callback(lambda _: self._finish_send())
+                original_enqueue(pending)
+
+            stack.enter_context(mock.patch.object(pinecone_client, 'index', index))
+            stack.enter_context(mock.patch.object(GeminiClient, 'query', fake_query))
+            stack.enter_context(mock.patch.object(GeminiClient, 'aquery', fake_aquery))
+            stack.enter_context(mock.patch('google.generativeai.GenerativeModel', FakeGenerativeModel))
+            stack.enter_context(mock.patch.object(gemini_embedding_service, 'client', FakeEmbeddingClient(self.latency, self.calls)))
+            stack.enter_context(mock.patch.object(get_file_data_from_s3, 's3', s3_client))
+            stack.enter_context(mock.patch('boto3.client', lambda service, *args, **kwargs: s3_client))
+            stack.enter_context(mock.patch('requests.get', fake_http_get))
+            stack.enter_context(mock.patch.object(
+                sqs_producer, '_client', FakeSQSClient(self.latency, self.calls, self._on_message_published)
+            ))
+            stack.enter_context(mock.patch.object(sqs_producer, '_enqueue', tracked_enqueue))
+            yield sqs_consumer, sqs_producer
+
+    def _finish_send(self):
+        with self._pending_lock:
+            self._pending_sends -= 1
+
+    def _work(self, process_message, get_message_type):
+        try:
+            while True:
+                body = self._queue.get()
+                if body is None:
+                    self._queue.task_done()
+                    return
+                try:
+                    message_type = get_message_type(json.loads(body)) or 'unknown'
+                except ValueError:
+                    message_type = 'invalid'
+                self.query_counter.message_type = message_type
+                started_at = time.perf_counter()
+                try:
+                    process_message(body)
+                finally:
+                    duration = time.perf_counter() - started_at
+                    self.query_counter.message_type = BACKGROUND
+                    with self._durations_lock:
+                        self._durations.setdefault(message_type, []).append(duration)
+                    close_old_connections()
+                    self._queue.task_done()
+        finally:
+            connection.close()
+
+    def _drain(self, sqs_producer):
+        """Wait until no message is queued, being handled or buffered in the producer"""
+        while True:
+            self._queue.join()
+            sqs_producer.flush()
+            with self._pending_lock:
+                idle = self._pending_sends == 0
+            if idle and self._queue.unfinished_tasks == 0:
+                return
+            time.sleep(0.05)
+
+    def run(self) -> dict:
+        from elexis.services.sqs_handler_registry import get_message_type
+
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        with self._fake_dependencies() as (sqs_consumer, sqs_producer), self.query_counter.installed():
+            self.query_counter.message_type = 'seed'
+            bodies = seed_messages(self.mix, jobs=self.jobs, bulk_files=self.bulk_files, rng=random.Random(self.seed))
+            self.query_counter.message_type = BACKGROUND
+            seed_queries = self.query_counter.queries.pop('seed', 0)
+
+            if self.trace_memory:
+                tracemalloc.start()
+            threads = [
+                threading.Thread(target=self._work, args=(sqs_consumer.process_message, get_message_type),
+                                 name=f"benchmark-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            with output:
+                started_at = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for body in bodies:
+                    self._queue.put(body)
+                self._drain(sqs_producer)
+                duration = time.perf_counter() - started_at
+                for _ in threads:
+                    self._queue.put(None)
+                for thread in threads:
+                    thread.join()
+            traced_peak = None
+            if self.trace_memory:
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        handled = sum(len(durations) for durations in self._durations.values())
+        queries = dict(self.query_counter.queries)
+        report = {
+            'config': {
+                'mix': self.mix,
+                'workers': self.workers,
+                'jobs': self.jobs,
+                'bulk_files': self.bulk_files,
+                'follow_ups': self.follow_ups,
+                'seed': self.seed,
+                'latency_seconds': asdict(self.latency),
+                'database': connection.vendor,
+            },
+            'seeded_messages': len(bodies),
+            'handled_messages': handled,
+            'duration_seconds': round(duration, 3),
+            'throughput_per_second': round(handled / duration, 2) if duration else 0.0,
+            'types': {
+                message_type: {
+                    'count': len(durations),
+                    'p50_ms': _percentile(durations, 50),
+                    'p95_ms': _percentile(durations, 95),
+                    'max_ms': round(max(durations) * 1000, 1),
+                    'db_queries': queries.get(message_type, 0),
+                    'db_queries_per_message': round(queries.get(message_type, 0) / len(durations), 1),
+                }
+                for message_type, durations in sorted(self._durations.items())
+            },
+            'db_queries': {
+                'total': sum(queries.values()),
+                'background': queries.get(BACKGROUND, 0),
+                'seed': seed_queries,
+            },
+            'dependency_calls': dict(self.calls.calls),
+            # ru_maxrss is in KB on Linux
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'peak_traced_memory_mb': round(traced_peak / 1024 / 1024, 1) if traced_peak is not None else None,
+        }
+        return report
+
+
+def _delta(value, baseline_value) -> str:
+    if not baseline_value:
+        return ""
+    return f" ({(value - baseline_value) / baseline_value * 100:+.1f}%)"
+
+
+def format_report(report: dict, baseline: dict = None) -> str:
+    """Human readable report; with a baseline, every figure is followed by its change against it"""
+    baseline = baseline or {}
+    baseline_types = baseline.get('types', {})
+    lines = [
+        f"Handled {report['handled_messages']} messages ({report['seeded_messages']} seeded) "
+        f"in {report['duration_seconds']}s with {report['config']['workers']} workers on {report['config']['database']}",
+        f"Throughput: {report['throughput_per_second']} msg/s"
+        + _delta(report['throughput_per_second'], baseline.get('throughput_per_second')),
+        "",
+        f"{'message type':<32}{'count':>7}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}{'queries/msg':>13}",
+    ]
+    for message_type, stats in report['types'].items():
+        base = baseline_types.get(message_type, {})
+        lines.append(
+            f"{message_type:<32}{stats['count']:>7}{stats['p50_ms']:>12}{stats['p95_ms']:>12}"
+            f"{stats['max_ms']:>12}{stats['db_queries_per_message']:>13}"
+        )
+        if base:
+            lines.append(
+                f"{'  vs baseline':<32}{'':>7}{_delta(stats['p50_ms'], base.get('p50_ms')):>12}"
+                f"{_delta(stats['p95_ms'], base.get('p95_ms')):>12}{_delta(stats['max_ms'], base.get('max_ms')):>12}"
+                f"{_delta(stats['db_queries_per_message'], base.get('db_queries_per_message')):>13}"
+            )
+    db_queries = report['db_queries']
+    lines += [
+        "",
+        f"DB queries: {db_queries['total']} ({db_queries['background']} in background threads)"
+        + _delta(db_queries['total'], baseline.get('db_queries', {}).get('total')),
+        "Dependency calls: " + ", ".join(f"{name}={count}" for name, count in sorted(report['dependency_calls'].items())),
+        f"Peak RSS: {report['peak_rss_mb']} MB" + _delta(report['peak_rss_mb'], baseline.get('peak_rss_mb')),
+    ]
+    if report['peak_traced_memory_mb'] is not None:
+        lines.append(f"Peak traced Python memory: {report['peak_traced_memory_mb']} MB"
+                     + _delta(report['peak_traced_memory_mb'], baseline.get('peak_traced_memory_mb')))
+    return "\n".join(lines)
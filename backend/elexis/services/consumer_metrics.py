@@ -0,0 +1,323 @@
+"""
+Consumer metrics
+In-process counters, gauges and histograms of the consumer runtimes: messages received, succeeded,
+failed, retried and skipped per message type, handler duration, message age at dequeue, queue depth
+and lag. They are served as Prometheus text on SQS_METRICS_PORT and/or dumped as JSON every
+SQS_METRICS_DUMP_INTERVAL_SECONDS; queue depth and lag are the signals to scale consumer capacity on.
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Port of the /metrics endpoint of a consumer (0 disables it). In process mode child i serves on port + i.
+METRICS_PORT = int(os.getenv("SQS_METRICS_PORT", 0))
+# Interval of the JSON dump (0 disables it), to SQS_METRICS_DUMP_PATH or stdout. The path may contain {name}.
+METRICS_DUMP_INTERVAL_SECONDS = float(os.getenv("SQS_METRICS_DUMP_INTERVAL_SECONDS", 0))
+METRICS_DUMP_PATH = os.getenv("SQS_METRICS_DUMP_PATH")
+# How often the watchdog reads the approximate queue depths from SQS
+QUEUE_DEPTH_INTERVAL_SECONDS = float(os.getenv("SQS_METRICS_QUEUE_DEPTH_INTERVAL_SECONDS", 30))
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+AGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600)
+
+# SQS message attributes needed for the age and redelivery metrics
+RECEIVE_ATTRIBUTE_NAMES = ['SentTimestamp', 'ApproximateReceiveCount']
+QUEUE_DEPTH_ATTRIBUTES = {
+    'ApproximateNumberOfMessages': 'visible',
+    'ApproximateNumberOfMessagesNotVisible': 'in_flight',
+    'ApproximateNumberOfMessagesDelayed': 'delayed',
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _items(self):
+        with self._lock:
+            return [(dict(zip(self.label_names, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [(self.name, labels, value) for labels, value in self._items()]
+
+    def snapshot(self):
+        return [{'labels': labels, 'value': value} for labels, value in self._items()]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def _copied_items(self):
+        with self._lock:
+            return [
+                (dict(zip(self.label_names, key)), {'counts': list(state['counts']), 'sum': state['sum'], 'count': state['count']})
+                for key, state in self._values.items()
+            ]
+
+    def samples(self):
+        samples = []
+        for labels, state in self._copied_items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, 'le': f"{bound:g}"}, cumulative))
+            samples.append((f"{self.name}_bucket", {**labels, 'le': '+Inf'}, state['count']))
+            samples.append((f"{self.name}_sum", labels, state['sum']))
+            samples.append((f"{self.name}_count", labels, state['count']))
+        return samples
+
+    def snapshot(self):
+        snapshot = []
+        for labels, state in self._copied_items():
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                buckets[f"{bound:g}"] = cumulative
+            snapshot.append({'labels': labels, 'count': state['count'], 'sum': round(state['sum'], 6), 'buckets': buckets})
+        return snapshot
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            'timestamp': time.time(),
+            'metrics': {
+                metric.name: {'type': metric.type, 'help': metric.documentation, 'values': metric.snapshot()}
+                for metric in list(self._metrics.values())
+            },
+        }
+
+
+metrics = MetricsRegistry()
+
+MESSAGES_RECEIVED = metrics.counter(
+    'sqs_messages_received_total', "Messages received from SQS", ['message_type', 'priority'])
+MESSAGES_SUCCEEDED = metrics.counter(
+    'sqs_messages_succeeded_total', "Messages whose handler completed", ['message_type'])
+MESSAGES_FAILED = metrics.counter(
+    'sqs_messages_failed_total', "Messages whose handler failed after its retries", ['message_type'])
+MESSAGES_RETRIED = metrics.counter(
+    'sqs_messages_retried_total', "Handler attempts re-run by the retry policy", ['message_type'])
+MESSAGES_REDELIVERED = metrics.counter(
+    'sqs_messages_redelivered_total', "Messages received more than once from SQS", ['message_type'])
+MESSAGES_SKIPPED = metrics.counter(
+    'sqs_messages_skipped_total', "Messages not handled: duplicate, in_progress elsewhere or lane_full", ['message_type', 'reason'])
+HANDLER_TIMEOUTS = metrics.counter(
+    'sqs_handler_timeouts_total', "Handlers that exceeded their timeout", ['message_type'])
+HANDLER_DURATION = metrics.histogram(
+    'sqs_handler_duration_seconds', "Handler run time, retries included", ['message_type'], DURATION_BUCKETS)
+MESSAGE_AGE = metrics.histogram(
+    'sqs_message_age_seconds', "Time between sending and dequeuing a message", ['message_type', 'priority'], AGE_BUCKETS)
+MESSAGES_IN_FLIGHT = metrics.gauge(
+    'sqs_messages_in_flight', "Messages held by this consumer (queued in a lane or running)", ['message_type'])
+CONSUMER_CAPACITY = metrics.gauge(
+    'sqs_consumer_capacity', "Messages this consumer handles at once per queue", ['priority'])
+QUEUE_DEPTH = metrics.gauge(
+    'sqs_queue_depth', "Approximate number of messages in the queue", ['priority', 'state'])
+QUEUE_LAG = metrics.gauge(
+    'sqs_queue_lag_seconds', "Age of the oldest message of the latest receive, 0 when the queue was empty", ['priority'])
+DEPENDENCY_CALLS = metrics.counter(
+    'external_calls_total', "Calls to external services by outcome", ['dependency', 'outcome'])
+
+
+def _message_age(message: dict, now: float) -> float:
+    sent_timestamp = message.get('Attributes', {}).get('SentTimestamp')
+    return max(0.0, now - int(sent_timestamp) / 1000) if sent_timestamp else None
+
+
+def record_receive(priority: str, messages: List[dict]):
+    """Lag of a queue after a receive: the age of the oldest message it returned"""
+    now = time.time()
+    ages = [age for age in (_message_age(message, now) for message in messages) if age is not None]
+    QUEUE_LAG.set(max(ages, default=0.0), priority=priority)
+
+
+def record_dequeue(message_type: str, priority: str, message: dict):
+    MESSAGES_RECEIVED.inc(message_type=message_type, priority=priority)
+    age = _message_age(message, time.time())
+    if age is not None:
+        MESSAGE_AGE.observe(age, message_type=message_type, priority=priority)
+    if int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1)) > 1:
+        MESSAGES_REDELIVERED.inc(message_type=message_type)
+
+
+def record_handled(message_type: str, duration_seconds: float, succeeded: bool):
+    HANDLER_DURATION.observe(duration_seconds, message_type=message_type)
+    (MESSAGES_SUCCEEDED if succeeded else MESSAGES_FAILED).inc(message_type=message_type)
+
+
+def record_dependency_call(dependency: str, succeeded: bool):
+    DEPENDENCY_CALLS.inc(dependency=dependency, outcome='success' if succeeded else 'error')
+
+
+def update_queue_depths(sqs_client, queues):
+    """Read the approximate depth of every queue into the sqs_queue_depth gauge"""
+    for queue in queues:
+        try:
+            response = sqs_client.get_queue_attributes(QueueUrl=queue.url, AttributeNames=list(QUEUE_DEPTH_ATTRIBUTES))
+        except Exception as e:
+            print(f"SQS Consumer metrics ::: Could not read the depth of the {queue.priority} queue: {e}")
+            continue
+        for attribute, state in QUEUE_DEPTH_ATTRIBUTES.items():
+            QUEUE_DEPTH.set(int(response['Attributes'].get(attribute, 0)), priority=queue.priority, state=state)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body, content_type = json.dumps(metrics.snapshot()).encode('utf-8'), 'application/json'
+        elif self.path.startswith('/metrics'):
+            body, content_type = metrics.render_prometheus().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, name: str = "sqs-consumer"):
+    """Serve /metrics (Prometheus text) and /metrics.json on a daemon thread. Returns None if the port is taken."""
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsRequestHandler)
+    except OSError as e:
+        print(f"{name} ::: Could not serve metrics on port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"{name}-metrics", daemon=True).start()
+    print(f"{name} ::: serving metrics on :{port}/metrics")
+    return server
+
+
+def dump_metrics(path: str = None, name: str = "sqs-consumer"):
+    snapshot = json.dumps({'consumer': name, **metrics.snapshot()})
+    if not path:
+        print(f"{name} ::: metrics {snapshot}")
+        return
+    # Write and rename, so readers never see a partial file
+    path = path.format(name=name)
+    with open(f"{path}.tmp", 'w') as dump_file:
+        dump_file.write(snapshot)
+    os.replace(f"{path}.tmp", path)
+
+
+def _dump_periodically(interval_seconds: float, path: str, name: str):
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            dump_metrics(path, name)
+        except Exception as e:
+            print(f"{name} ::: Error dumping metrics: {e}")
+
+
+def start_metrics_exporters(name: str = "sqs-consumer", port: int = None):
+    """Start the exporters enabled in the environment; `port` overrides SQS_METRICS_PORT."""
+    port = METRICS_PORT if port is None else port
+    if port:
+        start_metrics_server(port, name)
+    if METRICS_DUMP_INTERVAL_SECONDS > 0:
+        threading.Thread(target=_dump_periodically, args=(METRICS_DUMP_INTERVAL_SECONDS, METRICS_DUMP_PATH, name),
+                         name=f"{name}-metrics-dump", daemon=True).start()
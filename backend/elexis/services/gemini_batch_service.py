@@ -1,21 +1,136 @@
 """
 Gemini Batch API Service for handling large-scale resume processing
 Updated to use the latest Gemini Batch API (November 2024)
+Jobs are submitted and polled without waiting; the bulk upload consumer drives them with scheduled
+messages (see gemini_batch_submit and gemini_batch_poll in elexis.sqs_consumer).
 """
 
+import base64
+import hashlib
+import math
 import os
 import json
 import time
+from datetime import timedelta
 from typing import List, Dict, Optional, Union
 from dataclasses import dataclass
 import google.genai as genai
 from google.genai import types
 import tempfile
 import uuid
+from django.db import transaction
+from django.utils import timezone
 from dotenv import load_dotenv
 
+from elexis.models import GeminiBatchSizing
+
 load_dotenv()
 
+# Resumes per batch job: where a new API key starts, and the range the sizer keeps it in. The upper
+# bound keeps the JSONL input (PDFs inline) well below the 2 GB file limit.
+GEMINI_BATCH_JOB_SIZE = int(os.getenv("GEMINI_BATCH_JOB_SIZE", 200))
+GEMINI_BATCH_MIN_JOB_SIZE = int(os.getenv("GEMINI_BATCH_MIN_JOB_SIZE", 10))
+GEMINI_BATCH_MAX_JOB_SIZE = int(os.getenv("GEMINI_BATCH_MAX_JOB_SIZE", 1000))
+# Jobs taking longer than this do not make the batches grow
+GEMINI_BATCH_TARGET_LATENCY_SECONDS = int(os.getenv("GEMINI_BATCH_TARGET_LATENCY_SECONDS", 4 * 3600))
+# No growth for this long after a quota error
+GEMINI_BATCH_QUOTA_COOLDOWN = timedelta(hours=1)
+# Weight of the latest job in the moving averages
+SIZING_SMOOTHING = 0.3
+
+# States after which a batch job does not change anymore
+FINISHED_JOB_STATES = (
+    "JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED",
+)
+
+RESUME_EXTRACTION_PROMPT = """
+Extract the following information from this PDF resume and return a JSON object:
+- name: Full name of the person
+- email: Email address
+- phone: Phone number (digits only, no spaces or symbols)
+- text: All the text content of the resume, as plain text without formatting
+
+Return only valid JSON in the exact format: {"name": "...", "email": "...", "phone": "...", "text": "..."}
+If any field is not found, use null.
+"""
+
+class GeminiBatchQuotaError(Exception):
+    """A batch job was refused because of the API key's quota (429 / RESOURCE_EXHAUSTED)"""
+
+
+def is_quota_error(error: BaseException) -> bool:
+    return getattr(error, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(error)
+
+
+class AdaptiveBatchSizer:
+    """
+    Resumes per batch job for one API key, learned from its jobs and persisted (GeminiBatchSizing), so every
+    consumer process shares it. Healthy jobs grow the batches by half up to GEMINI_BATCH_MAX_JOB_SIZE;
+    a quota error halves them, and failed, slow or mostly failing jobs shrink them.
+    """
+
+    def __init__(self, api_key: str):
+        self.api_key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+    def _state(self, for_update: bool = False) -> GeminiBatchSizing:
+        sizings = GeminiBatchSizing.objects.select_for_update() if for_update else GeminiBatchSizing.objects
+        sizing, _ = sizings.get_or_create(api_key_hash=self.api_key_hash, defaults={"batch_size": GEMINI_BATCH_JOB_SIZE})
+        return sizing
+
+    @staticmethod
+    def _bounded(batch_size: float) -> int:
+        return max(GEMINI_BATCH_MIN_JOB_SIZE, min(GEMINI_BATCH_MAX_JOB_SIZE, int(batch_size)))
+
+    def batch_size(self) -> int:
+        return self._bounded(self._state().batch_size)
+
+    def plan(self, total: int) -> int:
+        """Size of the jobs for `total` resumes: as few jobs as the batch size allows, evenly filled"""
+        if total <= 0:
+            return 0
+        jobs = math.ceil(total / self.batch_size())
+        return math.ceil(total / jobs)
+
+    def record_quota_error(self) -> int:
+        with transaction.atomic():
+            sizing = self._state(for_update=True)
+            sizing.quota_errors += 1
+            sizing.last_quota_error_at = timezone.now()
+            sizing.batch_size = self._bounded(sizing.batch_size / 2)
+            sizing.save(update_fields=['quota_errors', 'last_quota_error_at', 'batch_size', 'modified_date'])
+        print(f"Gemini batch sizing ::: quota error, {sizing.batch_size} resumes per job")
+        return sizing.batch_size
+
+    def record_job(self, request_count: int, succeeded: int, latency_seconds: float, failed: bool = False) -> int:
+        """Learn from a finished job: `succeeded` of its `request_count` requests returned a result"""
+        success = 0.0 if failed or not request_count else succeeded / request_count
+        with transaction.atomic():
+            sizing = self._state(for_update=True)
+            sizing.jobs += 1
+            sizing.success_rate += SIZING_SMOOTHING * (success - sizing.success_rate)
+            if sizing.latency_seconds is None:
+                sizing.latency_seconds = latency_seconds
+            else:
+                sizing.latency_seconds += SIZING_SMOOTHING * (latency_seconds - sizing.latency_seconds)
+
+            recent_quota_error = (
+                sizing.last_quota_error_at is not None
+                and timezone.now() - sizing.last_quota_error_at < GEMINI_BATCH_QUOTA_COOLDOWN
+            )
+            if failed or sizing.success_rate < 0.8 or sizing.latency_seconds > 2 * GEMINI_BATCH_TARGET_LATENCY_SECONDS:
+                sizing.batch_size = self._bounded(sizing.batch_size * 0.75)
+            elif (
+                sizing.success_rate >= 0.95 and sizing.latency_seconds <= GEMINI_BATCH_TARGET_LATENCY_SECONDS
+                and not recent_quota_error and request_count >= sizing.batch_size
+            ):
+                # Only full jobs tell that a larger one would be fine
+                sizing.batch_size = self._bounded(math.ceil(sizing.batch_size * 1.5))
+            sizing.save(update_fields=['jobs', 'success_rate', 'latency_seconds', 'batch_size', 'modified_date'])
+        print(f"Gemini batch sizing ::: success rate {sizing.success_rate:.2f}, latency {sizing.latency_seconds:.0f}s, "
+              f"{sizing.batch_size} resumes per job")
+        return sizing.batch_size
+
+
 @dataclass
 class BatchRequest:
     """Single batch request item"""
@@ -45,25 +160,17 @@ class GeminiBatchService:
         
         # Use the new genai.Client
         self.client = genai.Client(api_key=self.api_key)
-        self.max_batch_size = 50  # Maximum batch size
+        self.sizer = AdaptiveBatchSizer(self.api_key)
+        self.max_batch_size = GEMINI_BATCH_MAX_JOB_SIZE  # Maximum batch size
         self.model = "models/gemini-2.5-flash"  # Updated model
         self.retry_attempts = 3
         self.retry_delay = 30  # seconds
     
     def calculate_optimal_batch_size(self, total_resumes: int) -> int:
         """
-        Calculate optimal batch size based on total resume count to avoid quota limits
+        Resumes per batch job for `total_resumes`, from what the sizer learned about this API key's quota
         """
-        if total_resumes <= 10:
-            return min(5, total_resumes)  # Small uploads: 5 per batch
-        elif total_resumes <= 50:
-            return min(10, total_resumes)  # Medium uploads: 10 per batch
-        elif total_resumes <= 100:
-            return min(4, total_resumes)   # Large uploads: 4 per batch (25 batches max)
-        elif total_resumes <= 200:
-            return min(3, total_resumes)   # Very large: 3 per batch
-        else:
-            return min(2, total_resumes)   # Enterprise: 2 per batch
+        return self.sizer.plan(total_resumes)
     
     def create_batch_file(self, requests: List[BatchRequest]) -> str:
         """
@@ -92,7 +199,7 @@ Return only valid JSON in the exact format: {{"name": "...", "email": "...", "ph
 """
                             }]
                         }],
-                        "config": {
+                        "generation_config": {
                             "response_mime_type": "application/json",
                             "temperature": 0.1,
                             "max_output_tokens": 500
@@ -123,259 +230,147 @@ Return only valid JSON in the exact format: {{"name": "...", "email": "...", "ph
         
         return temp_file.name
     
-    def submit_batch_job(self, batch_file_path: str) -> str:
+    def create_resume_extraction_file(self, resumes: Dict[str, bytes]) -> str:
+        """
+        Create a JSONL batch input file with one extraction request per resume PDF (key -> PDF bytes).
+        The PDFs are sent inline, so the text is extracted in the same request as the contact details.
+        """
+        temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.jsonl', encoding='utf-8')
+        with temp_file:
+            for key, pdf_content in resumes.items():
+                batch_item = {
+                    "key": key,
+                    "request": {
+                        "contents": [{
+                            "role": "user",
+                            "parts": [
+                                {"inline_data": {
+                                    "mime_type": "application/pdf",
+                                    "data": base64.b64encode(pdf_content).decode('ascii')
+                                }},
+                                {"text": RESUME_EXTRACTION_PROMPT}
+                            ]
+                        }],
+                        "generation_config": {
+                            "response_mime_type": "application/json",
+                            "temperature": 0.1
+                        }
+                    }
+                }
+                temp_file.write(json.dumps(batch_item) + '\n')
+        return temp_file.name
+
+    def submit_batch_job(self, batch_file_path: str, display_name: str = None) -> str:
         """
-        Submit batch job to Gemini API using new client.batches.create() pattern
-        Returns job ID for tracking
+        Upload a JSONL batch input file and create a batch job from it. Returns immediately with the
+        job name, poll it with get_batch_job_status. The file is deleted in any case.
         """
+        display_name = display_name or f"batch_job_{int(time.time())}"
         try:
-            # Upload batch file using correct Files API syntax
-            with open(batch_file_path, 'rb') as f:
-                file_upload = self.client.files.upload(
-                    file=f,
-                    mime_type='application/jsonl',
-                    name=f'batch_job_{int(time.time())}.jsonl'
-                )
-            
+            file_upload = self.client.files.upload(
+                file=batch_file_path,
+                config=types.UploadFileConfig(mime_type='jsonl', display_name=display_name)
+            )
             print(f"Uploaded batch file: {file_upload.name}")
-            
-            # Create batch job using new API
+
             batch_job = self.client.batches.create(
-                input_file=file_upload.name
+                model=self.model,
+                src=file_upload.name,
+                config=types.CreateBatchJobConfig(display_name=display_name)
             )
-            
             print(f"Created batch job: {batch_job.name}")
-            
-            # Clean up temp file
-            os.unlink(batch_file_path)
-            
             return batch_job.name
-            
+
         except Exception as e:
-            # Clean up temp file on error
+            if is_quota_error(e):
+                raise GeminiBatchQuotaError(f"Failed to submit batch job: {e}") from e
+            raise Exception(f"Failed to submit batch job: {e}")
+        finally:
             if os.path.exists(batch_file_path):
                 os.unlink(batch_file_path)
-            raise Exception(f"Failed to submit batch job: {e}")
-    
-    def wait_for_batch_completion(self, job_id: str, max_wait_time: int = 3600) -> Dict:
-        """
-        Wait for batch job completion using new job states
-        """
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait_time:
-            try:
-                batch_status = self.client.batches.get(job_id)
-                
-                print(f"Batch status: {batch_status.state}")
-                
-                if batch_status.state == "JOB_STATE_SUCCEEDED":
-                    return {
-                        "status": "completed",
-                        "output_file": batch_status.output_file,
-                        "request_counts": batch_status.request_counts
-                    }
-                elif batch_status.state in ["JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"]:
-                    return {
-                        "status": "failed",
-                        "state": batch_status.state,
-                        "error": getattr(batch_status, 'error_file', None)
-                    }
-                
-                # Wait before checking again
-                time.sleep(30)
-                
-            except Exception as e:
-                print(f"Error checking batch status: {e}")
-                time.sleep(60)
-        
-        return {"status": "timeout", "error": "Maximum wait time exceeded"}
-    
-    def process_batch_results(self, output_file: str) -> List[BatchResponse]:
+
+    def get_batch_job_status(self, job_name: str) -> Dict:
         """
-        Process batch job results using new file response format
+        Current state of a batch job, without waiting: {"status": "running" | "completed" | "failed", ...}.
+        A completed job has the name of its results file in "output_file".
         """
+        batch_job = self.client.batches.get(name=job_name)
+        state = getattr(batch_job.state, 'name', str(batch_job.state))
+
+        if state == "JOB_STATE_SUCCEEDED":
+            return {
+                "status": "completed",
+                "state": state,
+                "output_file": batch_job.dest.file_name if batch_job.dest else None
+            }
+        if state in FINISHED_JOB_STATES:
+            return {
+                "status": "failed",
+                "state": state,
+                "error": str(batch_job.error) if batch_job.error else state
+            }
+        return {"status": "running", "state": state}
+
+    def cancel_batch_job(self, job_name: str):
         try:
-            # Download results file using new pattern
-            file_content = self.client.files.get(output_file)
-            
-            responses = []
-            for line in file_content.strip().split('\n'):
-                if not line:
-                    continue
-                    
-                result = json.loads(line)
-                
-                request_id = result.get('key')  # Using 'key' as per new format
-                
-                if 'error' in result:
-                    responses.append(BatchResponse(
-                        request_id=request_id,
-                        success=False,
-                        data=None,
-                        error=result['error']['message']
-                    ))
-                else:
-                    # Extract the response data
-                    if 'response' in result:
-                        response_data = result['response']
-                        
-                        # Handle different response types
-                        if 'candidates' in response_data:
-                            # Text generation response
-                            content = response_data['candidates'][0]['content']['parts'][0]['text']
-                            try:
-                                data = json.loads(content)
-                            except:
-                                data = content
-                        elif 'embedding' in response_data:
-                            # Embedding response
-                            data = response_data['embedding']['values']
-                        else:
-                            data = response_data
-                        
-                        responses.append(BatchResponse(
-                            request_id=request_id,
-                            success=True,
-                            data=data
-                        ))
-            
-            return responses
-            
+            self.client.batches.cancel(name=job_name)
         except Exception as e:
-            print(f"Error processing batch results: {e}")
-            return []
-    
-    def process_resumes_batch(self, resumes: List[Dict]) -> Dict[str, Dict]:
+            print(f"Error cancelling batch job {job_name}: {e}")
+
+    def process_batch_results(self, output_file: str) -> List[BatchResponse]:
         """
-        Process multiple resumes in batch for both extraction and embedding
-        Uses dynamic batch sizing based on total count to avoid quota limits
+        Download the results file of a completed batch job and parse its responses
         """
-        total_count = len(resumes)
-        optimal_batch_size = self.calculate_optimal_batch_size(total_count)
-        
-        print(f"📊 Processing {total_count} resumes with batch size: {optimal_batch_size}")
-        print(f"📈 This will create {(total_count + optimal_batch_size - 1) // optimal_batch_size} batches")
-        
-        # Create batch requests for text extraction
-        extract_requests = []
-        embed_requests = []
-        
-        for resume in resumes:
-            resume_id = resume.get('id', str(uuid.uuid4()))
-            text = resume.get('text', '')
-            
-            if text:
-                # Text extraction request
-                extract_requests.append(BatchRequest(
-                    request_id=f"extract_{resume_id}",
-                    text=text,
-                    operation='extract',
-                    metadata={'resume_id': resume_id}
+        file_content = self.client.files.download(file=output_file).decode('utf-8')
+
+        responses = []
+        for line in file_content.splitlines():
+            if not line.strip():
+                continue
+
+            result = json.loads(line)
+            request_id = result.get('key')
+
+            if 'error' in result:
+                responses.append(BatchResponse(
+                    request_id=request_id,
+                    success=False,
+                    data=None,
+                    error=result['error'].get('message', str(result['error']))
                 ))
-                
-                # Embedding request
-                embed_requests.append(BatchRequest(
-                    request_id=f"embed_{resume_id}",
-                    text=text,
-                    operation='embed',
-                    metadata={'resume_id': resume_id}
+                continue
+
+            response_data = result.get('response', {})
+            try:
+                # Handle different response types
+                if 'candidates' in response_data:
+                    # Text generation response
+                    content = response_data['candidates'][0]['content']['parts'][0]['text']
+                    try:
+                        data = json.loads(content)
+                    except ValueError:
+                        data = content
+                elif 'embedding' in response_data:
+                    # Embedding response
+                    data = response_data['embedding']['values']
+                else:
+                    data = response_data
+            except (KeyError, IndexError) as e:
+                responses.append(BatchResponse(
+                    request_id=request_id,
+                    success=False,
+                    data=None,
+                    error=f"Unexpected response: {e}"
                 ))
-        
-        results = {}
-        
-        # Process extractions
-        if extract_requests:
-            extract_results = self._process_batch_requests(extract_requests)
-            for result in extract_results:
-                resume_id = result.request_id.replace('extract_', '')
-                if resume_id not in results:
-                    results[resume_id] = {}
-                results[resume_id]['extraction'] = result.data if result.success else None
-        
-        # Process embeddings
-        if embed_requests:
-            embed_results = self._process_batch_requests(embed_requests)
-            for result in embed_results:
-                resume_id = result.request_id.replace('embed_', '')
-                if resume_id not in results:
-                    results[resume_id] = {}
-                results[resume_id]['embedding'] = result.data if result.success else None
-        
-        return results
-    
-    def _process_batch_requests(self, requests: List[BatchRequest]) -> List[BatchResponse]:
-        """
-        Internal method to process batch requests
-        """
-        if not requests:
-            return []
-        
-        # Split into batches using dynamic sizing
-        all_responses = []
-        total_requests = len(requests)
-        
-        # Calculate batch size based on total request count
-        dynamic_batch_size = self.calculate_optimal_batch_size(total_requests)
-        
-        print(f"🔄 Processing {total_requests} requests in batches of {dynamic_batch_size}")
-        
-        for i in range(0, len(requests), dynamic_batch_size):
-            batch = requests[i:i + dynamic_batch_size]
-            batch_num = (i // dynamic_batch_size) + 1
-            total_batches = (total_requests + dynamic_batch_size - 1) // dynamic_batch_size
-            
-            print(f"📦 Processing batch {batch_num}/{total_batches} ({len(batch)} items)")
-            
-            for attempt in range(self.retry_attempts):
-                try:
-                    # Create batch file
-                    batch_file = self.create_batch_file(batch)
-                    
-                    # Submit job
-                    job_id = self.submit_batch_job(batch_file)
-                    
-                    # Wait for completion
-                    job_result = self.wait_for_batch_completion(job_id)
-                    
-                    if job_result['status'] == 'completed':
-                        # Process results using new output format
-                        responses = self.process_batch_results(job_result['output_file'])
-                        all_responses.extend(responses)
-                        break
-                    else:
-                        print(f"Batch job failed: {job_result}")
-                        if attempt < self.retry_attempts - 1:
-                            print(f"Retrying in {self.retry_delay} seconds...")
-                            time.sleep(self.retry_delay)
-                        else:
-                            # Return error responses for failed batch
-                            for req in batch:
-                                all_responses.append(BatchResponse(
-                                    request_id=req.request_id,
-                                    success=False,
-                                    data=None,
-                                    error="Batch job failed"
-                                ))
-                    
-                    # Cleanup
-                    os.unlink(batch_file)
-                    
-                except Exception as e:
-                    print(f"Error in batch attempt {attempt + 1}: {e}")
-                    if attempt < self.retry_attempts - 1:
-                        time.sleep(self.retry_delay)
-                    else:
-                        # Return error responses
-                        for req in batch:
-                            all_responses.append(BatchResponse(
-                                request_id=req.request_id,
-                                success=False,
-                                data=None,
-                                error=str(e)
-                            ))
-        
-        return all_responses
+                continue
+
+            responses.append(BatchResponse(
+                request_id=request_id,
+                success=True,
+                data=data
+            ))
+
+        return responses
 
 # Global instance
 gemini_batch_service = GeminiBatchService()
\ No newline at end of file
@@ -5,6 +5,7 @@ from google.genai import types
 import os
 from typing import List, Dict
 from elexis.services.gemini_batch_service import gemini_batch_service, BatchRequest
+from elexis.services.consumer_metrics import record_dependency_call
 import uuid
 
 # Gemini-only embedding generation - no fallbacks
@@ -80,6 +81,63 @@ def generate_embedding_batch(texts: List[str]) -> Dict[str, List[float]]:
     
     return embeddings
 
+# embed_content accepts up to 100 texts per request
+EMBEDDING_REQUEST_BATCH_SIZE = 100
+
+
+def generate_embeddings(texts: List[str], batch_size: int = EMBEDDING_REQUEST_BATCH_SIZE) -> List[List[float]]:
+    """
+    Generate embeddings for many texts with one Gemini request per `batch_size` texts.
+
+    Args:
+        texts (List[str]): Texts to embed.
+        batch_size (int): Texts sent per embed_content request.
+
+    Returns:
+        List[List[float]]: One 768-dimensional vector per text, in order. Texts that are empty or
+        whose request kept failing get a zero vector, like generate_embedding.
+    """
+    import time
+
+    embeddings = [[0.0] * 768 for _ in texts]
+    prepared = []
+    for i, text in enumerate(texts):
+        if not text or not isinstance(text, str):
+            continue
+        cleaned_text = text.replace(r'[^\w\s.,?!:;()\[\]{}\'\"]', ' ').replace(r'\s+', ' ').strip()
+        cleaned_text = cleaned_text[:2048]  # Limit for embedding
+        if cleaned_text:
+            prepared.append((i, cleaned_text))
+
+    for start in range(0, len(prepared), batch_size):
+        batch = prepared[start:start + batch_size]
+        max_retries = 3
+        retry_delay = 2  # seconds
+        for attempt in range(max_retries):
+            try:
+                embedding_result = client.models.embed_content(
+                    model='models/embedding-001',
+                    contents=[text for _, text in batch],
+                )
+                values = [embedding.values for embedding in embedding_result.embeddings]
+                if len(values) != len(batch) or any(not v or len(v) != 768 for v in values):
+                    raise ValueError("Invalid embedding response")
+                for (i, _), embedding in zip(batch, values):
+                    embeddings[i] = embedding
+                print(f"✅ Generated {len(batch)} Gemini embeddings in one request")
+                record_dependency_call('gemini_embedding', succeeded=True)
+                break
+            except Exception as e:
+                record_dependency_call('gemini_embedding', succeeded=False)
+                if attempt < max_retries - 1:
+                    print(f"❌ Error generating {len(batch)} embeddings, attempt {attempt + 1}: {e}")
+                    time.sleep(retry_delay)
+                    retry_delay *= 2  # Exponential backoff
+                else:
+                    print(f"❌ Failed to generate {len(batch)} embeddings after {max_retries} attempts: {e}")
+
+    return embeddings
+
 def generate_embeddings_fallback(texts: List[str]) -> Dict[str, List[float]]:
     """
     Fallback method for individual embedding generation
@@ -0,0 +1,150 @@
+"""
+Process pool for local PDF parsing
+PyPDF2 is pure Python and holds the GIL, so the threads of a consumer parsing resumes would share one core.
+The consumer (run_consumer --pdf-processes) keeps warm worker processes that parse byte buffers and return
+the text of every page with the pages that need the LLM (LocalPdfText). Every file has a timeout, so a
+malformed PDF can not stall the pool: its worker gives up, or the pool is replaced if the worker hangs.
+Other processes (web workers, management commands) start no pool. They parse on their main thread under
+the same timeout (SIGALRM); on any other thread a hung parser could not be stopped, so the file is not
+parsed locally and goes to the LLM whole.
+"""
+
+import os
+import signal
+import threading
+import multiprocessing
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+from elexis.utils.pdf_text import LocalPdfText, read_pdf_text_locally
+
+load_dotenv()
+
+
+# Seconds a file may take before it is given up (its text then comes from the LLM)
+PDF_PARSE_TIMEOUT_SECONDS = int(os.getenv("PDF_PARSE_TIMEOUT_SECONDS", 30))
+# Extra wait in the caller before a worker that did not give up by itself is considered hung
+HUNG_WORKER_GRACE_SECONDS = 5
+
+
+class PdfParseTimeout(BaseException):
+    """Not an Exception, so the `except Exception` of the parser can not swallow it"""
+
+
+def _on_alarm(signum, frame):
+    raise PdfParseTimeout()
+
+
+def _warm_up():
+    # Imports done and the process started before the first file arrives
+    return os.getpid()
+
+
+def _parse_in_worker(pdf_content: bytes, timeout_seconds: int) -> LocalPdfText:
+    # Worker processes run tasks on their main thread, where SIGALRM can interrupt the parser
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.alarm(timeout_seconds)
+    try:
+        return read_pdf_text_locally(pdf_content)
+    except PdfParseTimeout:
+        print(f"PDF parsing ::: gave up after {timeout_seconds}s")
+        return LocalPdfText()
+    finally:
+        signal.alarm(0)
+
+
+def _parse_inline(pdf_content: bytes, timeout_seconds: int) -> LocalPdfText:
+    if threading.current_thread() is not threading.main_thread():
+        print("PDF parsing ::: no worker processes and not on the main thread, leaving the file to the LLM")
+        return LocalPdfText()
+    previous_handler = signal.getsignal(signal.SIGALRM)
+    try:
+        return _parse_in_worker(pdf_content, timeout_seconds)
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+class PdfParsingService:
+    """Parses PDF byte buffers on a shared pool of worker processes; safe to call from many threads"""
+
+    def __init__(self, processes: int = 0, timeout_seconds: int = PDF_PARSE_TIMEOUT_SECONDS):
+        self.processes = processes
+        self.timeout_seconds = timeout_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+        # Files wait here rather than in the pool's queue, so the timeout only counts the parsing
+        self._slots = threading.BoundedSemaphore(max(processes, 1))
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned, not forked: the consumer has threads, DB connections and boto3 clients
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context('spawn')
+                )
+                for _ in range(self.processes):
+                    self._executor.submit(_warm_up)
+                print(f"PDF parsing ::: started {self.processes} worker processes")
+            return self._executor
+
+    def _replace_pool(self, executor: ProcessPoolExecutor):
+        """Kill the workers of a hung or broken pool; the next file starts a new one"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse(self, pdf_content: bytes) -> LocalPdfText:
+        """Text and page metadata of a PDF; without pages (whole file to the LLM) if it could not be parsed in time"""
+        if self.processes <= 0:
+            return _parse_inline(pdf_content, self.timeout_seconds)
+        with self._slots:
+            executor = self._pool()
+            try:
+                future = executor.submit(_parse_in_worker, pdf_content, self.timeout_seconds)
+                return future.result(timeout=self.timeout_seconds + HUNG_WORKER_GRACE_SECONDS)
+            except FutureTimeoutError:
+                print(f"PDF parsing ::: a worker hung for more than {self.timeout_seconds}s, restarting the pool")
+                self._replace_pool(executor)
+            except BrokenProcessPool as e:
+                print(f"PDF parsing ::: worker pool broken, restarting it: {e}")
+                self._replace_pool(executor)
+        return LocalPdfText()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_service: Optional[PdfParsingService] = None
+_service_lock = threading.Lock()
+
+
+def configure_pdf_parsing(processes: int):
+    """Parse the PDFs of this process on `processes` worker processes; called by the consumer when it starts"""
+    global _service
+    with _service_lock:
+        previous, _service = _service, PdfParsingService(processes=processes)
+    if previous:
+        previous.shutdown()
+
+
+def get_pdf_parsing_service() -> PdfParsingService:
+    """The PDF parsing of this process; without worker processes unless `configure_pdf_parsing` was called"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = PdfParsingService()
+        return _service
+
+
+def parse_pdf(pdf_content: bytes) -> LocalPdfText:
+    return get_pdf_parsing_service().parse(pdf_content)
@@ -0,0 +1,110 @@
+"""
+Debounced re-ranking of job resume scores
+Every upload path asks for a `rank-resumes` pass, so during a bulk import the same job is re-ranked
+dozens of times a minute. Requests for the same job are coalesced and one pass runs when the window closes.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.db import close_old_connections
+
+# A pass runs once no new request for the job came in for this long...
+RANK_DEBOUNCE_WINDOW_SECONDS = float(os.getenv("RANK_DEBOUNCE_WINDOW_SECONDS", 5))
+# ...but never later than this after the first request, so a steady stream of uploads still gets ranked
+RANK_MAX_DELAY_SECONDS = float(os.getenv("RANK_MAX_DELAY_SECONDS", 30))
+
+
+class PendingRank:
+    """A scheduled rank pass for one job, shared by every request coalesced into it"""
+
+    def __init__(self, job_id: str, now: float):
+        self.job_id = job_id
+        self.first_requested_at = now
+        self.last_requested_at = now
+        self.requests = 1
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    def due_at(self, window_seconds: float, max_delay_seconds: float) -> float:
+        return min(self.last_requested_at + window_seconds, self.first_requested_at + max_delay_seconds)
+
+    def wait(self, timeout: float = None):
+        """Block until the pass ran. Re-raises the error of the pass."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Rank pass for job {self.job_id} did not run within {timeout}s")
+        if self.error:
+            raise self.error
+
+    def finish(self, error: BaseException = None):
+        self.error = error
+        self._done.set()
+
+
+class RankScheduler:
+    """
+    Coalesces rank requests per job and runs `rank_func(job_id)` on a background thread.
+
+    A request made while the job's pass is already running schedules a new pass, because the running
+    one may have read the scores before the requester's rows were committed.
+    """
+
+    def __init__(self, rank_func: Callable[[str], object], window_seconds: float = RANK_DEBOUNCE_WINDOW_SECONDS,
+                 max_delay_seconds: float = RANK_MAX_DELAY_SECONDS):
+        self.rank_func = rank_func
+        self.window_seconds = window_seconds
+        self.max_delay_seconds = max(max_delay_seconds, window_seconds)
+        self._pending: Dict[str, PendingRank] = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def request(self, job_id: str) -> PendingRank:
+        job_id = str(job_id)
+        with self._condition:
+            now = time.monotonic()
+            pending = self._pending.get(job_id)
+            if pending is None:
+                pending = self._pending[job_id] = PendingRank(job_id, now)
+            else:
+                pending.last_requested_at = now
+                pending.requests += 1
+            self._ensure_thread()
+            self._condition.notify()
+        return pending
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="rank-scheduler", daemon=True)
+            self._thread.start()
+
+    def _next_due(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [p for p in self._pending.values()
+                       if p.due_at(self.window_seconds, self.max_delay_seconds) <= now]
+                if due:
+                    for pending in due:
+                        del self._pending[pending.job_id]
+                    return due
+                next_due_at = min(
+                    (p.due_at(self.window_seconds, self.max_delay_seconds) for p in self._pending.values()),
+                    default=None,
+                )
+                self._condition.wait(None if next_due_at is None else next_due_at - now)
+
+    def _run(self):
+        while True:
+            for pending in self._next_due():
+                close_old_connections()
+                try:
+                    print(f"RankScheduler ::: ranking job {pending.job_id} ({pending.requests} requests coalesced)")
+                    self.rank_func(pending.job_id)
+                    pending.finish()
+                except Exception as e:
+                    print(f"RankScheduler ::: Error ranking job {pending.job_id}: {e}")
+                    pending.finish(e)
+                finally:
+                    close_old_connections()
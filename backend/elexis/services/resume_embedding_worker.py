@@ -0,0 +1,303 @@
+"""
+Batched resume embedding stage
+`generate_embedding` messages are accumulated across the consumer's threads; each batch extracts the
+resume text once per candidate, embeds all chunks with as few Gemini requests as possible, upserts one
+Pinecone request per namespace, stores every resume_embedding_id with one bulk_update and scores the
+candidates against the jobs they are attached to.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+from django.db import close_old_connections, transaction
+
+from elexis.models import Candidate, JobMatchingResumeScore
+from elexis.services.gemini_embedding_service import generate_embeddings, split_text_into_chunks
+from elexis.services.pinecone_service import pinecone_client
+from elexis.services.resume_text_store import get_resume_text
+
+logger = logging.getLogger(__name__)
+
+# A batch is embedded once it holds this many candidates...
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 20))
+# ...or this long after its first candidate arrived
+EMBEDDING_BATCH_WINDOW_SECONDS = float(os.getenv("EMBEDDING_BATCH_WINDOW_SECONDS", 3))
+# Resume texts downloaded/extracted in parallel per batch
+EMBEDDING_TEXT_WORKERS = int(os.getenv("EMBEDDING_TEXT_WORKERS", 4))
+
+
+def get_candidate_namespace(candidate: Candidate) -> str:
+    return f"{candidate.organization.org_name}_{candidate.organization.id}"
+
+
+def get_resume_embedding_id(candidate_id) -> str:
+    return f"resume-{candidate_id}"
+
+
+@dataclass
+class EmbeddingBatchResult:
+    embedded: List[str] = field(default_factory=list)
+    # candidate id -> reason, for candidates worth retrying
+    failed: Dict[str, str] = field(default_factory=dict)
+    job_ids: Set[str] = field(default_factory=set)
+
+
+def _extract_resume_text(candidate: Candidate) -> Optional[str]:
+    close_old_connections()
+    try:
+        return get_resume_text(candidate)
+    except Exception as e:
+        print(f"Embedding worker ::: Error extracting resume text for candidate {candidate.id}: {e}")
+        return None
+    finally:
+        close_old_connections()
+
+
+def _score_candidates(vectors_by_candidate: Dict[str, List[float]]) -> Set[str]:
+    """
+    Score the freshly embedded candidates against the jobs they are attached to.
+    The index metric is cosine, so the similarity is computed locally from the job vectors
+    (one Pinecone fetch per namespace) instead of one Pinecone query per score.
+    """
+    scores = list(
+        JobMatchingResumeScore.objects.filter(candidate_id__in=vectors_by_candidate.keys(), is_archived=False)
+        .exclude(job__job_description_embedding_id__isnull=True)
+        .exclude(job__job_description_embedding_id='')
+        .select_related('job__organization')
+    )
+    if not scores:
+        return set()
+
+    jd_ids_by_namespace: Dict[str, Set[str]] = {}
+    for score in scores:
+        namespace = f"{score.job.organization.org_name}_{score.job.organization.id}"
+        jd_ids_by_namespace.setdefault(namespace, set()).add(score.job.job_description_embedding_id)
+
+    jd_vectors = {}
+    for namespace, jd_ids in jd_ids_by_namespace.items():
+        jd_vectors.update(pinecone_client.fetch_vectors(list(jd_ids), namespace=namespace))
+
+    updated = []
+    for score in scores:
+        jd_vector = jd_vectors.get(score.job.job_description_embedding_id)
+        if not jd_vector:
+            print(f"Embedding worker ::: JD vector {score.job.job_description_embedding_id} not found, score {score.id} not updated")
+            continue
+        resume_vector = np.asarray(vectors_by_candidate[str(score.candidate_id)])
+        jd_vector = np.asarray(jd_vector)
+        norm = np.linalg.norm(resume_vector) * np.linalg.norm(jd_vector)
+        score.score = float(np.dot(resume_vector, jd_vector) / norm) if norm else 0
+        updated.append(score)
+
+    if updated:
+        with transaction.atomic():
+            JobMatchingResumeScore.objects.bulk_update(updated, ['score'])
+    return {str(score.job_id) for score in updated}
+
+
+def _score_embedded_candidates(candidates: List[Candidate]) -> Set[str]:
+    """
+    Score candidates embedded before (e.g. a deduplicated upload attached to another job) from their
+    stored vectors, one Pinecone fetch per namespace.
+    """
+    embedding_ids_by_namespace: Dict[str, List[str]] = {}
+    for candidate in candidates:
+        embedding_ids_by_namespace.setdefault(get_candidate_namespace(candidate), []).append(candidate.resume_embedding_id)
+    vectors = {}
+    for namespace, embedding_ids in embedding_ids_by_namespace.items():
+        vectors.update(pinecone_client.fetch_vectors(embedding_ids, namespace=namespace))
+    vectors_by_candidate = {
+        str(candidate.id): vectors[candidate.resume_embedding_id]
+        for candidate in candidates if vectors.get(candidate.resume_embedding_id)
+    }
+    return _score_candidates(vectors_by_candidate) if vectors_by_candidate else set()
+
+
+def embed_candidates(candidate_ids: List[str]) -> EmbeddingBatchResult:
+    """
+    Embed the resumes of the given candidates and score them against their jobs.
+    Candidates that already have an embedding are only scored; candidates without a resume are skipped.
+    """
+    result = EmbeddingBatchResult()
+    candidates_with_resume = [
+        candidate for candidate in
+        Candidate.objects.filter(id__in=set(candidate_ids)).select_related('organization')
+        if candidate.resume
+    ]
+    embedded_before = [candidate for candidate in candidates_with_resume if candidate.resume_embedding_id]
+    if embedded_before:
+        try:
+            result.job_ids |= _score_embedded_candidates(embedded_before)
+        except Exception as e:
+            for candidate in embedded_before:
+                result.failed[str(candidate.id)] = f"scoring from the stored embedding failed: {e}"
+    candidates = [candidate for candidate in candidates_with_resume if not candidate.resume_embedding_id]
+    if not candidates:
+        return result
+
+    # 1. Extract the text of every resume, once
+    with ThreadPoolExecutor(max_workers=EMBEDDING_TEXT_WORKERS, thread_name_prefix="embedding-text") as executor:
+        texts = list(executor.map(_extract_resume_text, candidates))
+
+    # 2. Chunk everything and embed all chunks of the batch together
+    chunk_owners, chunks = [], []
+    for candidate, text in zip(candidates, texts):
+        if not text:
+            result.failed[str(candidate.id)] = "resume text could not be extracted"
+            continue
+        candidate_chunks = split_text_into_chunks(text)
+        chunk_owners.extend([candidate] * len(candidate_chunks))
+        chunks.extend(candidate_chunks)
+    chunk_embeddings = generate_embeddings(chunks)
+
+    embeddings_by_candidate: Dict[str, List[List[float]]] = {}
+    for candidate, embedding in zip(chunk_owners, chunk_embeddings):
+        if all(val == 0 for val in embedding):
+            continue
+        embeddings_by_candidate.setdefault(str(candidate.id), []).append(embedding)
+
+    # 3. Aggregate per resume and upsert one request per namespace
+    vectors_by_namespace: Dict[str, list] = {}
+    vectors_by_candidate: Dict[str, List[float]] = {}
+    embedded_candidates = []
+    for candidate in candidates:
+        candidate_id = str(candidate.id)
+        if candidate_id in result.failed:
+            continue
+        if candidate_id not in embeddings_by_candidate:
+            result.failed[candidate_id] = "no valid chunk embeddings"
+            continue
+        aggregate_resume_embedding = np.mean(embeddings_by_candidate[candidate_id], axis=0).tolist()
+        embedding_id = get_resume_embedding_id(candidate_id)
+        vectors_by_namespace.setdefault(get_candidate_namespace(candidate), []).append({
+            'id': embedding_id,
+            'values': aggregate_resume_embedding,
+            'metadata': {
+                'type': 'resume',
+                'resume_id': embedding_id,
+                'candidate_name': candidate.name,
+                'candidate_email': candidate.email,
+            }
+        })
+        vectors_by_candidate[candidate_id] = aggregate_resume_embedding
+        candidate.resume_embedding_id = embedding_id
+        embedded_candidates.append(candidate)
+
+    upserted_candidates = []
+    for namespace, vectors in vectors_by_namespace.items():
+        try:
+            pinecone_client.upsert_vectors(vectors, namespace=namespace)
+        except Exception as e:
+            for vector in vectors:
+                candidate_id = vector['id'].split('resume-', 1)[1]
+                result.failed[candidate_id] = f"pinecone upsert failed: {e}"
+                vectors_by_candidate.pop(candidate_id, None)
+            continue
+        upserted_ids = {vector['id'] for vector in vectors}
+        upserted_candidates.extend(c for c in embedded_candidates if c.resume_embedding_id in upserted_ids)
+    print(f"Embedding worker ::: upserted {len(upserted_candidates)} resume vectors in {len(vectors_by_namespace)} namespaces")
+
+    # 4. Store the embedding ids and score the candidates against their jobs
+    if upserted_candidates:
+        Candidate.objects.bulk_update(upserted_candidates, ['resume_embedding_id'])
+        result.embedded = [str(candidate.id) for candidate in upserted_candidates]
+        result.job_ids |= _score_candidates(vectors_by_candidate)
+    return result
+
+
+class PendingEmbedding:
+    """One candidate's place in a batch"""
+
+    def __init__(self, candidate_id: str):
+        self.candidate_id = candidate_id
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: float = None):
+        """Block until the batch ran. Raises if this candidate could not be embedded."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Embedding batch for candidate {self.candidate_id} did not run within {timeout}s")
+        if self.error:
+            raise self.error
+
+    def finish(self, error: BaseException = None):
+        self.error = error
+        self._done.set()
+
+
+class EmbeddingBatcher:
+    """
+    Collects candidate ids from concurrent `generate_embedding` handlers and runs
+    `embed_candidates` on a background thread once the batch is full or its window closed.
+    `on_batch_done(result)` is called after each batch, e.g. to re-rank the affected jobs.
+    """
+
+    def __init__(self, on_batch_done: Callable[[EmbeddingBatchResult], None] = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, window_seconds: float = EMBEDDING_BATCH_WINDOW_SECONDS):
+        self.on_batch_done = on_batch_done
+        self.batch_size = max(1, batch_size)
+        self.window_seconds = window_seconds
+        self._pending: Dict[str, List[PendingEmbedding]] = {}
+        self._batch_started_at = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def request(self, candidate_id: str) -> PendingEmbedding:
+        pending = PendingEmbedding(str(candidate_id))
+        with self._condition:
+            if not self._pending:
+                self._batch_started_at = time.monotonic()
+            # Duplicate requests for a candidate share its slot in the batch
+            self._pending.setdefault(pending.candidate_id, []).append(pending)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return pending
+
+    def _next_batch(self) -> Dict[str, List[PendingEmbedding]]:
+        with self._condition:
+            while True:
+                if self._pending:
+                    due_at = self._batch_started_at + self.window_seconds
+                    now = time.monotonic()
+                    if len(self._pending) >= self.batch_size or now >= due_at:
+                        candidate_ids = list(self._pending)[:self.batch_size]
+                        batch = {candidate_id: self._pending.pop(candidate_id) for candidate_id in candidate_ids}
+                        # Leftovers start a new window
+                        self._batch_started_at = now
+                        return batch
+                    self._condition.wait(due_at - now)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            close_old_connections()
+            try:
+                result = embed_candidates(list(batch))
+            except Exception as e:
+                print(f"Embedding worker ::: Error embedding batch of {len(batch)} candidates: {e}")
+                for waiters in batch.values():
+                    for pending in waiters:
+                        pending.finish(e)
+                continue
+            finally:
+                close_old_connections()
+
+            for candidate_id, waiters in batch.items():
+                error = result.failed.get(candidate_id)
+                for pending in waiters:
+                    pending.finish(RuntimeError(f"Embedding failed for candidate {candidate_id}: {error}") if error else None)
+            if self.on_batch_done:
+                try:
+                    self.on_batch_done(result)
+                except Exception as e:
+                    print(f"Embedding worker ::: Error after embedding batch: {e}")
@@ -1,11 +1,12 @@
 import re
 import os
 from elexis.utils.summary_generation import extract_text_from_pdf
+from elexis.utils.pdf_text import extract_pdf_text
+from elexis.services.pdf_parsing_service import parse_pdf
 from elexis.services.QueryGemini import GeminiClient
 from elexis.services.gemini_batch_service import gemini_batch_service, BatchRequest
 from pydantic import BaseModel
-from typing import Optional, List, Dict
-import PyPDF2
+from typing import Optional, List, Dict, Union, BinaryIO
 import google.generativeai as genai
 from google.generativeai.types import BlobDict
 from dotenv import load_dotenv
@@ -14,25 +15,85 @@ import uuid
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Characters of a resume's text sent to Gemini to find its contact details
+RESUME_TEXT_LIMIT = 2000
+# Packed extraction: estimated input tokens per request (about 4 characters a token), and resumes per request
+PACKED_EXTRACTION_TOKEN_BUDGET = int(os.getenv("PACKED_EXTRACTION_TOKEN_BUDGET", 12000))
+PACKED_EXTRACTION_MAX_RESUMES = int(os.getenv("PACKED_EXTRACTION_MAX_RESUMES", 20))
+# Tokens of the instructions, and of the tags and answer of each resume
+PACKED_PROMPT_TOKENS = 150
+PACKED_RESUME_OVERHEAD_TOKENS = 40
+
 class ExtractedResumeData(BaseModel):
     name: Optional[str] = None
     email: Optional[str] = None
     phone: Optional[str] = None
     raw_text: str = ""
 
-def extract_text_from_local_pdf(file_path: str) -> str:
+class PackedResumeContact(BaseModel):
+    id: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+
+class PackedExtraction(BaseModel):
+    resumes: List[PackedResumeContact] = []
+
+# A resume PDF: a filesystem path, its bytes, or a file-like object (e.g. an UploadedFile)
+ResumeSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+def read_resume_bytes(source: ResumeSource) -> Optional[bytes]:
     """
-    Extract text from a local PDF file using Gemini AI
+    The PDF bytes of a resume source, read once and shared by the local parser and the Gemini blob.
+    bytes are used as is; None if the path does not exist.
+    """
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        if not os.path.exists(source):
+            print(f"File does not exist: {source}")
+            return None
+        with open(source, 'rb') as pdf_file:
+            return pdf_file.read()
+    # File-like: read it from the beginning, and rewind it for whoever stores it next
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    pdf_content = source.read()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return pdf_content
+
+def describe_resume_source(source: ResumeSource) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return str(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    return getattr(source, 'name', None) or repr(source)
+
+def extract_text_from_local_pdf(source: ResumeSource) -> str:
+    """
+    Extract text from a PDF (path, bytes or file-like object): locally with PyPDF2 on the PDF parsing
+    pool, and with Gemini AI for the pages or scanned files whose local text is not usable
+    """
+    try:
+        pdf_content = read_resume_bytes(source)
+    except Exception as e:
+        print(f"Error reading PDF {describe_resume_source(source)}: {e}")
+        return ""
+    if not pdf_content:
+        return ""
+
+    extracted_text = extract_pdf_text(pdf_content, extract_text_with_gemini, read_locally=parse_pdf)
+    print(f"Extracted {len(extracted_text)} characters from PDF")
+    return extracted_text
+
+def extract_text_with_gemini(pdf_content: bytes) -> str:
+    """
+    Extract text from PDF bytes using Gemini AI
     """
     try:
-        if not os.path.exists(file_path):
-            print(f"File does not exist: {file_path}")
-            return ""
-            
-        # Read PDF file as binary
-        with open(file_path, 'rb') as pdf_file:
-            pdf_content = pdf_file.read()
-            
         # Use Gemini to extract text from PDF
         pdf_blob = BlobDict(data=pdf_content, mime_type="application/pdf")
         
@@ -47,34 +108,21 @@ def extract_text_from_local_pdf(file_path: str) -> str:
             }
         )
         
-        extracted_text = response.text if response else ""
-        print(f"Extracted {len(extracted_text)} characters from PDF")
-        return extracted_text
+        return response.text if response else ""
         
     except Exception as e:
-        print(f"Error extracting text from local PDF: {e}")
-        # Fallback to PyPDF2 if Gemini fails
-        try:
-            with open(file_path, 'rb') as pdf_file:
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                print(f"Fallback: Extracted {len(text)} characters using PyPDF2")
-                return text
-        except Exception as fallback_error:
-            print(f"Fallback extraction also failed: {fallback_error}")
-            return ""
+        print(f"Error extracting text from local PDF with Gemini: {e}")
+        return ""
 
-def extract_resume_data(file_path: str) -> ExtractedResumeData:
+def extract_resume_data(source: ResumeSource) -> ExtractedResumeData:
     """
-    Extract name, email, phone from resume using AI and regex patterns
+    Extract name, email, phone from resume (path, bytes or file-like object) using AI and regex patterns
     """
     try:
-        print(f"Extracting data from: {file_path}")
+        print(f"Extracting data from: {describe_resume_source(source)}")
         
-        # Extract text from local PDF file
-        text = extract_text_from_local_pdf(file_path)
+        # Extract text from the PDF
+        text = extract_text_from_local_pdf(source)
         
         if not text or len(text.strip()) < 10:
             print("No text extracted from PDF or text too short")
@@ -116,55 +164,21 @@ def extract_resume_data(file_path: str) -> ExtractedResumeData:
 
 def extract_resumes_batch(resume_files: List[str]) -> Dict[str, ExtractedResumeData]:
     """
-    Extract data from multiple resumes using efficient sequential processing
-    This provides better error handling than complex batch APIs
+    Extract data from multiple resumes: the texts one by one, then the contact details of several
+    resumes per Gemini request (see extract_resumes_data_from_texts)
     """
     try:
-        print(f"Processing {len(resume_files)} resumes sequentially with error handling")
-        
-        results = {}
-        import time
+        print(f"Processing {len(resume_files)} resumes with packed extraction")
         
+        texts = {}
         for i, file_path in enumerate(resume_files):
             try:
                 print(f"Processing resume {i+1}/{len(resume_files)}: {file_path}")
-                
-                # Extract text from PDF
-                text = extract_text_from_local_pdf(file_path)
-                if not text or len(text.strip()) < 10:
-                    print(f"No valid text extracted from {file_path}")
-                    results[file_path] = ExtractedResumeData(raw_text="")
-                    continue
-                
-                # Try AI extraction first
-                ai_extracted = extract_with_ai(text)
-                
-                # Fallback to regex if AI fails
-                if not ai_extracted.name or not ai_extracted.email:
-                    print(f"AI extraction incomplete for {file_path}, using regex fallback")
-                    regex_extracted = extract_with_regex(text)
-                    
-                    results[file_path] = ExtractedResumeData(
-                        name=ai_extracted.name or regex_extracted.name,
-                        email=ai_extracted.email or regex_extracted.email,
-                        phone=ai_extracted.phone or regex_extracted.phone,
-                        raw_text=text
-                    )
-                else:
-                    results[file_path] = ExtractedResumeData(
-                        name=ai_extracted.name,
-                        email=ai_extracted.email,
-                        phone=ai_extracted.phone,
-                        raw_text=text
-                    )
-                
-                # Small delay between files to avoid rate limiting
-                if i < len(resume_files) - 1:
-                    time.sleep(1)
-                    
+                texts[file_path] = extract_text_from_local_pdf(file_path)
             except Exception as e:
                 print(f"Error processing {file_path}: {e}")
-                results[file_path] = ExtractedResumeData(raw_text="")
+                texts[file_path] = ""
+        results = extract_resumes_data_from_texts(texts)
         
         successful_count = len([r for r in results.values() if r.name and r.email])
         print(f"Batch processing completed: {successful_count}/{len(resume_files)} successful extractions")
@@ -182,6 +196,109 @@ def extract_resumes_batch(resume_files: List[str]) -> Dict[str, ExtractedResumeD
             results[file_path] = extract_resume_data(file_path)
         return results
 
+def extracted_resume_data_from_batch(data) -> ExtractedResumeData:
+    """
+    ExtractedResumeData from the answer of a Gemini batch extraction request ({"name", "email", "phone", "text"}),
+    completed with the regex fallback like extract_resume_data
+    """
+    if not isinstance(data, dict):
+        return ExtractedResumeData(raw_text="")
+    text = data.get('text') or ""
+    extracted = ExtractedResumeData(
+        name=data.get('name') or None,
+        email=data.get('email') or None,
+        phone=data.get('phone') or None,
+        raw_text=text
+    )
+    if text and (not extracted.name or not extracted.email):
+        regex_extracted = extract_with_regex(text)
+        extracted.name = extracted.name or regex_extracted.name
+        extracted.email = extracted.email or regex_extracted.email
+        extracted.phone = extracted.phone or regex_extracted.phone
+    return extracted
+
+def pack_resume_texts(texts: Dict[str, str]) -> List[Dict[str, str]]:
+    """
+    Group resume texts (truncated to RESUME_TEXT_LIMIT) into packs of at most PACKED_EXTRACTION_MAX_RESUMES
+    that fit PACKED_EXTRACTION_TOKEN_BUDGET, one Gemini request each
+    """
+    packs = []
+    pack, pack_tokens = {}, PACKED_PROMPT_TOKENS
+    for key, text in texts.items():
+        text = text[:RESUME_TEXT_LIMIT]
+        tokens = len(text) // 4 + PACKED_RESUME_OVERHEAD_TOKENS
+        if pack and (len(pack) >= PACKED_EXTRACTION_MAX_RESUMES or pack_tokens + tokens > PACKED_EXTRACTION_TOKEN_BUDGET):
+            packs.append(pack)
+            pack, pack_tokens = {}, PACKED_PROMPT_TOKENS
+        pack[key] = text
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+def extract_with_ai_packed(texts: Dict[str, str]) -> Dict[str, ExtractedResumeData]:
+    """
+    Use Gemini AI to extract the contact details of several resume texts, one request per pack.
+    A resume missing from the answer (or whose pack failed) gets an empty ExtractedResumeData.
+    """
+    results = {key: ExtractedResumeData() for key in texts}
+    for pack in pack_resume_texts(texts):
+        # Short ids in the prompt, mapped back to the keys
+        keys = list(pack)
+        resumes = "\n".join(
+            f'<resume id="{index}">\n{text}\n</resume>' for index, text in enumerate(pack.values())
+        )
+        prompt = f"""
+        Extract the following information from each of these {len(pack)} resume texts. Return ONLY a JSON object
+        with a "resumes" list holding one entry per resume, with these fields:
+        - id: The id of the resume tag
+        - name: Full name of the person
+        - email: Email address
+        - phone: Phone number (numbers only, remove formatting)
+        
+        Resume texts:
+        {resumes}
+        
+        Return format: {{"resumes": [{{"id": "...", "name": "...", "email": "...", "phone": "..."}}]}}
+        If any field is not found, use null. Never mix the details of two resumes.
+        """
+        try:
+            response = GeminiClient.query(
+                prompt=prompt,
+                responseSchema=PackedExtraction,
+                logIdentifier="Resume Parser Packed AI Extraction"
+            )
+            for contact in (response.resumes if response else []):
+                if contact.id.isdigit() and int(contact.id) < len(keys):
+                    results[keys[int(contact.id)]] = ExtractedResumeData(
+                        name=contact.name, email=contact.email, phone=contact.phone
+                    )
+        except Exception as e:
+            print(f"Packed AI extraction failed for {len(pack)} resumes: {e}")
+    return results
+
+def extract_resumes_data_from_texts(texts: Dict[str, str]) -> Dict[str, ExtractedResumeData]:
+    """
+    Name, email, phone of several extracted resume texts (by key), with packed AI extraction and the regex
+    fallback of extract_resume_data
+    """
+    valid = {key: text for key, text in texts.items() if text and len(text.strip()) >= 10}
+    ai_extracted = extract_with_ai_packed(valid) if valid else {}
+    results = {}
+    for key, text in texts.items():
+        if key not in valid:
+            results[key] = ExtractedResumeData(raw_text=text or "")
+            continue
+        extracted = ai_extracted[key]
+        if not extracted.name or not extracted.email:
+            regex_extracted = extract_with_regex(text)
+            extracted.name = extracted.name or regex_extracted.name
+            extracted.email = extracted.email or regex_extracted.email
+            extracted.phone = extracted.phone or regex_extracted.phone
+        extracted.raw_text = text
+        results[key] = extracted
+    return results
+
 def extract_with_ai(text: str) -> ExtractedResumeData:
     """
     Use Gemini AI to extract structured data from resume text
@@ -194,7 +311,7 @@ def extract_with_ai(text: str) -> ExtractedResumeData:
         - phone: Phone number (numbers only, remove formatting)
         
         Resume text:
-        {text[:2000]}  # Limit text length for API
+        {text[:RESUME_TEXT_LIMIT]}  # Limit text length for API
         
         Return format: {{"name": "...", "email": "...", "phone": "..."}}
         If any field is not found, use null.
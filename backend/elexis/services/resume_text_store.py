@@ -0,0 +1,136 @@
+"""
+Extracted resume text store
+The text, experience and summary Gemini extracts from a resume are stored once per resume version
+(ResumeExtraction, keyed by the SHA-256 of the file). Evaluations, suggestions, embeddings, interview
+scheduling and question generation read them from here, and the PDF is only downloaded and sent to
+Gemini again when the candidate's resume changed.
+"""
+
+import hashlib
+from typing import Callable, Dict, Optional
+
+import requests
+from django.db import IntegrityError
+
+from elexis.models import Candidate, ResumeExtraction
+from elexis.utils.summary_generation import (
+    extract_text_from_pdf_bytes,
+    aextract_text_from_pdf_bytes,
+    experience_information_from_pdf_bytes,
+    resume_summary_from_pdf_bytes,
+)
+
+
+def content_hash(pdf_content: bytes) -> str:
+    return hashlib.sha256(pdf_content).hexdigest()
+
+
+def _stored(candidate: Candidate, field: str):
+    if not candidate.resume_content_hash:
+        return None
+    return ResumeExtraction.objects.filter(content_hash=candidate.resume_content_hash).values_list(field, flat=True).first()
+
+
+def store_extraction(resume_hash: str, **fields):
+    """Store extracted fields of a resume version; empty results are not stored, so they are retried"""
+    fields = {field: value for field, value in fields.items() if value}
+    if not resume_hash or not fields:
+        return
+    updated = ResumeExtraction.objects.filter(content_hash=resume_hash).update(**fields)
+    if not updated:
+        try:
+            ResumeExtraction.objects.create(content_hash=resume_hash, **fields)
+        except IntegrityError:
+            # Another worker stored the same resume first
+            ResumeExtraction.objects.filter(content_hash=resume_hash).update(**fields)
+
+
+def store_texts(texts: Dict[str, str]):
+    """`store_extraction` of the text of many resume versions (content hash -> text), with one insert"""
+    texts = {resume_hash: text for resume_hash, text in texts.items() if resume_hash and text}
+    if not texts:
+        return
+    existing = set(ResumeExtraction.objects.filter(content_hash__in=texts).values_list('content_hash', flat=True))
+    ResumeExtraction.objects.bulk_create([
+        ResumeExtraction(content_hash=resume_hash, text=text)
+        for resume_hash, text in texts.items() if resume_hash not in existing
+    ], ignore_conflicts=True)
+    for resume_hash in existing:
+        store_extraction(resume_hash, text=texts[resume_hash])
+
+
+def _download_resume(candidate: Candidate) -> Optional[bytes]:
+    response = requests.get(candidate.resume.url)
+    if response.status_code != 200:
+        print(f"Resume text store ::: Failed to download the resume of candidate {candidate.id}")
+        return None
+    pdf_content = response.content
+    # Resumes stored before the hash was recorded, or assigned without going through Candidate.save
+    resume_hash = content_hash(pdf_content)
+    if candidate.resume_content_hash != resume_hash:
+        candidate.resume_content_hash = resume_hash
+        Candidate.objects.filter(pk=candidate.pk).update(resume_content_hash=resume_hash)
+    return pdf_content
+
+
+def _get_or_extract(candidate: Candidate, field: str, extract: Callable[[bytes], object]):
+    if not candidate.resume:
+        return None
+    value = _stored(candidate, field)
+    if value:
+        return value
+    pdf_content = _download_resume(candidate)
+    if pdf_content is None:
+        return None
+    # The hash may only be known now, and another stage may have stored the field already
+    value = _stored(candidate, field)
+    if value:
+        return value
+    value = extract(pdf_content)
+    store_extraction(candidate.resume_content_hash, **{field: value})
+    return value
+
+
+def get_resume_text(candidate: Candidate) -> str:
+    """
+    Plain text of the candidate's resume, as `extract_text_from_pdf` returns it. "" without a resume,
+    or if it could not be downloaded or read.
+    """
+    if not candidate.resume:
+        return ""
+    return _get_or_extract(candidate, 'text', extract_text_from_pdf_bytes) or ""
+
+
+def get_resume_experience(candidate: Candidate):
+    """Work experience list of the candidate's resume, as `experience_information_generation` returns it"""
+    return _get_or_extract(candidate, 'experience', experience_information_from_pdf_bytes)
+
+
+def get_resume_summary(candidate: Candidate):
+    """Summary of the candidate's resume, as `resume_summary_generator` returns it"""
+    return _get_or_extract(candidate, 'summary', resume_summary_from_pdf_bytes)
+
+
+async def aget_resume_text(candidate: Candidate) -> str:
+    """`get_resume_text` for the asyncio runtime: the ORM work runs in the executor, the rest on the loop"""
+    from elexis.services.async_dependencies import run_orm, http_get
+
+    if not candidate.resume:
+        return ""
+    text = await run_orm(_stored, candidate, 'text')
+    if text:
+        return text
+    response = await http_get(candidate.resume.url)
+    if response.status_code != 200:
+        print(f"Resume text store ::: Failed to download the resume of candidate {candidate.id}")
+        return ""
+    resume_hash = content_hash(response.content)
+    if candidate.resume_content_hash != resume_hash:
+        candidate.resume_content_hash = resume_hash
+        await run_orm(Candidate.objects.filter(pk=candidate.pk).update, resume_content_hash=resume_hash)
+        text = await run_orm(_stored, candidate, 'text')
+        if text:
+            return text
+    text = await aextract_text_from_pdf_bytes(response.content)
+    await run_orm(store_extraction, resume_hash, text=text)
+    return text or ""
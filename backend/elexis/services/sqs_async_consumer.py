@@ -0,0 +1,385 @@
+"""
+asyncio SQS consumer runtime
+One event loop polls the queues and holds up to `concurrency` messages. Handlers with a coroutine version
+(see register_async_handler) await their Gemini and HTTP calls on the loop; only ai_job_resume_evaluation
+has one. Every other message type, all ORM work and the SQS and S3 calls (boto3 has no async client in our
+dependencies) run on executor threads exactly as in the thread pool, so this mode only pays off when
+evaluations dominate the queues. Calls to external services are bounded per dependency (see async_dependencies).
+(see `manage.py run_consumer --mode async`)
+"""
+
+import asyncio
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from elexis.services.async_dependencies import SQS, close_http_client, run_blocking, run_orm
+from elexis.services.consumer_metrics import (
+    CONSUMER_CAPACITY, HANDLER_TIMEOUTS, MESSAGES_IN_FLIGHT, MESSAGES_SKIPPED, QUEUE_DEPTH_INTERVAL_SECONDS,
+    RECEIVE_ATTRIBUTE_NAMES, record_dequeue, record_handled, record_receive, start_metrics_exporters,
+    update_queue_depths,
+)
+from elexis.services.sqs_consumer_pool import (
+    DEFAULT_VISIBILITY_TIMEOUT_SECONDS, LANE_BACKLOG_FACTOR, LANE_FULL_REDELIVERY_DELAY_SECONDS,
+    LEDGER_PURGE_INTERVAL_SECONDS, MAX_RECEIVE_BATCH_SIZE, MAX_VISIBILITY_BATCH_SIZE, MAX_VISIBILITY_SECONDS,
+    VISIBILITY_EXTENSION_SECONDS, VISIBILITY_HEARTBEAT_LEAD_SECONDS, _build_sqs_client,
+)
+from elexis.services.sqs_handler_registry import arun_handler, get_queue_slots, resolve_handler
+from elexis.services.sqs_producer import sqs_producer
+from elexis.services.sqs_queues import SQSQueue
+
+
+class _AsyncQueuePoller:
+    def __init__(self, queue: SQSQueue, slots: int, batch_size: int):
+        self.queue = queue
+        self.slots = slots
+        self.batch_size = min(batch_size, slots)
+        self.visibility_timeout = DEFAULT_VISIBILITY_TIMEOUT_SECONDS
+        # Created on the loop in `_main`
+        self.capacity = None
+
+
+class _AsyncHandlerLane:
+    """Bounds a sync handler to its max_concurrency executor threads, with a limited backlog."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.limit = handler.max_concurrency * LANE_BACKLOG_FACTOR
+        self.pending = 0
+        self.semaphore = asyncio.Semaphore(handler.max_concurrency)
+
+
+class _AsyncInFlightMessage:
+    def __init__(self, message, handler, poller: _AsyncQueuePoller, visibility_timeout: int):
+        self.message = message
+        self.handler = handler
+        self.poller = poller
+        self.received_at = time.monotonic()
+        self.visible_at = self.received_at + visibility_timeout
+
+    def needs_heartbeat(self, now: float) -> bool:
+        return (self.visible_at - now <= VISIBILITY_HEARTBEAT_LEAD_SECONDS
+                and now - self.received_at < MAX_VISIBILITY_SECONDS)
+
+
+class AsyncSQSConsumer:
+    """
+    asyncio version of SQSConsumerPool.
+
+    `concurrency` bounds the number of messages held at once and is split across the queues by their
+    poll weight. Handlers with a coroutine version are only bounded by `concurrency` and the dependency
+    limits. Sync handlers keep their max_concurrency and run on the `sync_threads` executor. Every message
+    is given up after its handler's timeout: a coroutine is cancelled, a sync handler's thread can not be
+    and keeps its lane slot until it returns.
+
+    Metrics (see consumer_metrics) are served on `metrics_port`, SQS_METRICS_PORT by default.
+    """
+
+    def __init__(self, queues: List[SQSQueue], concurrency: int = 200, batch_size: int = MAX_RECEIVE_BATCH_SIZE,
+                 wait_time_seconds: int = 20, sync_threads: int = 32, name: str = "sqs-async-consumer",
+                 metrics_port: int = None):
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, min(batch_size, MAX_RECEIVE_BATCH_SIZE))
+        self.wait_time_seconds = wait_time_seconds
+        self.sync_threads = max(1, sync_threads)
+        self.name = name
+        self.metrics_port = metrics_port
+
+        # Importing the consumer module registers every handler
+        import elexis.sqs_consumer  # noqa: F401
+
+        self._pollers = [
+            _AsyncQueuePoller(queue, slots=get_queue_slots(queue, queues, self.concurrency), batch_size=self.batch_size)
+            for queue in queues
+        ]
+        self._lanes: Dict[str, _AsyncHandlerLane] = {}
+        self._in_flight: Dict[_AsyncInFlightMessage, asyncio.Task] = {}
+        self._loop = None
+        self._stop_event = None
+
+    def stop(self):
+        """Stop polling; in-flight messages are allowed to finish. Safe to call from signal handlers and other threads."""
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        # Shared by sync handlers, ORM calls and blocking client calls
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=self.sync_threads, thread_name_prefix=self.name))
+        self.sqs_client = _build_sqs_client()
+
+        print(f"{self.name} ::: started with concurrency {self.concurrency}, {self.sync_threads} sync threads, batch size {self.batch_size}")
+        start_metrics_exporters(self.name, self.metrics_port)
+        for poller in self._pollers:
+            poller.capacity = asyncio.Semaphore(poller.slots + poller.batch_size)
+            poller.visibility_timeout = await self._get_queue_visibility_timeout(poller.queue.url)
+            print(f"{self.name} ::: polling {poller.queue.priority} queue {poller.queue.url} with {poller.slots} slots")
+            CONSUMER_CAPACITY.set(poller.slots, priority=poller.queue.priority)
+
+        poll_tasks = [asyncio.create_task(self._poll_queue(poller)) for poller in self._pollers]
+        watchdog = asyncio.create_task(self._watch())
+        try:
+            await self._stop_event.wait()
+        finally:
+            print(f"{self.name} ::: stopping, waiting for in-flight messages")
+            # Pollers finish their current long poll and dispatch what it returned
+            await asyncio.gather(*poll_tasks, return_exceptions=True)
+            while self._in_flight:
+                await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+            watchdog.cancel()
+            # Send whatever the handlers published and the flush timer has not sent yet
+            await asyncio.to_thread(sqs_producer.flush)
+            await close_http_client()
+            print(f"{self.name} ::: stopped")
+
+    async def _get_queue_visibility_timeout(self, queue_url: str) -> int:
+        try:
+            response = await run_blocking(SQS, self.sqs_client.get_queue_attributes,
+                                          QueueUrl=queue_url, AttributeNames=['VisibilityTimeout'])
+            return int(response['Attributes']['VisibilityTimeout'])
+        except Exception as e:
+            print(f"{self.name} ::: Could not read the queue visibility timeout, assuming {DEFAULT_VISIBILITY_TIMEOUT_SECONDS}s: {e}")
+            return DEFAULT_VISIBILITY_TIMEOUT_SECONDS
+
+    async def _poll_queue(self, poller: _AsyncQueuePoller):
+        while not self._stop_event.is_set():
+            try:
+                await self._poll_once(poller)
+            except Exception as e:
+                print(f"{self.name} ::: Error consuming SQS messages from the {poller.queue.priority} queue: {e}")
+                traceback.print_exc()
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), 5)  # Retry after a short delay
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _acquire_slots(self, poller: _AsyncQueuePoller) -> int:
+        """Wait until at least one slot is free, then grab as many as a receive can use."""
+        while True:
+            try:
+                await asyncio.wait_for(poller.capacity.acquire(), 1)
+                break
+            except asyncio.TimeoutError:
+                if self._stop_event.is_set():
+                    return 0
+        slots = 1
+        while slots < poller.batch_size and not poller.capacity.locked():
+            await poller.capacity.acquire()
+            slots += 1
+        return slots
+
+    def _release_slots(self, poller: _AsyncQueuePoller, count: int):
+        for _ in range(count):
+            poller.capacity.release()
+
+    async def _poll_once(self, poller: _AsyncQueuePoller):
+        slots = await self._acquire_slots(poller)
+        if not slots:
+            return
+        try:
+            response = await run_blocking(
+                SQS, self.sqs_client.receive_message,
+                QueueUrl=poller.queue.url,
+                MaxNumberOfMessages=slots,
+                WaitTimeSeconds=self.wait_time_seconds,
+                AttributeNames=RECEIVE_ATTRIBUTE_NAMES,
+            )
+        except BaseException:
+            self._release_slots(poller, slots)
+            raise
+
+        messages = response.get('Messages', [])
+        record_receive(poller.queue.priority, messages)
+        # Give back the slots this receive did not fill
+        self._release_slots(poller, slots - len(messages))
+        for message in messages:
+            await self._dispatch(poller, message)
+
+    async def _dispatch(self, poller: _AsyncQueuePoller, message):
+        queue_url = poller.queue.url
+        try:
+            payload = json.loads(message['Body'])
+        except json.JSONDecodeError:
+            print(f"Invalid message format: {message['Body']}")
+            record_dequeue('invalid', poller.queue.priority, message)
+            await self._delete(queue_url, message)
+            poller.capacity.release()
+            return
+
+        handler = resolve_handler(payload)
+        if not handler:
+            print(f"SQS_Consumer :: process_message:: No handler registered for message: {payload}")
+            record_dequeue('unknown', poller.queue.priority, message)
+            await self._delete(queue_url, message)
+            poller.capacity.release()
+            return
+
+        record_dequeue(handler.message_type, poller.queue.priority, message)
+        lane = None
+        if not handler.async_func:
+            lane = self._lanes.get(handler.message_type)
+            if lane is None:
+                lane = self._lanes[handler.message_type] = _AsyncHandlerLane(handler)
+            if lane.pending >= lane.limit:
+                # Lane is saturated: hand the message back to SQS for later
+                MESSAGES_SKIPPED.inc(message_type=handler.message_type, reason='lane_full')
+                await self._change_visibility(queue_url, message, LANE_FULL_REDELIVERY_DELAY_SECONDS)
+                poller.capacity.release()
+                return
+            lane.pending += 1
+
+        visibility_timeout = poller.visibility_timeout
+        if handler.expected_duration_seconds and handler.expected_duration_seconds > visibility_timeout:
+            # Size the first timeout to the handler so short queue defaults don't need a heartbeat every few seconds
+            visibility_timeout = handler.expected_duration_seconds + VISIBILITY_HEARTBEAT_LEAD_SECONDS
+            if not await self._change_visibility(queue_url, message, visibility_timeout):
+                visibility_timeout = poller.visibility_timeout
+
+        record = _AsyncInFlightMessage(message, handler, poller, visibility_timeout)
+        MESSAGES_IN_FLIGHT.inc(message_type=handler.message_type)
+        self._in_flight[record] = asyncio.create_task(self._handle(record, payload, lane))
+
+    async def _run_sync_handler(self, lane: _AsyncHandlerLane, func, message):
+        await lane.semaphore.acquire()
+        run = asyncio.ensure_future(run_orm(func, message))
+
+        def release(_):
+            # The thread outlives a timed out message, so the lane slot is only freed once it returns
+            lane.semaphore.release()
+            if not run.cancelled():
+                run.exception()
+
+        run.add_done_callback(release)
+        return await asyncio.shield(run)
+
+    async def _handle(self, record: _AsyncInFlightMessage, payload: dict, lane: _AsyncHandlerLane = None):
+        from elexis.services import sqs_message_ledger as ledger
+
+        message = record.message
+        message_type = record.handler.message_type
+        queue_url = record.poller.queue.url
+        delete = True
+        try:
+            try:
+                outcome, entry = await run_orm(ledger.claim_message, record.handler, message['MessageId'], payload)
+            except Exception as e:
+                # The ledger is an optimisation, never a reason not to process a message
+                print(f"{self.name} ::: Could not check the message ledger for {message.get('MessageId')}: {e}")
+                outcome, entry = ledger.CLAIMED, None
+
+            if outcome == ledger.ALREADY_PROCESSED:
+                print(f"{self.name} ::: Skipping {message_type} message {message.get('MessageId')}, already processed")
+                MESSAGES_SKIPPED.inc(message_type=message_type, reason='duplicate')
+                return
+            if outcome == ledger.IN_PROGRESS:
+                # Another consumer is working on it; look again once it should be done
+                print(f"{self.name} ::: {message_type} message {message.get('MessageId')} is being processed elsewhere, retrying later")
+                MESSAGES_SKIPPED.inc(message_type=message_type, reason='in_progress')
+                delete = False
+                await self._change_visibility(queue_url, message,
+                                              record.handler.expected_duration_seconds or LANE_FULL_REDELIVERY_DELAY_SECONDS)
+                return
+
+            started_at = time.monotonic()
+            try:
+                run_sync = None if record.handler.async_func else lambda func, msg: self._run_sync_handler(lane, func, msg)
+                await asyncio.wait_for(arun_handler(record.handler, payload, run_sync), record.handler.timeout_seconds)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    HANDLER_TIMEOUTS.inc(message_type=message_type)
+                record_handled(message_type, time.monotonic() - started_at, succeeded=False)
+                if entry:
+                    await run_orm(ledger.record_outcome, entry, succeeded=False, error=e)
+                raise
+            record_handled(message_type, time.monotonic() - started_at, succeeded=True)
+            if entry:
+                await run_orm(ledger.record_outcome, entry, succeeded=True)
+            print(f"Processed message: {message['Body']}")
+        except Exception as e:
+            # The retry policy is exhausted (or the handler timed out); drop the message like the consumer always has
+            print(f"{self.name} ::: {message_type} failed for message {message.get('MessageId')}, giving up: {e!r}")
+            traceback.print_exc()
+        finally:
+            # Delete the message from the queue after processing
+            if delete:
+                await self._delete(queue_url, message)
+            if lane:
+                lane.pending -= 1
+            self._in_flight.pop(record, None)
+            MESSAGES_IN_FLIGHT.dec(message_type=message_type)
+            record.poller.capacity.release()
+
+    async def _watch(self):
+        next_ledger_purge = next_depth_update = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            if now >= next_ledger_purge:
+                next_ledger_purge = now + LEDGER_PURGE_INTERVAL_SECONDS
+                asyncio.create_task(self._purge_ledger())
+            if now >= next_depth_update:
+                next_depth_update = now + QUEUE_DEPTH_INTERVAL_SECONDS
+                asyncio.create_task(run_blocking(SQS, update_queue_depths, self.sqs_client,
+                                                 [poller.queue for poller in self._pollers]))
+            due = [record for record in self._in_flight if record.needs_heartbeat(now)]
+            records_by_queue = {}
+            for record in due:
+                records_by_queue.setdefault(record.poller.queue.url, []).append(record)
+            for queue_url, records in records_by_queue.items():
+                for start in range(0, len(records), MAX_VISIBILITY_BATCH_SIZE):
+                    await self._heartbeat_batch(queue_url, records[start:start + MAX_VISIBILITY_BATCH_SIZE])
+
+    async def _purge_ledger(self):
+        from elexis.services.sqs_message_ledger import purge_expired_entries
+
+        try:
+            purged = await run_orm(purge_expired_entries)
+            if purged:
+                print(f"{self.name} ::: Purged {purged} expired message ledger entries")
+        except Exception as e:
+            print(f"{self.name} ::: Error purging the message ledger: {e}")
+
+    async def _heartbeat_batch(self, queue_url: str, batch):
+        entries = [
+            {
+                'Id': str(index),
+                'ReceiptHandle': record.message['ReceiptHandle'],
+                'VisibilityTimeout': VISIBILITY_EXTENSION_SECONDS,
+            }
+            for index, record in enumerate(batch)
+        ]
+        sent_at = time.monotonic()
+        try:
+            response = await run_blocking(SQS, self.sqs_client.change_message_visibility_batch,
+                                          QueueUrl=queue_url, Entries=entries)
+        except Exception as e:
+            print(f"{self.name} ::: Error extending message visibility: {e}")
+            return
+        for success in response.get('Successful', []):
+            batch[int(success['Id'])].visible_at = sent_at + VISIBILITY_EXTENSION_SECONDS
+        for failure in response.get('Failed', []):
+            record = batch[int(failure['Id'])]
+            print(f"{self.name} ::: Could not extend visibility of {record.handler.message_type} message "
+                  f"{record.message.get('MessageId')}: {failure.get('Code')} {failure.get('Message')}")
+
+    async def _change_visibility(self, queue_url: str, message, visibility_timeout: int) -> bool:
+        try:
+            await run_blocking(SQS, self.sqs_client.change_message_visibility, QueueUrl=queue_url,
+                               ReceiptHandle=message['ReceiptHandle'], VisibilityTimeout=visibility_timeout)
+            return True
+        except Exception as e:
+            print(f"{self.name} ::: Error changing visibility of message {message.get('MessageId')}: {e}")
+            return False
+
+    async def _delete(self, queue_url: str, message):
+        try:
+            await run_blocking(SQS, self.sqs_client.delete_message, QueueUrl=queue_url,
+                               ReceiptHandle=message['ReceiptHandle'])
+        except Exception as e:
+            print(f"{self.name} ::: Error deleting message {message.get('MessageId')}: {e}")
@@ -0,0 +1,534 @@
+"""
+SQS consumer runtime
+Polls the SQS queues in batches and fans messages out to per message type lanes (see sqs_handler_registry),
+in one process or in a pool of processes, so the queues can be drained independently of the web workers
+(see `manage.py run_consumer`)
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import boto3
+from django.db import close_old_connections, connections
+
+from elexis.services.consumer_metrics import (
+    CONSUMER_CAPACITY, HANDLER_TIMEOUTS, MESSAGES_IN_FLIGHT, MESSAGES_SKIPPED, METRICS_PORT,
+    QUEUE_DEPTH_INTERVAL_SECONDS, RECEIVE_ATTRIBUTE_NAMES, record_dequeue, record_handled, record_receive,
+    start_metrics_exporters, update_queue_depths,
+)
+from elexis.services.sqs_handler_registry import get_queue_slots, resolve_handler, run_handler
+from elexis.services.sqs_producer import sqs_producer
+from elexis.services.sqs_queues import SQSQueue
+
+# SQS hard limit for receive_message
+MAX_RECEIVE_BATCH_SIZE = 10
+# A lane buffers up to this many messages per unit of handler concurrency
+LANE_BACKLOG_FACTOR = 2
+# Visibility timeout given to messages handed back because their lane was full
+LANE_FULL_REDELIVERY_DELAY_SECONDS = 15
+# Used when the queue's own VisibilityTimeout cannot be read
+DEFAULT_VISIBILITY_TIMEOUT_SECONDS = 30
+# In-flight messages are extended by this much whenever they are about to become visible again
+VISIBILITY_EXTENSION_SECONDS = 120
+# ...which is done this long before their current visibility timeout runs out
+VISIBILITY_HEARTBEAT_LEAD_SECONDS = 10
+# SQS rejects extending a message beyond 12 hours after it was received
+MAX_VISIBILITY_SECONDS = 12 * 60 * 60
+# change_message_visibility_batch limit
+MAX_VISIBILITY_BATCH_SIZE = 10
+# How often expired entries are removed from the processed message ledger
+LEDGER_PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+def _build_sqs_client():
+    from elexis.sqs_consumer import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION_NAME, AWS_SQS_ENDPOINT
+
+    return boto3.client(
+        'sqs',
+        endpoint_url=AWS_SQS_ENDPOINT,
+        region_name=AWS_REGION_NAME,
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    )
+
+
+class _HandlerLane:
+    """
+    Executor for one message type, sized to the handler's max_concurrency.
+    A lane only buffers a limited backlog so one flooded message type cannot hold every intake slot.
+    """
+
+    def __init__(self, handler, name_prefix: str):
+        self.handler = handler
+        self.limit = handler.max_concurrency * LANE_BACKLOG_FACTOR
+        self.pending = 0  # queued + running
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=handler.max_concurrency,
+            thread_name_prefix=f"{name_prefix}-{handler.message_type}",
+        )
+
+    def try_reserve(self) -> bool:
+        with self._lock:
+            if self.pending >= self.limit:
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+
+class _QueuePoller:
+    """
+    Intake for one queue. Every queue gets its own share of the workers (by poll weight) and its own
+    polling thread, so a flooded bulk queue can never take the capacity of the interactive queue.
+    """
+
+    def __init__(self, queue: SQSQueue, slots: int, batch_size: int, visibility_timeout: int):
+        self.queue = queue
+        self.slots = slots
+        self.batch_size = min(batch_size, slots)
+        self.visibility_timeout = visibility_timeout
+        # Received but not yet finished messages. Allow one batch of prefetch on top of the slots
+        # so that the lanes are never idle while the next receive is in flight.
+        self.capacity = threading.BoundedSemaphore(slots + self.batch_size)
+
+
+class _InFlightMessage:
+    def __init__(self, message, handler, lane, poller: _QueuePoller, visibility_timeout: int):
+        self.message = message
+        self.handler = handler
+        self.lane = lane
+        self.poller = poller
+        self.received_at = time.monotonic()
+        self.deadline = self.received_at + handler.timeout_seconds
+        self.visible_at = self.received_at + visibility_timeout
+        self.timed_out = False
+        self._slot_released = False
+        self._lock = threading.Lock()
+
+    def needs_heartbeat(self, now: float) -> bool:
+        return (self.visible_at - now <= VISIBILITY_HEARTBEAT_LEAD_SECONDS
+                and now - self.received_at < MAX_VISIBILITY_SECONDS)
+
+    def release_slot(self):
+        """Give the intake slot back exactly once (on completion or on timeout, whichever is first)."""
+        with self._lock:
+            if self._slot_released:
+                return
+            self._slot_released = True
+        self.poller.capacity.release()
+
+
+class SQSConsumerPool:
+    """
+    Receives messages in batches of up to 10 and dispatches each one to the lane of its handler.
+
+    `workers` bounds the number of messages held by this consumer at once and is split across the
+    queues by their poll weight (each queue gets at least the max_concurrency of its handlers); each
+    handler's max_concurrency bounds how many of its own messages run at once. Every message runs on
+    a lane thread that gets its own Django DB connection; stale connections are closed before and
+    after each message, the same way Django does around a request.
+
+    While a message is held (queued in its lane or running) its visibility timeout is extended by a
+    heartbeat, so a long handler is never picked up a second time by another consumer.
+
+    Metrics (see consumer_metrics) are served on `metrics_port`, SQS_METRICS_PORT by default.
+    """
+
+    def __init__(self, queues: List[SQSQueue], workers: int = 8, batch_size: int = MAX_RECEIVE_BATCH_SIZE,
+                 wait_time_seconds: int = 20, name: str = "sqs-consumer", metrics_port: int = None):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, min(batch_size, MAX_RECEIVE_BATCH_SIZE))
+        self.wait_time_seconds = wait_time_seconds
+        self.name = name
+        self.metrics_port = metrics_port
+        self.sqs_client = _build_sqs_client()
+
+        # Importing the consumer module registers every handler
+        import elexis.sqs_consumer  # noqa: F401
+
+        self._pollers = [
+            _QueuePoller(
+                queue,
+                slots=get_queue_slots(queue, queues, self.workers),
+                batch_size=self.batch_size,
+                visibility_timeout=self._get_queue_visibility_timeout(queue.url),
+            )
+            for queue in queues
+        ]
+        self._lanes = {}
+        self._lanes_lock = threading.Lock()
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # The watchdog outlives the poll loop so draining messages keep their heartbeat
+        self._drained_event = threading.Event()
+
+    def _get_queue_visibility_timeout(self, queue_url: str) -> int:
+        try:
+            response = self.sqs_client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['VisibilityTimeout'])
+            return int(response['Attributes']['VisibilityTimeout'])
+        except Exception as e:
+            print(f"{self.name} ::: Could not read the queue visibility timeout, assuming {DEFAULT_VISIBILITY_TIMEOUT_SECONDS}s: {e}")
+            return DEFAULT_VISIBILITY_TIMEOUT_SECONDS
+
+    def stop(self):
+        """Stop polling; in-flight messages are allowed to finish."""
+        self._stop_event.set()
+
+    def run(self):
+        """Poll until `stop()` is called, then drain the in-flight messages."""
+        print(f"{self.name} ::: started with {self.workers} workers, batch size {self.batch_size}")
+        start_metrics_exporters(self.name, self.metrics_port)
+        watchdog = threading.Thread(target=self._watch_timeouts, name=f"{self.name}-watchdog", daemon=True)
+        watchdog.start()
+        pollers = []
+        for poller in self._pollers:
+            print(f"{self.name} ::: polling {poller.queue.priority} queue {poller.queue.url} with {poller.slots} workers")
+            CONSUMER_CAPACITY.set(poller.slots, priority=poller.queue.priority)
+            thread = threading.Thread(target=self._poll_queue, args=(poller,),
+                                      name=f"{self.name}-poll-{poller.queue.priority}", daemon=True)
+            thread.start()
+            pollers.append(thread)
+        try:
+            while not self._stop_event.wait(1):
+                pass
+        finally:
+            print(f"{self.name} ::: stopping, waiting for in-flight messages")
+            self._stop_event.set()
+            for thread in pollers:
+                thread.join()
+            for lane in self._lanes.values():
+                lane.executor.shutdown(wait=True)
+            self._drained_event.set()
+            # Send whatever the handlers published and the flush timer has not sent yet
+            sqs_producer.flush()
+            connections.close_all()
+            print(f"{self.name} ::: stopped")
+
+    def _poll_queue(self, poller: _QueuePoller):
+        while not self._stop_event.is_set():
+            try:
+                self._poll_once(poller)
+            except Exception as e:
+                print(f"{self.name} ::: Error consuming SQS messages from the {poller.queue.priority} queue: {e}")
+                traceback.print_exc()
+                self._stop_event.wait(5)  # Retry after a short delay
+
+    def _acquire_slots(self, poller: _QueuePoller) -> int:
+        """Block until at least one slot is free, then grab as many as a receive can use."""
+        while not poller.capacity.acquire(timeout=1):
+            if self._stop_event.is_set():
+                return 0
+        slots = 1
+        while slots < poller.batch_size and poller.capacity.acquire(blocking=False):
+            slots += 1
+        return slots
+
+    def _release_slots(self, poller: _QueuePoller, count: int):
+        for _ in range(count):
+            poller.capacity.release()
+
+    def _poll_once(self, poller: _QueuePoller):
+        slots = self._acquire_slots(poller)
+        if not slots:
+            return
+        try:
+            response = self.sqs_client.receive_message(
+                QueueUrl=poller.queue.url,
+                MaxNumberOfMessages=slots,
+                WaitTimeSeconds=self.wait_time_seconds,
+                AttributeNames=RECEIVE_ATTRIBUTE_NAMES,
+            )
+        except Exception:
+            self._release_slots(poller, slots)
+            raise
+
+        messages = response.get('Messages', [])
+        record_receive(poller.queue.priority, messages)
+        # Give back the slots this receive did not fill
+        self._release_slots(poller, slots - len(messages))
+        for message in messages:
+            self._dispatch(poller, message)
+
+    def _get_lane(self, handler) -> _HandlerLane:
+        # Pollers of several queues may create lanes concurrently
+        with self._lanes_lock:
+            lane = self._lanes.get(handler.message_type)
+            if lane is None:
+                lane = self._lanes[handler.message_type] = _HandlerLane(handler, self.name)
+            return lane
+
+    def _dispatch(self, poller: _QueuePoller, message):
+        """Route a received message to its lane. Called from the polling thread of its queue."""
+        queue_url = poller.queue.url
+        try:
+            payload = json.loads(message['Body'])
+        except json.JSONDecodeError:
+            print(f"Invalid message format: {message['Body']}")
+            record_dequeue('invalid', poller.queue.priority, message)
+            self._delete(queue_url, message)
+            poller.capacity.release()
+            return
+
+        handler = resolve_handler(payload)
+        if not handler:
+            print(f"SQS_Consumer :: process_message:: No handler registered for message: {payload}")
+            record_dequeue('unknown', poller.queue.priority, message)
+            self._delete(queue_url, message)
+            poller.capacity.release()
+            return
+
+        record_dequeue(handler.message_type, poller.queue.priority, message)
+        lane = self._get_lane(handler)
+        if not lane.try_reserve():
+            # Lane is saturated: hand the message back to SQS for later instead of letting it
+            # hold an intake slot that other message types could use
+            MESSAGES_SKIPPED.inc(message_type=handler.message_type, reason='lane_full')
+            self._nack(queue_url, message, LANE_FULL_REDELIVERY_DELAY_SECONDS)
+            poller.capacity.release()
+            return
+
+        visibility_timeout = poller.visibility_timeout
+        if handler.expected_duration_seconds and handler.expected_duration_seconds > visibility_timeout:
+            # Size the first timeout to the handler so short queue defaults don't need a heartbeat every few seconds
+            visibility_timeout = handler.expected_duration_seconds + VISIBILITY_HEARTBEAT_LEAD_SECONDS
+            if not self._change_visibility(queue_url, message, visibility_timeout):
+                visibility_timeout = poller.visibility_timeout
+
+        record = _InFlightMessage(message, handler, lane, poller, visibility_timeout)
+        with self._in_flight_lock:
+            self._in_flight.add(record)
+        MESSAGES_IN_FLIGHT.inc(message_type=handler.message_type)
+        lane.executor.submit(self._handle, record, payload)
+
+    def _handle(self, record: _InFlightMessage, payload: dict):
+        from elexis.services import sqs_message_ledger as ledger
+
+        message = record.message
+        message_type = record.handler.message_type
+        delete = True
+        close_old_connections()
+        try:
+            try:
+                outcome, entry = ledger.claim_message(record.handler, message['MessageId'], payload)
+            except Exception as e:
+                # The ledger is an optimisation, never a reason not to process a message
+                print(f"{self.name} ::: Could not check the message ledger for {message.get('MessageId')}: {e}")
+                outcome, entry = ledger.CLAIMED, None
+
+            if outcome == ledger.ALREADY_PROCESSED:
+                print(f"{self.name} ::: Skipping {message_type} message {message.get('MessageId')}, already processed")
+                MESSAGES_SKIPPED.inc(message_type=message_type, reason='duplicate')
+                return
+            if outcome == ledger.IN_PROGRESS:
+                # Another consumer is working on it; look again once it should be done
+                print(f"{self.name} ::: {message_type} message {message.get('MessageId')} is being processed elsewhere, retrying later")
+                MESSAGES_SKIPPED.inc(message_type=message_type, reason='in_progress')
+                delete = False
+                self._nack(record.poller.queue.url, message,
+                           record.handler.expected_duration_seconds or LANE_FULL_REDELIVERY_DELAY_SECONDS)
+                return
+
+            started_at = time.monotonic()
+            try:
+                run_handler(record.handler, payload)
+            except Exception as e:
+                record_handled(message_type, time.monotonic() - started_at, succeeded=False)
+                if entry:
+                    ledger.record_outcome(entry, succeeded=False, error=e)
+                raise
+            record_handled(message_type, time.monotonic() - started_at, succeeded=True)
+            if entry:
+                ledger.record_outcome(entry, succeeded=True)
+            print(f"Processed message: {message['Body']}")
+        except Exception as e:
+            # The retry policy is exhausted; drop the message like the consumer always has
+            print(f"{self.name} ::: {message_type} failed for message {message.get('MessageId')}, giving up: {e}")
+            traceback.print_exc()
+        finally:
+            # Delete the message from the queue after processing
+            if delete:
+                self._delete(record.poller.queue.url, message)
+            close_old_connections()
+            record.lane.release()
+            with self._in_flight_lock:
+                self._in_flight.discard(record)
+            MESSAGES_IN_FLIGHT.dec(message_type=message_type)
+            record.release_slot()
+
+    def _watch_timeouts(self):
+        next_ledger_purge = next_depth_update = time.monotonic()
+        while not self._drained_event.wait(1):
+            now = time.monotonic()
+            if now >= next_ledger_purge:
+                next_ledger_purge = now + LEDGER_PURGE_INTERVAL_SECONDS
+                self._purge_ledger()
+            if now >= next_depth_update:
+                next_depth_update = now + QUEUE_DEPTH_INTERVAL_SECONDS
+                update_queue_depths(self.sqs_client, [poller.queue for poller in self._pollers])
+            with self._in_flight_lock:
+                expired = [r for r in self._in_flight if not r.timed_out and r.deadline <= now]
+                # Timed out handlers are still running, keep them invisible too
+                due = [r for r in self._in_flight if r.needs_heartbeat(now)]
+            if due:
+                self._heartbeat(due)
+            for record in expired:
+                record.timed_out = True
+                HANDLER_TIMEOUTS.inc(message_type=record.handler.message_type)
+                print(f"{self.name} ::: {record.handler.message_type} exceeded its {record.handler.timeout_seconds}s timeout "
+                      f"for message {record.message.get('MessageId')}, no longer waiting on it")
+                # The thread keeps running (threads cannot be killed), but the slot is freed
+                # so the remaining lanes keep receiving
+                record.release_slot()
+
+    def _purge_ledger(self):
+        from elexis.services.sqs_message_ledger import purge_expired_entries
+
+        close_old_connections()
+        try:
+            purged = purge_expired_entries()
+            if purged:
+                print(f"{self.name} ::: Purged {purged} expired message ledger entries")
+        except Exception as e:
+            print(f"{self.name} ::: Error purging the message ledger: {e}")
+        finally:
+            close_old_connections()
+
+    def _heartbeat(self, records):
+        """Extend the visibility timeout of the given in-flight messages, 10 per request and queue."""
+        records_by_queue = {}
+        for record in records:
+            records_by_queue.setdefault(record.poller.queue.url, []).append(record)
+        for queue_url, queue_records in records_by_queue.items():
+            for start in range(0, len(queue_records), MAX_VISIBILITY_BATCH_SIZE):
+                self._heartbeat_batch(queue_url, queue_records[start:start + MAX_VISIBILITY_BATCH_SIZE])
+
+    def _heartbeat_batch(self, queue_url: str, batch):
+        entries = [
+            {
+                'Id': str(index),
+                'ReceiptHandle': record.message['ReceiptHandle'],
+                'VisibilityTimeout': VISIBILITY_EXTENSION_SECONDS,
+            }
+            for index, record in enumerate(batch)
+        ]
+        sent_at = time.monotonic()
+        try:
+            response = self.sqs_client.change_message_visibility_batch(QueueUrl=queue_url, Entries=entries)
+        except Exception as e:
+            print(f"{self.name} ::: Error extending message visibility: {e}")
+            return
+        for success in response.get('Successful', []):
+            batch[int(success['Id'])].visible_at = sent_at + VISIBILITY_EXTENSION_SECONDS
+        for failure in response.get('Failed', []):
+            record = batch[int(failure['Id'])]
+            print(f"{self.name} ::: Could not extend visibility of {record.handler.message_type} message "
+                  f"{record.message.get('MessageId')}: {failure.get('Code')} {failure.get('Message')}")
+
+    def _change_visibility(self, queue_url: str, message, visibility_timeout: int) -> bool:
+        try:
+            self.sqs_client.change_message_visibility(
+                QueueUrl=queue_url,
+                ReceiptHandle=message['ReceiptHandle'],
+                VisibilityTimeout=visibility_timeout,
+            )
+            return True
+        except Exception as e:
+            print(f"{self.name} ::: Error changing visibility of message {message.get('MessageId')}: {e}")
+            return False
+
+    def _delete(self, queue_url: str, message):
+        try:
+            self.sqs_client.delete_message(QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'])
+        except Exception as e:
+            print(f"{self.name} ::: Error deleting message {message.get('MessageId')}: {e}")
+
+    def _nack(self, queue_url: str, message, delay_seconds: int):
+        """Hand a message back to the queue, visible again after `delay_seconds`."""
+        self._change_visibility(queue_url, message, delay_seconds)
+
+
+def _run_pool_in_child(queues: List[SQSQueue], workers: int, batch_size: int, wait_time_seconds: int, name: str,
+                       metrics_port: int = 0, pdf_parser_processes: int = 0):
+    """Entry point of a spawned consumer process."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'elexis_dashboard.settings')
+    import django
+    django.setup()
+    from elexis.services.pdf_parsing_service import configure_pdf_parsing, get_pdf_parsing_service
+    configure_pdf_parsing(pdf_parser_processes)
+
+    pool = SQSConsumerPool(queues, workers=workers, batch_size=batch_size,
+                           wait_time_seconds=wait_time_seconds, name=name, metrics_port=metrics_port)
+    # The parent forwards SIGTERM/SIGINT; stop polling and drain on either
+    signal.signal(signal.SIGTERM, lambda *_: pool.stop())
+    signal.signal(signal.SIGINT, lambda *_: pool.stop())
+    pool.run()
+    get_pdf_parsing_service().shutdown()
+
+
+class SQSConsumerProcessPool:
+    """
+    Runs `processes` independent consumer processes, each with its own thread pool,
+    SQS client and DB connections. Dead children are restarted until `stop()` is called.
+    """
+
+    def __init__(self, queues: List[SQSQueue], processes: int = 2, workers_per_process: int = 4,
+                 batch_size: int = MAX_RECEIVE_BATCH_SIZE, wait_time_seconds: int = 20, pdf_parser_processes: int = 0):
+        self.queues = queues
+        self.processes = max(1, processes)
+        self.workers_per_process = max(1, workers_per_process)
+        self.batch_size = batch_size
+        self.wait_time_seconds = wait_time_seconds
+        self.pdf_parser_processes = pdf_parser_processes
+        # boto3 and grpc (Gemini) clients are not fork safe, always start from a clean interpreter
+        self._context = multiprocessing.get_context('spawn')
+        self._children = {}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _start_child(self, index: int):
+        process = self._context.Process(
+            target=_run_pool_in_child,
+            args=(self.queues, self.workers_per_process, self.batch_size,
+                  self.wait_time_seconds, f"sqs-consumer-{index}",
+                  # Each child has its own metrics, on its own port
+                  METRICS_PORT + index if METRICS_PORT else 0,
+                  self.pdf_parser_processes),
+            name=f"sqs-consumer-{index}",
+        )
+        process.start()
+        self._children[index] = process
+        print(f"SQS consumer process {index} started (pid {process.pid})")
+
+    def run(self):
+        # Never hand an open DB connection over to the children
+        connections.close_all()
+        for index in range(self.processes):
+            self._start_child(index)
+
+        while not self._stop_event.wait(5):
+            for index, process in list(self._children.items()):
+                if not process.is_alive():
+                    print(f"SQS consumer process {index} exited with code {process.exitcode}, restarting")
+                    self._start_child(index)
+
+        print("SQS consumer process pool stopping")
+        for process in self._children.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM, children drain in-flight messages
+        for process in self._children.values():
+            process.join()
+        print("SQS consumer process pool stopped")
@@ -0,0 +1,178 @@
+"""
+SQS message handler registry
+Every message type registers a handler together with its own concurrency limit, timeout and retry policy,
+so the consumer can run cheap handlers next to slow LLM bound ones without them queueing behind each other
+"""
+
+import asyncio
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from elexis.services.consumer_metrics import MESSAGES_RETRIED
+from elexis.services.sqs_queues import STANDARD_PRIORITY, SQSQueue, get_queue_url
+
+# Messages published by the interview bot carry no `type`, only the transcript location
+TRANSCRIPT_MESSAGE_TYPE = 'transcript'
+
+# Whether the attempt running in this context is the last one of its retry policy
+_final_attempt: ContextVar[bool] = ContextVar('sqs_handler_final_attempt', default=True)
+
+
+@dataclass
+class RetryPolicy:
+    """How often a failing handler is re-run before the message is given up on"""
+    max_attempts: int = 1
+    backoff_seconds: float = 2
+    backoff_factor: float = 2
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,)
+
+    def delay_for(self, attempt: int) -> float:
+        """Delay before re-running after the given (1-based) failed attempt"""
+        return self.backoff_seconds * (self.backoff_factor ** (attempt - 1))
+
+
+@dataclass
+class MessageHandler:
+    message_type: str
+    func: Callable[[dict], None]
+    max_concurrency: int = 4
+    timeout_seconds: int = 300
+    retry_policy: RetryPolicy = field(default_factory=RetryPolicy)
+    expected_duration_seconds: Optional[int] = None
+    dedup_by_payload: bool = False
+    priority: str = STANDARD_PRIORITY
+    # Coroutine version of `func`, preferred by the asyncio runtime
+    async_func: Optional[Callable[[dict], Awaitable[None]]] = None
+
+
+MESSAGE_HANDLERS: Dict[str, MessageHandler] = {}
+
+
+def register_handler(message_type: str, max_concurrency: int = 4, timeout_seconds: int = 300,
+                     retry_policy: Optional[RetryPolicy] = None, expected_duration_seconds: Optional[int] = None,
+                     dedup_by_payload: bool = False, priority: str = STANDARD_PRIORITY):
+    """
+    Decorator registering `func(message: dict)` as the handler for `message_type`.
+
+    Args:
+        message_type (str): Value of the `type` key of the message.
+        max_concurrency (int): Maximum number of messages of this type processed at once (per consumer process).
+        timeout_seconds (int): Time after which the consumer stops counting the message against its capacity.
+        retry_policy (RetryPolicy): Retries for exceptions raised by the handler.
+        expected_duration_seconds (int): Typical run time of the handler. Messages of this type get this much
+            visibility timeout up front instead of the queue default, then are kept invisible by heartbeats.
+        dedup_by_payload (bool): Skip messages whose payload was already processed, not only redeliveries of
+            the same SQS message. Only for handlers where running the same payload twice is pure waste, and
+            that raise when they fail: a handler that returns is recorded as succeeded, and its payload is
+            then skipped for SQS_DEDUP_TTL_SECONDS.
+        priority (str): Queue the messages of this type are sent to (interactive, standard or bulk).
+    """
+    def decorator(func):
+        MESSAGE_HANDLERS[message_type] = MessageHandler(
+            message_type=message_type,
+            func=func,
+            max_concurrency=max_concurrency,
+            timeout_seconds=timeout_seconds,
+            retry_policy=retry_policy or RetryPolicy(),
+            expected_duration_seconds=expected_duration_seconds,
+            dedup_by_payload=dedup_by_payload,
+            priority=priority,
+        )
+        return func
+    return decorator
+
+
+def register_async_handler(message_type: str):
+    """
+    Decorator registering `async func(message: dict)` as the asyncio runtime's version of the
+    handler already registered for `message_type` (limits and retry policy are shared).
+    """
+    def decorator(func):
+        if message_type not in MESSAGE_HANDLERS:
+            raise ValueError(f"No handler registered for {message_type}, register the sync handler first")
+        MESSAGE_HANDLERS[message_type].async_func = func
+        return func
+    return decorator
+
+
+def get_message_type(message: dict) -> Optional[str]:
+    message_type = message.get("type")
+    if not message_type and message.get("room_url") and message.get("s3_file_url"):
+        return TRANSCRIPT_MESSAGE_TYPE
+    return message_type
+
+
+def resolve_handler(message: dict) -> Optional[MessageHandler]:
+    return MESSAGE_HANDLERS.get(get_message_type(message))
+
+
+def get_message_priority(message_type: str) -> str:
+    handler = MESSAGE_HANDLERS.get(message_type)
+    return handler.priority if handler else STANDARD_PRIORITY
+
+
+def is_final_attempt() -> bool:
+    """
+    Whether a failure of the running handler gives the message up. Handlers raise on every failure so the
+    retry policy and the message ledger see it, but count it (e.g. on an upload's progress) only once.
+    """
+    return _final_attempt.get()
+
+
+def get_queue_slots(queue: SQSQueue, queues: List[SQSQueue], workers: int) -> int:
+    """
+    Messages a consumer with `workers` holds at once from `queue`: its share by poll weight, but never less
+    than the max_concurrency of a handler routed to it, so a low weight queue does not cap its handlers
+    below their own limit (generate_embedding needs a full embedding batch of messages in flight).
+    """
+    share = round(workers * queue.weight / sum(q.weight for q in queues))
+    handler_limits = [handler.max_concurrency for handler in MESSAGE_HANDLERS.values()
+                      if get_queue_url(handler.priority) == queue.url]
+    return max(1, share, *handler_limits)
+
+
+def run_handler(handler: MessageHandler, message: dict):
+    """Run the handler, re-running it according to its retry policy. Re-raises the last error."""
+    policy = handler.retry_policy
+    attempt = 1
+    while True:
+        token = _final_attempt.set(attempt >= policy.max_attempts)
+        try:
+            return handler.func(message)
+        except policy.retry_on as e:
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay_for(attempt)
+            print(f"SQS handler {handler.message_type} ::: attempt {attempt}/{policy.max_attempts} failed: {e}. Retrying in {delay}s")
+            MESSAGES_RETRIED.inc(message_type=handler.message_type)
+            time.sleep(delay)
+            attempt += 1
+        finally:
+            _final_attempt.reset(token)
+
+
+async def arun_handler(handler: MessageHandler, message: dict, run_sync: Callable):
+    """
+    Async `run_handler`. Awaits the handler's coroutine version if it has one, otherwise runs the sync
+    handler through `run_sync` (e.g. in an executor thread). Re-raises the last error.
+    """
+    policy = handler.retry_policy
+    attempt = 1
+    while True:
+        token = _final_attempt.set(attempt >= policy.max_attempts)
+        try:
+            if handler.async_func:
+                return await handler.async_func(message)
+            return await run_sync(handler.func, message)
+        except policy.retry_on as e:
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay_for(attempt)
+            print(f"SQS handler {handler.message_type} ::: attempt {attempt}/{policy.max_attempts} failed: {e}. Retrying in {delay}s")
+            MESSAGES_RETRIED.inc(message_type=handler.message_type)
+            await asyncio.sleep(delay)
+            attempt += 1
+        finally:
+            _final_attempt.reset(token)
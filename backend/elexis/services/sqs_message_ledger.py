@@ -0,0 +1,91 @@
+"""
+Processed SQS message ledger
+Redelivered messages (same MessageId) and, for handlers that opt in, duplicate messages (same payload)
+are recognised with one indexed lookup before the handler runs, so they never reach Gemini or Pinecone again.
+"""
+
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from elexis.models import ProcessedSQSMessage
+
+# How long a finished message is remembered
+LEDGER_TTL_SECONDS = int(os.getenv("SQS_DEDUP_TTL_SECONDS", 24 * 60 * 60))
+
+# claim_message outcomes
+CLAIMED = 'claimed'
+ALREADY_PROCESSED = 'already_processed'
+IN_PROGRESS = 'in_progress'
+
+
+def get_payload_hash(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_dedup_key(handler, message_id: str, payload_hash: str) -> str:
+    return f"payload:{payload_hash}" if handler.dedup_by_payload else f"message:{message_id}"
+
+
+def claim_message(handler, message_id: str, payload: dict):
+    """
+    Record that this consumer starts processing the message.
+
+    Returns (outcome, entry): CLAIMED with the ledger entry to pass to `record_outcome`,
+    ALREADY_PROCESSED if the message succeeded before, or IN_PROGRESS if another consumer holds it.
+    A failed or expired entry is claimed again.
+    """
+    payload_hash = get_payload_hash(payload)
+    dedup_key = get_dedup_key(handler, message_id, payload_hash)
+    now = timezone.now()
+    # A consumer that died mid-message must not block it forever
+    processing_expires_at = now + timedelta(seconds=handler.timeout_seconds)
+
+    with transaction.atomic():
+        entry = ProcessedSQSMessage.objects.select_for_update().filter(dedup_key=dedup_key).first()
+        if entry is None:
+            try:
+                with transaction.atomic():
+                    entry = ProcessedSQSMessage.objects.create(
+                        dedup_key=dedup_key,
+                        message_id=message_id,
+                        payload_hash=payload_hash,
+                        message_type=handler.message_type,
+                        expires_at=processing_expires_at,
+                    )
+            except IntegrityError:
+                # Another consumer claimed it between our lookup and insert
+                return IN_PROGRESS, None
+            return CLAIMED, entry
+
+        if entry.expires_at > now:
+            if entry.status == 'succeeded':
+                return ALREADY_PROCESSED, entry
+            if entry.status == 'processing':
+                return IN_PROGRESS, entry
+
+        entry.message_id = message_id
+        entry.payload_hash = payload_hash
+        entry.status = 'processing'
+        entry.attempts += 1
+        entry.error_message = None
+        entry.expires_at = processing_expires_at
+        entry.save(update_fields=['message_id', 'payload_hash', 'status', 'attempts', 'error_message',
+                                  'expires_at', 'modified_date'])
+        return CLAIMED, entry
+
+
+def record_outcome(entry: ProcessedSQSMessage, succeeded: bool, error: Exception = None):
+    entry.status = 'succeeded' if succeeded else 'failed'
+    entry.error_message = None if succeeded else str(error)
+    entry.expires_at = timezone.now() + timedelta(seconds=LEDGER_TTL_SECONDS)
+    entry.save(update_fields=['status', 'error_message', 'expires_at', 'modified_date'])
+
+
+def purge_expired_entries() -> int:
+    deleted, _ = ProcessedSQSMessage.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
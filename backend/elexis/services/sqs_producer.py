@@ -0,0 +1,216 @@
+"""
+Process wide SQS producer
+Reuses one boto3 client and sends buffered messages with send_message_batch (10 per call).
+The buffer is flushed when it is full, when the flush timer fires, or explicitly via flush().
+Messages published inside a transaction are only buffered once the transaction commits.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import boto3
+from django.db import transaction
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# SQS limits for send_message_batch
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+# SQS limit for DelaySeconds
+MAX_DELAY_SECONDS = 900
+
+
+class SQSSendError(Exception):
+    """Raised on the future of a message SQS did not accept"""
+
+    def __init__(self, message_type: str, code: str, reason: str, sender_fault: bool):
+        super().__init__(f"SQS rejected {message_type} message: {code} {reason}")
+        self.message_type = message_type
+        self.code = code
+        self.reason = reason
+        self.sender_fault = sender_fault
+
+
+class _PendingMessage:
+    def __init__(self, queue_url: str, message_type: str, body: str, delay_seconds: int = 0):
+        self.entry_id = uuid.uuid4().hex
+        self.queue_url = queue_url
+        self.message_type = message_type
+        self.body = body
+        self.delay_seconds = delay_seconds
+        self.future = Future()
+        self.attempts = 0
+
+
+class SQSProducer:
+    """
+    Batching SQS producer, one per process.
+
+    `send()` returns a Future that resolves to the SQS MessageId, or fails with SQSSendError
+    once the message was rejected `max_attempts` times, so callers can retry or record the failure.
+    Failed entries are retried after an exponential backoff, starting at `retry_delay` seconds.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        """
+        Implements a Singleton pattern.
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(SQSProducer, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.default_queue_url = os.getenv("SQS_QUEUE_URL")
+        self.flush_interval = float(os.getenv("SQS_PRODUCER_FLUSH_INTERVAL", 0.5))
+        self.max_attempts = 3
+        self.retry_delay = 0.1
+        self.backoff_factor = 2
+        self._client = None
+        self._buffer: List[_PendingMessage] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    @property
+    def client(self):
+        """boto3 client shared by every send of this process, created on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = boto3.client(
+                        'sqs',
+                        endpoint_url=os.getenv("AWS_SQS_ENDPOINT"),
+                        region_name=os.getenv("AWS_REGION_NAME"),
+                        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+                    )
+        return self._client
+
+    def send(self, message_type: str, data: object, queue_url: str = None, delay_seconds: int = 0) -> Optional[Future]:
+        """
+        Buffer a message for sending. Inside a transaction the message is only buffered on commit
+        (and dropped on rollback), so consumers never see rows that are not committed yet; no Future is
+        returned then (None), as one would never resolve if the transaction rolled back.
+        With `delay_seconds` (at most 15 minutes) SQS only delivers the message after that long.
+        """
+        # The message body should be a string, so we serialize the data to JSON
+        body = json.dumps({
+            'type': message_type,
+            'data': data
+        })
+        pending = _PendingMessage(
+            queue_url or self.default_queue_url, message_type, body, min(int(delay_seconds), MAX_DELAY_SECONDS)
+        )
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._enqueue(pending))
+            return None
+        self._enqueue(pending)
+        return pending.future
+
+    def _enqueue(self, pending: _PendingMessage):
+        with self._lock:
+            self._buffer.append(pending)
+            is_full = len(self._buffer) >= MAX_BATCH_ENTRIES
+            if not is_full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if is_full:
+            self.flush()
+
+    def flush(self):
+        """Send everything buffered so far. Blocks until SQS answered for every batch."""
+        with self._lock:
+            pending, self._buffer = self._buffer, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        delay = self.retry_delay
+        while pending:
+            retry = []
+            for queue_url, messages in self._group_by_queue(pending).items():
+                for batch in self._split_into_batches(messages):
+                    retry.extend(self._send_batch(queue_url, batch))
+            pending = retry
+            if pending:
+                print(f"Retrying {len(pending)} SQS messages in {delay} seconds")
+                time.sleep(delay)
+                delay *= self.backoff_factor
+
+    @staticmethod
+    def _group_by_queue(messages: List[_PendingMessage]) -> Dict[str, List[_PendingMessage]]:
+        grouped = {}
+        for message in messages:
+            grouped.setdefault(message.queue_url, []).append(message)
+        return grouped
+
+    @staticmethod
+    def _split_into_batches(messages: List[_PendingMessage]):
+        batch, batch_bytes = [], 0
+        for message in messages:
+            size = len(message.body.encode('utf-8'))
+            if batch and (len(batch) == MAX_BATCH_ENTRIES or batch_bytes + size > MAX_BATCH_BYTES):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(message)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _entry(message: _PendingMessage) -> dict:
+        entry = {'Id': message.entry_id, 'MessageBody': message.body}
+        if message.delay_seconds:
+            entry['DelaySeconds'] = message.delay_seconds
+        return entry
+
+    def _send_batch(self, queue_url: str, batch: List[_PendingMessage]) -> List[_PendingMessage]:
+        """Send one batch, resolve the futures and return the messages worth another attempt."""
+        by_id = {message.entry_id: message for message in batch}
+        for message in batch:
+            message.attempts += 1
+        try:
+            response = self.client.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[self._entry(message) for message in batch]
+            )
+        except Exception as e:
+            print(f"Error sending message batch to SQS: {e}")
+            retry = [message for message in batch if message.attempts < self.max_attempts]
+            for message in batch:
+                if message.attempts >= self.max_attempts:
+                    message.future.set_exception(SQSSendError(message.message_type, 'RequestFailed', str(e), False))
+            return retry
+
+        for success in response.get('Successful', []):
+            message = by_id[success['Id']]
+            message.future.set_result(success['MessageId'])
+            print(f"Message sent to SQS queue with MessageId: {success['MessageId']}")
+
+        retry = []
+        for failure in response.get('Failed', []):
+            message = by_id[failure['Id']]
+            # Sender faults (malformed message, too large, ...) will fail again, don't retry them
+            if not failure.get('SenderFault') and message.attempts < self.max_attempts:
+                retry.append(message)
+                continue
+            print(f"Error sending {message.message_type} message to SQS: {failure.get('Code')} {failure.get('Message')}")
+            message.future.set_exception(SQSSendError(
+                message.message_type, failure.get('Code'), failure.get('Message'), failure.get('SenderFault', False)
+            ))
+        return retry
+
+
+sqs_producer = SQSProducer()
@@ -0,0 +1,62 @@
+"""
+SQS priority queues
+Message types are routed to an interactive, standard or bulk queue so that work a recruiter is waiting on
+(interview transcripts) never queues behind bulk imports. Queues that are not configured fall back to
+SQS_QUEUE_URL, so a single queue deployment keeps working unchanged.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INTERACTIVE_PRIORITY = 'interactive'
+STANDARD_PRIORITY = 'standard'
+BULK_PRIORITY = 'bulk'
+PRIORITIES = (INTERACTIVE_PRIORITY, STANDARD_PRIORITY, BULK_PRIORITY)
+
+# Share of the consumer's workers each queue gets
+DEFAULT_POLL_WEIGHTS = {
+    INTERACTIVE_PRIORITY: 6,
+    STANDARD_PRIORITY: 3,
+    BULK_PRIORITY: 1,
+}
+
+
+@dataclass
+class SQSQueue:
+    priority: str
+    url: str
+    weight: int
+
+
+def get_queue_url(priority: str) -> str:
+    """
+    SQS_<PRIORITY>_QUEUE_URL, or SQS_QUEUE_URL when that is not set.
+    The interview bot publishes transcripts to SQS_QUEUE_URL, so interactive defaults to it.
+    """
+    return os.getenv(f"SQS_{priority.upper()}_QUEUE_URL") or os.getenv("SQS_QUEUE_URL")
+
+
+def get_poll_weight(priority: str) -> int:
+    return max(1, int(os.getenv(f"SQS_{priority.upper()}_POLL_WEIGHT", DEFAULT_POLL_WEIGHTS[priority])))
+
+
+def get_consumer_queues() -> List[SQSQueue]:
+    """
+    The queues a consumer polls, highest priority first. Priorities sharing a queue URL are
+    merged into one queue (with their weights added up) so it is not polled twice.
+    """
+    queues = {}
+    for priority in PRIORITIES:
+        url = get_queue_url(priority)
+        if not url:
+            continue
+        if url in queues:
+            queues[url].weight += get_poll_weight(priority)
+        else:
+            queues[url] = SQSQueue(priority=priority, url=url, weight=get_poll_weight(priority))
+    return list(queues.values())
@@ -4,14 +4,39 @@ Handles all resume uploads (single manual, single file, bulk) through a consiste
 """
 
 import uuid
-import tempfile
+import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from typing import List, Dict, Optional
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
 from django.utils import timezone
-from elexis.models import ResumeUploadTracker, Candidate, Job, JobMatchingResumeScore
+from django.utils.text import get_valid_filename
+from elexis.models import ResumeUploadTracker, ResumeUploadItem, Candidate, Job, JobMatchingResumeScore
 from elexis.services.resume_parser import extract_resume_data
+from elexis.services.resume_text_store import store_extraction
 from elexis.services.gemini_batch_service import GeminiBatchService
-from elexis.sqs_consumer import add_message_to_sqs_queue
+from elexis.sqs_consumer import add_message_to_sqs_queue, queue_direct_bulk_upload_expiry
+from elexis.services.sqs_queues import STANDARD_PRIORITY
+
+# Direct uploads: the browser sends the files to S3 itself, so they are only limited by the workers
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 5000))
+BULK_UPLOAD_MAX_FILE_BYTES = int(os.getenv("BULK_UPLOAD_MAX_FILE_BYTES", 20 * 1024 * 1024))
+BULK_UPLOAD_URL_EXPIRES_SECONDS = int(os.getenv("BULK_UPLOAD_URL_EXPIRES_SECONDS", 3600))
+# An upload not finalized this long after its URLs expired is failed
+BULK_UPLOAD_FINALIZE_GRACE_SECONDS = int(os.getenv("BULK_UPLOAD_FINALIZE_GRACE_SECONDS", 900))
+# Files of an upload through the API stored in S3 at the same time
+BULK_UPLOAD_S3_CONCURRENCY = 8
+
+
+def _bulk_upload_s3_key(tracker, index, name):
+    """S3 key of a file of a bulk upload, prefixed with its index so files with the same name do not collide"""
+    try:
+        filename = get_valid_filename(name)
+    except SuspiciousFileOperation:
+        filename = "resume.pdf"
+    return f"bulk_uploads/{tracker.batch_job_id}/{index:05d}_{filename}"
 
 
 class UnifiedResumeProcessor:
@@ -59,11 +84,11 @@ class UnifiedResumeProcessor:
                 
                 # Queue for AI evaluation if there's a resume
                 if candidate.resume:
-                    add_message_to_sqs_queue(type='ai_job_resume_evaluation', data={
+                    add_message_to_sqs_queue(type='ai_job_resume_evaluation', priority=STANDARD_PRIORITY, data={
                         "id": str(job_matching_score.id),
                     })
                     # Queue for Gemini embedding generation
-                    add_message_to_sqs_queue(type='generate_embedding', data={
+                    add_message_to_sqs_queue(type='generate_embedding', priority=STANDARD_PRIORITY, data={
                         "candidate_id": str(candidate.id),
                         "batch_job_id": str(tracker.batch_job_id),
                         "organization_namespace": f"{organization.org_name}_{organization.id}"
@@ -103,22 +128,14 @@ class UnifiedResumeProcessor:
             
             # Extract data from resume if needed
             if resume_file:
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                    for chunk in resume_file.chunks():
-                        temp_file.write(chunk)
-                    temp_file_path = temp_file.name
-                
-                try:
-                    extracted_data = extract_resume_data(temp_file_path)
-                    # Update candidate data with extracted info if not provided
-                    if not candidate_data.get('name') and extracted_data.name:
-                        candidate_data['name'] = extracted_data.name
-                    if not candidate_data.get('email') and extracted_data.email:
-                        candidate_data['email'] = extracted_data.email
-                    if not candidate_data.get('phone_number') and extracted_data.phone:
-                        candidate_data['phone_number'] = extracted_data.phone
-                finally:
-                    os.unlink(temp_file_path)
+                extracted_data = extract_resume_data(resume_file)
+                # Update candidate data with extracted info if not provided
+                if not candidate_data.get('name') and extracted_data.name:
+                    candidate_data['name'] = extracted_data.name
+                if not candidate_data.get('email') and extracted_data.email:
+                    candidate_data['email'] = extracted_data.email
+                if not candidate_data.get('phone_number') and extracted_data.phone:
+                    candidate_data['phone_number'] = extracted_data.phone
             
             # Create candidate with resume
             candidate_data['resume'] = resume_file
@@ -129,13 +146,9 @@ class UnifiedResumeProcessor:
                 recruiter=user,
                 **candidate_data
             )
-            
-            # Queue for Gemini embedding generation
-            add_message_to_sqs_queue(type='generate_embedding', data={
-                "candidate_id": str(candidate.id),
-                "batch_job_id": str(tracker.batch_job_id),
-                "organization_namespace": f"{organization.org_name}_{organization.id}"
-            })
+            if resume_file:
+                # Evaluations and embeddings read the text from the store instead of extracting it again
+                store_extraction(candidate.resume_content_hash, text=extracted_data.raw_text)
             
             # If associated with a job, create JobMatchingResumeScore
             if job_id:
@@ -149,7 +162,7 @@ class UnifiedResumeProcessor:
                 )
                 
                 # Queue for AI evaluation after embedding is ready
-                add_message_to_sqs_queue(type='ai_job_resume_evaluation', data={
+                add_message_to_sqs_queue(type='ai_job_resume_evaluation', priority=STANDARD_PRIORITY, data={
                     "id": str(job_matching_score.id),
                 })
                 
@@ -158,6 +171,13 @@ class UnifiedResumeProcessor:
                     "jobId": str(job.id)
                 })
             
+            # Queue for Gemini embedding generation, after the score so it gets scored with the batch
+            add_message_to_sqs_queue(type='generate_embedding', priority=STANDARD_PRIORITY, data={
+                "candidate_id": str(candidate.id),
+                "batch_job_id": str(tracker.batch_job_id),
+                "organization_namespace": f"{organization.org_name}_{organization.id}"
+            })
+            
             tracker.update_progress(processed=1, successful=1, failed=0)
             tracker.complete_processing()
             
@@ -193,36 +213,67 @@ class UnifiedResumeProcessor:
         bucket_name = os.getenv('AWS_STORAGE_BUCKET_NAME', 'elexis-bucket')
         print(f"📦 Using S3 bucket: {bucket_name}")
         uploaded_files = []
+        upload_items = []
+        s3_keys_by_hash = {}
         
-        # Upload files to S3 and store metadata
-        for i, resume_file in enumerate(resume_files):
+        # Read and hash the files, a copy of a file of this upload is stored once and the worker
+        # attaches it to the same candidate
+        read_files = []
+        for resume_file in resume_files:
             try:
-                # Create unique S3 key for this file
-                s3_key = f"bulk_uploads/{tracker.batch_job_id}/{resume_file.name}"
-                
-                # Read file content
                 file_content = resume_file.read()
-                
-                # Upload to S3
-                if upload_file_to_s3(bucket_name, s3_key, file_content, resume_file.content_type):
-                    file_metadata = {
-                        'name': resume_file.name,
-                        's3_bucket': bucket_name,
-                        's3_key': s3_key,
-                        'content_type': resume_file.content_type,
-                        'size': resume_file.size
-                    }
-                    tracker.processing_details['files'].append(file_metadata)
-                    uploaded_files.append(file_metadata)
-                    print(f"✅ Uploaded file {resume_file.name} to S3")
-                else:
-                    print(f"❌ Failed to upload file {resume_file.name} to S3")
-                    
             except Exception as e:
                 print(f"Error processing file {resume_file.name}: {e}")
                 continue
+            content_hash = hashlib.sha256(file_content).hexdigest()
+            if content_hash not in s3_keys_by_hash:
+                s3_keys_by_hash[content_hash] = _bulk_upload_s3_key(tracker, len(read_files), resume_file.name)
+            read_files.append((resume_file, file_content, content_hash))
+
+        # Upload to S3 concurrently, the files are already in memory
+        to_upload = {}
+        for resume_file, file_content, content_hash in read_files:
+            to_upload.setdefault(content_hash, (file_content, resume_file.content_type))
+        with ThreadPoolExecutor(max_workers=BULK_UPLOAD_S3_CONCURRENCY) as executor:
+            uploaded_by_hash = dict(zip(to_upload, executor.map(
+                lambda content_hash: upload_file_to_s3(
+                    bucket_name, s3_keys_by_hash[content_hash], *to_upload[content_hash]
+                ),
+                to_upload
+            )))
+
+        # Store metadata of the uploaded files
+        for resume_file, file_content, content_hash in read_files:
+            if not uploaded_by_hash[content_hash]:
+                print(f"❌ Failed to upload file {resume_file.name} to S3")
+                continue
+            s3_key = s3_keys_by_hash[content_hash]
+            file_metadata = {
+                'name': resume_file.name,
+                's3_bucket': bucket_name,
+                's3_key': s3_key,
+                'content_type': resume_file.content_type,
+                'size': resume_file.size
+            }
+            tracker.processing_details['files'].append(file_metadata)
+            uploaded_files.append(file_metadata)
+            upload_items.append(ResumeUploadItem(
+                tracker=tracker,
+                index=len(upload_items),
+                name=resume_file.name,
+                s3_bucket=bucket_name,
+                s3_key=s3_key,
+                content_type=resume_file.content_type,
+                size=resume_file.size,
+                content_hash=content_hash,
+                created_by=user,
+                modified_by=user,
+            ))
+            print(f"✅ Uploaded file {resume_file.name} to S3")
         
         print(f"✅ Saved {len(uploaded_files)} files to S3 for batch {tracker.batch_job_id}")
+        # One row per file, claimed by the workers of process_bulk_resume_file
+        ResumeUploadItem.objects.bulk_create(upload_items)
         
         # Queue for batch processing with file data
         add_message_to_sqs_queue(type='process_bulk_resumes', data={
@@ -236,6 +287,98 @@ class UnifiedResumeProcessor:
         tracker.save()
         return tracker
     
+    @staticmethod
+    def create_direct_bulk_upload_job(organization, user, files, job_id=None):
+        """
+        Create a bulk upload whose files the client uploads straight to S3.
+        `files` is a list of {"name", "content_type", "size"}. Returns the tracker and one presigned POST
+        per file; nothing is processed until `finalize_direct_bulk_upload`, and the upload fails if that
+        does not happen within BULK_UPLOAD_FINALIZE_GRACE_SECONDS of the URLs expiring.
+        """
+        from elexis.utils.get_file_data_from_s3 import generate_presigned_upload
+
+        # Nothing is left behind when a file cannot be signed
+        with transaction.atomic():
+            tracker = ResumeUploadTracker.objects.create(
+                organization=organization,
+                upload_type='bulk',
+                total_files=len(files),
+                job_id=job_id,
+                created_by=user,
+                modified_by=user,
+                processing_details={
+                    'direct_upload': True,
+                    'processing_timestamp': timezone.now().isoformat()
+                }
+            )
+
+            bucket_name = os.getenv('AWS_STORAGE_BUCKET_NAME', 'elexis-bucket')
+            upload_items = []
+            uploads = []
+            for index, file in enumerate(files):
+                name = os.path.basename(file.get('name') or '') or f"resume_{index + 1}.pdf"
+                content_type = file.get('content_type') or 'application/pdf'
+                s3_key = _bulk_upload_s3_key(tracker, index, name)
+                presigned = generate_presigned_upload(
+                    bucket_name, s3_key, content_type,
+                    max_size=BULK_UPLOAD_MAX_FILE_BYTES, expires_in=BULK_UPLOAD_URL_EXPIRES_SECONDS
+                )
+                if presigned is None:
+                    raise RuntimeError(f"Could not sign the upload of {name}")
+                upload_items.append(ResumeUploadItem(
+                    tracker=tracker,
+                    index=index,
+                    name=name,
+                    s3_bucket=bucket_name,
+                    s3_key=s3_key,
+                    content_type=content_type,
+                    size=file.get('size'),
+                    created_by=user,
+                    modified_by=user,
+                ))
+                uploads.append({
+                    "index": index,
+                    "name": name,
+                    "url": presigned["url"],
+                    "fields": presigned["fields"],
+                })
+
+            # The worker hashes each file after downloading it, for deduplication and the text store
+            ResumeUploadItem.objects.bulk_create(upload_items, batch_size=1000)
+        queue_direct_bulk_upload_expiry(
+            tracker.batch_job_id,
+            timezone.now() + timedelta(seconds=BULK_UPLOAD_URL_EXPIRES_SECONDS + BULK_UPLOAD_FINALIZE_GRACE_SECONDS)
+        )
+        print(f"📦 Signed {len(uploads)} direct uploads for batch {tracker.batch_job_id}")
+        return tracker, uploads
+
+    @staticmethod
+    def finalize_direct_bulk_upload(tracker, user, failed_indexes=None):
+        """
+        Queue the processing of a direct bulk upload once the client uploaded its files.
+        `failed_indexes` are files the client could not upload, they are failed without downloading them.
+        A file that was never uploaded fails in the worker, when it is not found in S3.
+        """
+        if failed_indexes:
+            ResumeUploadItem.objects.filter(
+                tracker=tracker, index__in=failed_indexes, status='pending'
+            ).update(status='failed', error_message="Upload failed", completed_at=timezone.now())
+
+        tracker.processing_details = {
+            **(tracker.processing_details or {}),
+            'finalized_at': timezone.now().isoformat()
+        }
+        tracker.save(update_fields=['processing_details'])
+
+        add_message_to_sqs_queue(type='process_bulk_resumes', data={
+            "batch_job_id": str(tracker.batch_job_id),
+            "organization_id": str(tracker.organization_id),
+            "user_id": str(user.id),
+            "job_id": str(tracker.job_id) if tracker.job_id else None,
+            "file_count": tracker.total_files
+        })
+        return tracker
+
     @staticmethod
     def get_upload_status(batch_job_id):
         """
@@ -250,6 +393,7 @@ class UnifiedResumeProcessor:
                     "processed": tracker.processed_files,
                     "successful": tracker.successful_files,
                     "failed": tracker.failed_files,
+                    "deduplicated": tracker.deduplicated_files,
                     "percentage": tracker.progress_percentage
                 },
                 "upload_type": tracker.upload_type,
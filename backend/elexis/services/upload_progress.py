@@ -0,0 +1,221 @@
+"""
+Push-based resume upload progress
+The tracker update methods publish a small snapshot of the tracker with Postgres NOTIFY (sent when their
+transaction commits, from whichever process made the change). Every web process runs one LISTEN
+connection that fans the snapshots out to the open progress streams of the organization, so a stream
+costs no queries after its initial snapshot, however many files the import has.
+A stream holds a web thread for as long as it is open, so a process serves at most
+UPLOAD_PROGRESS_MAX_STREAMS of them (0 turns streaming off; clients keep polling status/).
+"""
+
+import json
+import os
+import queue
+import select
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+from django.db import connection, transaction
+
+CHANNEL = 'upload_progress'
+
+# Open streams per web process, keep it below the threads of the process (GUNICORN_THREADS)
+UPLOAD_PROGRESS_MAX_STREAMS = int(os.getenv("UPLOAD_PROGRESS_MAX_STREAMS", 0))
+# A stream is closed after this long, clients reconnect (EventSource does so on its own after `retry`)
+UPLOAD_PROGRESS_STREAM_SECONDS = int(os.getenv("UPLOAD_PROGRESS_STREAM_SECONDS", 300))
+# Comment line sent when nothing changed for this long, so proxies do not drop an idle stream
+UPLOAD_PROGRESS_KEEPALIVE_SECONDS = 15
+UPLOAD_PROGRESS_RETRY_MS = 3000
+
+# NOTIFY payloads are limited to 8000 bytes
+MAX_ERROR_MESSAGE_LENGTH = 500
+
+SNAPSHOT_FIELDS = [
+    'upload_type', 'status', 'total_files', 'processed_files', 'successful_files', 'failed_files',
+    'deduplicated_files', 'ai_processed_files', 'ai_successful_files', 'ai_failed_files',
+]
+
+
+def tracker_snapshot(tracker) -> dict:
+    snapshot = {
+        "batch_job_id": str(tracker.batch_job_id),
+        "organization_id": str(tracker.organization_id),
+        **{field: getattr(tracker, field) for field in SNAPSHOT_FIELDS},
+        "progress_percentage": round(tracker.progress_percentage, 1),
+        "ai_progress_percentage": round(tracker.ai_progress_percentage, 1),
+        "error_message": (tracker.error_message or '')[:MAX_ERROR_MESSAGE_LENGTH] or None,
+        "completed_at": tracker.completed_at.isoformat() if tracker.completed_at else None,
+    }
+    return snapshot
+
+
+def publish_progress(tracker):
+    """Publish the tracker's progress to the streams, once the current transaction commits"""
+    snapshot = tracker_snapshot(tracker)
+    if connection.vendor == 'postgresql':
+        # Postgres delivers notifications on commit, and drops them on rollback
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(snapshot)])
+    else:
+        # No NOTIFY: only streams of this process see the change
+        transaction.on_commit(lambda: progress_hub.dispatch(snapshot))
+
+
+class ProgressSubscription:
+    """Snapshots for one stream, filtered on organization (and optionally batches)"""
+
+    def __init__(self, organization_id: str, batch_job_ids: Optional[Set[str]] = None):
+        self.organization_id = str(organization_id)
+        self.batch_job_ids = batch_job_ids
+        self.queue: "queue.Queue[dict]" = queue.Queue()
+
+    def wants(self, snapshot: dict) -> bool:
+        if snapshot.get("organization_id") != self.organization_id:
+            return False
+        return not self.batch_job_ids or snapshot.get("batch_job_id") in self.batch_job_ids
+
+    def get_updates(self, timeout: float) -> Dict[str, dict]:
+        """
+        Wait up to `timeout` for a snapshot, then take every queued one. Only the latest snapshot of
+        each batch is returned, so a burst of updates becomes one event per batch.
+        """
+        try:
+            snapshot = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return {}
+        latest = {snapshot["batch_job_id"]: snapshot}
+        while True:
+            try:
+                snapshot = self.queue.get_nowait()
+            except queue.Empty:
+                return latest
+            latest[snapshot["batch_job_id"]] = snapshot
+
+
+class ProgressHub:
+    """
+    Fans progress snapshots out to the subscriptions of this process.
+    On Postgres a daemon thread LISTENs on its own connection, started with the first subscription.
+    """
+
+    def __init__(self):
+        self._subscriptions: Set[ProgressSubscription] = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, organization_id: str, batch_job_ids: Optional[Iterable[str]] = None,
+                  max_subscriptions: int = None) -> Optional[ProgressSubscription]:
+        """A new subscription, or None if `max_subscriptions` (UPLOAD_PROGRESS_MAX_STREAMS) are open"""
+        if max_subscriptions is None:
+            max_subscriptions = UPLOAD_PROGRESS_MAX_STREAMS
+        subscription = ProgressSubscription(organization_id, set(batch_job_ids) if batch_job_ids else None)
+        with self._lock:
+            if len(self._subscriptions) >= max_subscriptions:
+                return None
+            self._subscriptions.add(subscription)
+            if connection.vendor == 'postgresql' and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(
+                    target=self._listen, args=(connection.get_connection_params(),),
+                    name="upload-progress-listener", daemon=True,
+                )
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def dispatch(self, snapshot: dict):
+        with self._lock:
+            subscriptions = [subscription for subscription in self._subscriptions if subscription.wants(snapshot)]
+        for subscription in subscriptions:
+            subscription.queue.put(snapshot)
+
+    def _listen(self, connection_params: dict):
+        import psycopg2
+
+        while True:
+            listener = None
+            try:
+                listener = psycopg2.connect(**connection_params)
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                print(f"Upload progress ::: listening on {CHANNEL}")
+                while True:
+                    if select.select([listener], [], [], UPLOAD_PROGRESS_KEEPALIVE_SECONDS) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        notification = listener.notifies.pop(0)
+                        try:
+                            self.dispatch(json.loads(notification.payload))
+                        except ValueError:
+                            print(f"Upload progress ::: invalid payload: {notification.payload[:200]}")
+            except Exception as e:
+                # Streams stay open and resume receiving once the listener reconnected
+                print(f"Upload progress ::: listener error, reconnecting: {e}")
+                time.sleep(5)
+            finally:
+                if listener is not None:
+                    try:
+                        listener.close()
+                    except Exception:
+                        pass
+
+
+progress_hub = ProgressHub()
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _progress_events(subscription: ProgressSubscription, initial: Iterable[dict], duration_seconds: int) -> Iterator[str]:
+    yield f"retry: {UPLOAD_PROGRESS_RETRY_MS}\n\n"
+    last: Dict[str, dict] = {}
+    for snapshot in initial:
+        last[snapshot["batch_job_id"]] = snapshot
+        yield _event('snapshot', snapshot)
+    # Updates come from the hub, the stream does not need its DB connection while it waits for them
+    connection.close()
+
+    deadline = time.monotonic() + duration_seconds
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        updates = subscription.get_updates(min(remaining, UPLOAD_PROGRESS_KEEPALIVE_SECONDS))
+        if not updates:
+            yield ": keepalive\n\n"
+            continue
+        for batch_job_id, snapshot in updates.items():
+            previous = last.get(batch_job_id)
+            last[batch_job_id] = snapshot
+            if previous is None:
+                yield _event('snapshot', snapshot)
+                continue
+            changes = {key: value for key, value in snapshot.items() if previous.get(key) != value}
+            if changes:
+                yield _event('progress', {"batch_job_id": batch_job_id, **changes})
+
+
+class ProgressStream:
+    """
+    Server-sent events: a `snapshot` event per tracker, then `progress` events carrying only the fields
+    that changed since the last event of that batch. StreamingHttpResponse calls `close()` when the
+    response ends, whether or not it was iterated, which unsubscribes.
+    """
+
+    def __init__(self, subscription: ProgressSubscription, initial: Iterable[dict],
+                 duration_seconds: int = UPLOAD_PROGRESS_STREAM_SECONDS):
+        self.subscription = subscription
+        self._events = _progress_events(subscription, initial, duration_seconds)
+
+    def __iter__(self) -> Iterator[str]:
+        return self._events
+
+    def close(self):
+        self._events.close()
+        progress_hub.unsubscribe(self.subscription)
@@ -1,9 +1,13 @@
 from elexis.models import Interview, Snapshots, JobRequirement , JobRequirementEvaluation, JobMatchingResumeScore, Job, Candidate, SuggestedCandidates
-from elexis.models import ResumeUploadTracker, Organization, Recruiter
-from elexis.utils.get_file_data_from_s3 import get_file_data_from_s3, put_dict_as_json_to_s3
-from elexis.utils.summary_generation import generate_summary, experience_information_generation, extract_text_from_pdf
+from elexis.models import ResumeUploadTracker, ResumeUploadItem, GeminiBatchJob, Organization, Recruiter
+from elexis.utils.get_file_data_from_s3 import get_file_data_from_s3, get_file_bytes_from_s3, put_dict_as_json_to_s3
+from elexis.utils.summary_generation import generate_summary
+from elexis.services.resume_text_store import get_resume_text, aget_resume_text, get_resume_experience, store_texts
 from elexis.serializers import JobRequirementSerializer, AiJdResumeMatchingResponseSerializer
-from django.db import transaction
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
 from elexis.utils.convert_transcript_format import convert
 from elexis.dto.Ai_JobResume_Matching_Evaluation_Dto import AiJdResumeMatchingResponse
 import boto3
@@ -11,16 +15,28 @@ import json
 import time
 import os
 import uuid
+import hashlib
 from .services.pinecone_service import pinecone_client
 from elexis.services.QueryGemini import GeminiClient
 from elexis.prompts.jobMatchingResume import getJobResumeMatchingPrompt
 from dotenv import load_dotenv
 import os
 import traceback
-from django.core.files.uploadedfile import InMemoryUploadedFile
-from io import BytesIO
-import tempfile
-from elexis.services.resume_parser import extract_resume_data
+from django.core.files.base import ContentFile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+from elexis.services.resume_parser import (
+    extract_text_from_local_pdf, extract_resumes_data_from_texts, extracted_resume_data_from_batch
+)
+from elexis.services.pdf_parsing_service import get_pdf_parsing_service
+from elexis.services.gemini_batch_service import gemini_batch_service, GeminiBatchQuotaError, is_quota_error
+from elexis.services.sqs_producer import sqs_producer
+from elexis.services.rank_scheduler import RankScheduler, RANK_MAX_DELAY_SECONDS
+from elexis.services.resume_embedding_worker import EmbeddingBatcher, EmbeddingBatchResult, EMBEDDING_BATCH_SIZE
+from elexis.services.sqs_handler_registry import register_handler, register_async_handler, resolve_handler, run_handler, get_message_priority, RetryPolicy, TRANSCRIPT_MESSAGE_TYPE, is_final_attempt
+from elexis.services.async_dependencies import run_orm, dependency_limit, GEMINI
+from elexis.services.sqs_queues import get_queue_url, get_consumer_queues, INTERACTIVE_PRIORITY, STANDARD_PRIORITY, BULK_PRIORITY
 
 load_dotenv()
 
@@ -30,456 +46,961 @@ SQS_QUEUE_URL = os.getenv("SQS_QUEUE_URL")
 AWS_REGION_NAME = os.getenv("AWS_REGION_NAME")
 AWS_SQS_ENDPOINT=os.getenv("AWS_SQS_ENDPOINT")
 AWS_TRANSCRIPT_BUCKET_NAME=os.getenv("AWS_TRANSCRIPT_BUCKET_NAME")
+# Files of bulk uploads processed at once per consumer process
+BULK_FILE_CONCURRENCY = int(os.getenv("BULK_FILE_CONCURRENCY", 8))
+# Files of a bulk upload per process_bulk_resume_file message, written with one set of bulk inserts
+BULK_FILE_CHUNK_SIZE = int(os.getenv("BULK_FILE_CHUNK_SIZE", 20))
+# Files of a chunk downloaded and extracted at the same time
+BULK_CHUNK_WORKERS = int(os.getenv("BULK_CHUNK_WORKERS", 4))
+# Bulk uploads of at least this many files are extracted with Gemini batch jobs (batch pricing, and no worker
+# waits for Gemini); 0 disables them
+GEMINI_BATCH_MIN_FILES = int(os.getenv("GEMINI_BATCH_MIN_FILES", 200))
+# Time between two polls of a batch job (an SQS delay, so at most 900)
+GEMINI_BATCH_POLL_SECONDS = int(os.getenv("GEMINI_BATCH_POLL_SECONDS", 300))
+# A job still running after this long is cancelled, and its files are extracted directly
+GEMINI_BATCH_MAX_WAIT_HOURS = int(os.getenv("GEMINI_BATCH_MAX_WAIT_HOURS", 24))
 
-def add_message_to_sqs_queue(type: str , data: object):
+
+class GeminiResponseError(Exception):
+    """Gemini gave no usable answer; raised so the handler's retry policy and the message ledger see the failure"""
+
+def add_message_to_sqs_queue(type: str , data: object, priority: str = None, delay_seconds: int = 0):
     """
-    Sends a message to the SQS queue with the ID of the score to be updated.
+    Queues a message for the SQS queue of its priority (by default the one its handler is registered with).
+    Messages are sent in batches by the process wide producer; inside a transaction they are only sent once it commits.
+    `delay_seconds` (up to 900) postpones its delivery, for polling without holding a worker.
+    Returns a Future resolving to the SQS MessageId (or raising SQSSendError) for callers that need to retry,
+    None inside a transaction.
     """
-    sqs_client = boto3.client(
-        'sqs',
-        endpoint_url=AWS_SQS_ENDPOINT,
-        region_name=AWS_REGION_NAME,
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-    )
+    return sqs_producer.send(type, data, queue_url=get_queue_url(priority or get_message_priority(type)),
+                             delay_seconds=delay_seconds)
+
+def start_sqs_consumer(workers: int = 1):
+    """
+    Function to start the SQS consumer inside the current process.
+    Only used when SQS_CONSUMER_IN_WEB is enabled; the dedicated runtime is `manage.py run_consumer`.
+    """
+    from elexis.services.sqs_consumer_pool import SQSConsumerPool
+
+    print("SQS Consumer started...")
+    SQSConsumerPool(get_consumer_queues(), workers=workers).run()
 
-    # The message body should be a string, so we serialize the data to JSON
-    message_data = {
-        'type': type,
-        'data': data
-    }
 
+def process_message(message_body):
+    """
+    Process the SQS message by dispatching it to the handler registered for its type.
+    """
     try:
-        response = sqs_client.send_message(
-            QueueUrl=SQS_QUEUE_URL,
-            MessageBody=json.dumps(message_data)
-        )
-        print(f"Message sent to SQS queue with MessageId: {response['MessageId']}")
+        message = json.loads(message_body)
+    except json.JSONDecodeError:
+        print(f"Invalid message format: {message_body}")
+        return
+
+    handler = resolve_handler(message)
+    if not handler:
+        print(f"SQS_Consumer :: process_message:: No handler registered for message: {message}")
+        return
+    try:
+        run_handler(handler, message)
     except Exception as e:
-        print(f"Error sending message to SQS: {e}")
+        print(f"Unexpected error processing message: {e}")
+
+
+@register_handler('job_resume_matching_score', max_concurrency=8, timeout_seconds=120,
+                  retry_policy=RetryPolicy(max_attempts=2), dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_job_resume_matching_score(message):
+    print(f"SQS_Consumer :: process_message:: job_resume_matching_score",  message)
+    updateJobResumeMatchingScore(id= message["data"]["id"])
+
+
+@register_handler('proctor', max_concurrency=8, timeout_seconds=30,
+                  retry_policy=RetryPolicy(max_attempts=3, backoff_seconds=1), priority=INTERACTIVE_PRIORITY)
+def handle_proctor(message):
+    room_url = message.get("room_url")
+    interview = Interview.objects.filter(meeting_room=room_url).first()
+    if not interview :
+        print(f"SQS_Consumer :: process_message:: No matching interview found for meeting_room : {room_url}")
+        return
+    snapshot = Snapshots.objects.create(
+    interview=interview,
+    video=[message.get("video_url")])
+    if snapshot:
+        print(f"Snapshot details updated for {interview.id}")
+
+
+# Handlers wait for the coalesced pass of the rank scheduler; keep the lane small so waiting
+# rank messages never hold most of the consumer's intake slots
+@register_handler('rank-resumes', max_concurrency=4, timeout_seconds=int(RANK_MAX_DELAY_SECONDS) + 60,
+                  retry_policy=RetryPolicy(max_attempts=3, backoff_seconds=1), priority=INTERACTIVE_PRIORITY)
+def handle_rank_resumes(message):
+    print('Ranking resumes, SQS consumer.py')
+    jobId = message['data']['jobId']
+    if not jobId:
+        print(f"SQS Consumer ::: Process message. type: rank-resumes ::: message: {message} error: no JobId found")
+        return
+    # The message is only deleted once the pass it was coalesced into has run
+    rank_scheduler.request(jobId).wait(timeout=RANK_MAX_DELAY_SECONDS + 60)
+
+
+# Handlers wait for the batch their candidate was added to, so one lane thread per batch slot
+@register_handler('generate_embedding', max_concurrency=EMBEDDING_BATCH_SIZE, timeout_seconds=600,
+                  expected_duration_seconds=120, retry_policy=RetryPolicy(max_attempts=2, backoff_seconds=5),
+                  dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_generate_embedding(message):
+    print(f"generate_embedding SQS_Consumer :: process_message:: ",  message)
+    candidateId = message["data"].get("candidate_id")
+    if not candidateId:
+        print(f"SQS Consumer ::: Process message. type: generate_embedding ::: message: {message} error: no candidate_id found")
+        return
+    embedding_batcher.request(candidateId).wait(timeout=540)
 
-def start_sqs_consumer():
+
+@register_handler('ai_job_resume_evaluation', max_concurrency=4, timeout_seconds=300, expected_duration_seconds=60,
+                  retry_policy=RetryPolicy(max_attempts=2, backoff_seconds=5), dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_ai_job_resume_evaluation(message):
+    print(f" ai_job_resume_evaluation SQS_Consumer :: process_message:: ",  message)
+    jobResumeMatchingScoreId = message["data"]["id"]
+    if not jobResumeMatchingScoreId:
+        print(f"SQS Consumer ::: Process message. type: ai_job_resume_evaluation ::: message: {message} error: no JobResumeMatchingScoreId found")
+        return
+    evaluateJobResumeMatchingByAi(jobResumeMatchingScoreId, type='ai_job_resume_evaluation',
+                                  tracker_id=message["data"].get("tracker_id"))
+
+
+@register_async_handler('ai_job_resume_evaluation')
+async def ahandle_ai_job_resume_evaluation(message):
+    print(f" ai_job_resume_evaluation SQS_Consumer :: process_message:: ",  message)
+    jobResumeMatchingScoreId = message["data"]["id"]
+    if not jobResumeMatchingScoreId:
+        print(f"SQS Consumer ::: Process message. type: ai_job_resume_evaluation ::: message: {message} error: no JobResumeMatchingScoreId found")
+        return
+    await aevaluateJobResumeMatchingByAi(jobResumeMatchingScoreId, type='ai_job_resume_evaluation',
+                                         tracker_id=message["data"].get("tracker_id"))
+
+
+# Not deduplicated by payload: the suggestions list re-sends the same payloads whenever a job has no suggestions,
+# so the handler skips candidates that already have one instead
+@register_handler('generate_candidate_suggestion', max_concurrency=2, timeout_seconds=300, expected_duration_seconds=120,
+                  retry_policy=RetryPolicy(max_attempts=2, backoff_seconds=5))
+def handle_generate_candidate_suggestion(message):
+    print(f"generate_candidate_suggestion SQS_Consumer :: process_message:: ",  message)
+    jobId = message["data"]["jobId"]
+    candidateId = message["data"]["candidateId"]
+    if not jobId or not candidateId:
+        print(f"SQS Consumer ::: Process message. type: generate_candidate_suggestion ::: message: {message} error: no JobId or candidateId in message")
+        return
+    generate_candidate_suggestions(jobId, candidateId)
+
+
+# Splits the upload into one process_bulk_resume_file message per unfinished item, so the files are processed
+# in parallel by the consumer pool instead of one after the other. Handling it again resumes the upload.
+@register_handler('process_bulk_resumes', max_concurrency=1, timeout_seconds=300, expected_duration_seconds=60,
+                  dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_process_bulk_resumes(message):
+    print(f"process_bulk_resumes SQS_Consumer :: process_message:: ",  message)
+    batch_job_id = message["data"].get("batch_job_id")
+    file_count = message["data"].get("file_count")
+    
+    if not batch_job_id:
+        print(f"SQS Consumer ::: Process message. type: process_bulk_resumes ::: message: {message} error: no batch_job_id found")
+        return
+        
+    try:
+        # Find the tracker using batch_job_id
+        tracker = ResumeUploadTracker.objects.get(batch_job_id=batch_job_id)
+        
+        print(f"Processing bulk upload for tracker {tracker.id} with {file_count} files")
+        if tracker.status == 'pending':
+            tracker.start_processing()
+        elif tracker.status != 'processing':
+            print(f"SQS Consumer ::: bulk upload {batch_job_id} is {tracker.status}, nothing to resume")
+            return
+
+        # Uploads queued before the items existed only list their files in processing_details
+        if not tracker.items.exists():
+            ResumeUploadItem.objects.bulk_create([
+                ResumeUploadItem(
+                    tracker=tracker,
+                    index=index,
+                    name=file_metadata.get('name', f"resume_{index + 1}.pdf"),
+                    s3_bucket=file_metadata.get('s3_bucket'),
+                    s3_key=file_metadata.get('s3_key'),
+                    content_type=file_metadata.get('content_type', 'application/pdf'),
+                    size=file_metadata.get('size'),
+                )
+                for index, file_metadata in enumerate(tracker.processing_details.get('files', []))
+            ], ignore_conflicts=True)
+
+        if not tracker.items.exists():
+            print(f"❌ No uploaded files found in tracker {tracker.id}")
+            tracker.fail_processing("No uploaded files found")
+            return
+
+        if GEMINI_BATCH_MIN_FILES and tracker.items.count() >= GEMINI_BATCH_MIN_FILES:
+            queued = queue_gemini_batch_jobs(tracker, message["data"])
+        else:
+            queued = queue_bulk_upload_items(tracker, message["data"])
+        # Every item may already be finished if the upload is resumed after its last file
+        if not queued and tracker.refresh_file_totals():
+            _on_bulk_upload_files_done(tracker)
+        print(f"✅ Queued {queued} files of bulk upload {batch_job_id}")
+        
+    except Exception as e:
+        print(f"❌ Error processing bulk resumes for batch {batch_job_id}: {e}")
+        
+        traceback.print_exc()
+        
+        # Update tracker with failure
+        try:
+            tracker = ResumeUploadTracker.objects.get(batch_job_id=batch_job_id)
+            tracker.fail_processing(str(e))
+        except:
+            pass
+
+
+def queue_direct_bulk_upload_expiry(batch_job_id, expires_at, check: int = 0):
+    """Fail the direct bulk upload at `expires_at` unless the client finalized it by then"""
+    delay_seconds = int(min(max((expires_at - timezone.now()).total_seconds(), 0), 900))
+    add_message_to_sqs_queue(type='expire_direct_bulk_upload', delay_seconds=delay_seconds, data={
+        "batch_job_id": str(batch_job_id),
+        "expires_at": expires_at.isoformat(),
+        # Every check is a new payload, the earlier ones are in the message ledger
+        "check": check,
+    })
+
+
+# A direct bulk upload that was presigned but never finalized would stay pending forever: once its presigned
+# POSTs expired it is failed. SQS delays are at most 15 minutes, so the message is queued again until then.
+@register_handler('expire_direct_bulk_upload', max_concurrency=1, timeout_seconds=60, expected_duration_seconds=5,
+                  dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_expire_direct_bulk_upload(message):
+    data = message["data"]
+    batch_job_id = data.get("batch_job_id")
+    expires_at = parse_datetime(data.get("expires_at") or "")
+    if not batch_job_id or expires_at is None:
+        print(f"SQS Consumer ::: Process message. type: expire_direct_bulk_upload ::: message: {message} error: no batch_job_id or expires_at found")
+        return
+    if expires_at > timezone.now():
+        queue_direct_bulk_upload_expiry(batch_job_id, expires_at, check=data.get("check", 0) + 1)
+        return
+
+    with transaction.atomic():
+        tracker = ResumeUploadTracker.objects.select_for_update().filter(batch_job_id=batch_job_id).first()
+        if (tracker is None or tracker.status != 'pending'
+                or (tracker.processing_details or {}).get('finalized_at')):
+            return
+        ResumeUploadItem.objects.filter(tracker=tracker, status='pending').update(
+            status='failed', error_message="Upload never finalized", completed_at=timezone.now()
+        )
+        tracker.fail_processing("Upload never finalized before its upload URLs expired")
+    print(f"❌ Bulk upload {batch_job_id} was never finalized, failed it")
+
+
+def queue_bulk_upload_items(tracker, data: dict, items=None) -> int:
     """
-    Function to start the SQS consumer.
-    This runs in a separate thread to avoid blocking the server.
+    Queue process_bulk_resume_file messages for the unfinished items of the upload (or the given items),
+    BULK_FILE_CHUNK_SIZE items per message. `data` is the process_bulk_resumes payload (organization_id,
+    user_id, job_id).
     """
-    sqs_client = boto3.client(
-        'sqs',
-        endpoint_url=AWS_SQS_ENDPOINT,
-        region_name=AWS_REGION_NAME,
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-    )
+    if items is None:
+        items = ResumeUploadItem.unfinished().filter(tracker=tracker)
+    items = list(items.order_by('index').values('id', 'attempts'))
+    for start in range(0, len(items), BULK_FILE_CHUNK_SIZE):
+        chunk = items[start:start + BULK_FILE_CHUNK_SIZE]
+        add_message_to_sqs_queue(type='process_bulk_resume_file', data={
+            "batch_job_id": str(tracker.batch_job_id),
+            "item_ids": [str(item['id']) for item in chunk],
+            # A resumed chunk gets a new payload, the earlier attempt is in the message ledger
+            "attempt": max(item['attempts'] for item in chunk),
+            "organization_id": data.get("organization_id"),
+            "user_id": data.get("user_id"),
+            "job_id": data.get("job_id"),
+        })
+    sqs_producer.flush()
+    return len(items)
 
-    print("SQS Consumer started...")
 
-    while True:
-        try:
-            response = sqs_client.receive_message(
-                QueueUrl=SQS_QUEUE_URL,
-                MaxNumberOfMessages=1,  # Process one message at a time
-                WaitTimeSeconds=10      # Wait for up to 10 seconds for a new message
+def _on_bulk_upload_files_done(tracker):
+    print(f"✅ Bulk upload {tracker.batch_job_id} processed: {tracker.successful_files} successful, {tracker.failed_files} failed")
+    # Queue for ranking update if job exists (like single resume)
+    if tracker.job_id:
+        add_message_to_sqs_queue(type='rank-resumes', data={
+            "jobId": str(tracker.job_id)
+        })
+
+
+# A chunk of the files of a bulk upload: BULK_CHUNK_WORKERS files are downloaded and extracted at a time (two
+# Gemini calls each), then the chunk is written with bulk inserts. Bounded so a large upload does not take
+# every bulk slot: about BULK_FILE_CONCURRENCY files are processed at once.
+@register_handler('process_bulk_resume_file', max_concurrency=max(1, BULK_FILE_CONCURRENCY // BULK_CHUNK_WORKERS),
+                  timeout_seconds=900, expected_duration_seconds=180, dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_process_bulk_resume_file(message):
+    print(f"process_bulk_resume_file SQS_Consumer :: process_message:: ",  message)
+    item_ids = message["data"].get("item_ids")
+    if not item_ids and message["data"].get("item_id"):
+        # Queued before the files were chunked
+        item_ids = [message["data"]["item_id"]]
+    if not item_ids:
+        print(f"SQS Consumer ::: Process message. type: process_bulk_resume_file ::: message: {message} error: no item_ids found")
+        return
+
+    items = ResumeUploadItem.claim_many(item_ids)
+    if not items:
+        print(f"SQS Consumer ::: upload items {item_ids} are finished or claimed by other workers, skipping")
+        return
+    tracker = ResumeUploadTracker.objects.select_related('job').get(pk=items[0].tracker_id)
+
+    claimed = [item for item in items if item.status == 'processing']
+    if claimed:
+        if tracker.status != 'processing':
+            for item in claimed:
+                item.fail(f"Upload is {tracker.status}", save=False)
+            ResumeUploadItem.save_results(claimed)
+        else:
+            organization = Organization.objects.get(id=message["data"].get("organization_id"))
+            user = Recruiter.objects.get(id=message["data"].get("user_id"))
+            process_bulk_resume_files(tracker, claimed, organization, user, tracker.job)
+
+    # Once per chunk
+    if tracker.refresh_file_totals():
+        _on_bulk_upload_files_done(tracker)
+
+
+@dataclass
+class BulkResumeFile:
+    """A claimed upload item while its chunk is processed"""
+    item: ResumeUploadItem
+    content_hash: Optional[str] = None
+    content: Optional[bytes] = None
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    raw_text: Optional[str] = None
+    # Unsaved, its resume already in storage
+    new_candidate: Optional[Candidate] = None
+    # Set when the item is persisted
+    candidate: Optional[Candidate] = None
+    deduplicated: bool = False
+    error: Optional[str] = None
+
+
+def _find_duplicate_candidates(organization, content_hashes) -> dict:
+    """The first candidate of the organization per resume content hash, with one query"""
+    duplicates = {}
+    if content_hashes:
+        candidates = Candidate.objects.filter(
+            organization=organization, resume_content_hash__in=content_hashes
+        ).order_by('created_date')
+        for candidate in candidates:
+            duplicates.setdefault(candidate.resume_content_hash, candidate)
+    return duplicates
+
+
+def _lock_resume_contents(organization, content_hashes):
+    """Serialize the files of an organization with the same content until the transaction ends"""
+    if connection.vendor == 'postgresql' and content_hashes:
+        with connection.cursor() as cursor:
+            # Taken in the same order by every chunk, so two chunks can not deadlock
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext(lock_key)) FROM ("
+                "SELECT lock_key FROM unnest(%s::text[]) AS lock_key ORDER BY lock_key) AS lock_keys",
+                [[f"resume:{organization.id}:{content_hash}" for content_hash in content_hashes]]
             )
 
-            messages = response.get('Messages', [])
-            if not messages:
-                continue  # No new messages
 
-            for message in messages:
-                message_body = message['Body']
-                receipt_handle = message['ReceiptHandle']
-                process_message(message_body)
+def _download_bulk_file(file: BulkResumeFile):
+    try:
+        file.content = get_file_bytes_from_s3(file.item.s3_bucket, file.item.s3_key)
+        file.content_hash = file.content_hash or hashlib.sha256(file.content).hexdigest()
+    except Exception as e:
+        print(f"❌ Error downloading file {file.item.name}: {e}")
+        file.error = str(e)
 
-                # Delete the message from the queue after processing
-                sqs_client.delete_message(
-                    QueueUrl=SQS_QUEUE_URL,
-                    ReceiptHandle=receipt_handle
-                )
-                print(f"Processed and deleted message: {message_body}")
 
-        except Exception as e:
-            print(f"Error consuming SQS messages: {e}")
-            time.sleep(5)  # Retry after a short delay
+def _extract_bulk_file(file: BulkResumeFile):
+    # Filename as fallback
+    file.name = file.item.name.replace('.pdf', '').replace('_', ' ').replace('-', ' ').title()
+    if file.item.extraction:
+        # Extracted by a Gemini batch job, its text is stored already
+        file.name = file.item.extraction.get('name') or file.name
+        file.email = file.item.extraction.get('email')
+        file.phone = file.item.extraction.get('phone')
+        return
+    try:
+        # Straight from the downloaded bytes; the contact details are extracted for the whole chunk
+        file.raw_text = extract_text_from_local_pdf(file.content)
+    except Exception as extract_error:
+        print(f"⚠️  Text extraction failed for {file.item.name}, using filename fallback: {extract_error}")
 
 
-def process_message(message_body):
+def _extract_bulk_contacts(files: List[BulkResumeFile]):
+    """Contact details of the extracted texts of a chunk, several resumes per Gemini request"""
+    files = [file for file in files if not file.item.extraction]
+    if not files:
+        return
+    try:
+        extracted = extract_resumes_data_from_texts({file.content_hash: file.raw_text or "" for file in files})
+    except Exception as extract_error:
+        print(f"⚠️  AI extraction failed for {len(files)} files, using filename fallback: {extract_error}")
+        return
+    for file in files:
+        extracted_data = extracted.get(file.content_hash)
+        # Use extracted data if available, keep fallback otherwise
+        if extracted_data and extracted_data.name:
+            file.name = extracted_data.name
+        if extracted_data and extracted_data.email:
+            file.email = extracted_data.email
+        if extracted_data and extracted_data.phone:
+            file.phone = extracted_data.phone
+        print(f"📋 Using: name={file.name}, email={file.email}, phone={file.phone}")
+
+
+def _store_bulk_resume(file: BulkResumeFile, organization, user):
+    candidate = Candidate(
+        organization=organization,
+        name=file.name,
+        email=file.email,
+        phone_number=file.phone,
+        resume_content_hash=file.content_hash,
+        created_by=user,
+        modified_by=user,
+        recruiter=user
+    )
+    try:
+        # Stored like Candidate.save would, but before the chunk is inserted
+        candidate.resume.save(file.item.name, ContentFile(file.content), save=False)
+        file.new_candidate = candidate
+    except Exception as e:
+        print(f"❌ Error storing file {file.item.name}: {e}")
+        file.error = str(e)
+
+
+def _persist_bulk_files(files: List[BulkResumeFile], tracker, organization, user, job):
     """
-    Process the SQS message and update the Interview instance.
+    Create the candidates and job scores of the files with bulk inserts, queue their AI evaluations and
+    embeddings, and store the outcome of their items, in one transaction (the messages are sent once it
+    commits). A file identical to the resume of an existing candidate is attached to that candidate.
     """
+    for file in files:
+        file.candidate, file.deduplicated = None, False
+
+    with transaction.atomic():
+        content_hashes = {file.content_hash for file in files if not file.error}
+        # An identical file of this (or another) upload may have been processed meanwhile
+        _lock_resume_contents(organization, content_hashes)
+        candidates_by_hash = _find_duplicate_candidates(organization, content_hashes)
+
+        new_candidates = []
+        for file in files:
+            if file.error:
+                continue
+            candidate = candidates_by_hash.get(file.content_hash)
+            if candidate is not None:
+                file.candidate, file.deduplicated = candidate, True
+            elif file.new_candidate is not None:
+                # Copies of this file later in the chunk are attached to its candidate
+                file.candidate = candidates_by_hash[file.content_hash] = file.new_candidate
+                new_candidates.append(file.new_candidate)
+            else:
+                file.error = "The copy of this resume in the upload could not be processed"
+        Candidate.objects.bulk_create(new_candidates)
+        created = {candidate.pk for candidate in new_candidates}
+
+        scores = []
+        if job:
+            # A duplicate may already be scored for the job; new candidates never are
+            scored = set(JobMatchingResumeScore.objects.filter(
+                job=job, candidate__in=[file.candidate for file in files if file.deduplicated]
+            ).values_list('candidate_id', flat=True))
+            for candidate in {file.candidate.pk: file.candidate for file in files if file.candidate}.values():
+                if candidate.pk not in scored:
+                    scores.append(JobMatchingResumeScore(
+                        job=job,
+                        candidate=candidate,
+                        # Set here, bulk_create does not call save()
+                        organization_id=job.organization_id,
+                        score=0,  # Will be calculated after embedding
+                        created_by=user,
+                        modified_by=user
+                    ))
+            JobMatchingResumeScore.objects.bulk_create(scores)
+
+        for score in scores:
+            # Queue for AI evaluation. Only new candidates count towards the AI progress of this upload;
+            # a duplicate may be evaluated for the job too, but it is not one of its successful files.
+            data = {"id": str(score.id)}
+            if score.candidate_id in created:
+                data["tracker_id"] = str(tracker.id)
+            add_message_to_sqs_queue(type='ai_job_resume_evaluation', data=data)
+        # Queue for Gemini embedding generation, after the scores so they get scored with the batch.
+        # A duplicate is scored from its stored embedding, or embedded if that never succeeded.
+        embedded = {score.candidate_id for score in scores} | created
+        for candidate_id in embedded:
+            add_message_to_sqs_queue(type='generate_embedding', data={
+                "candidate_id": str(candidate_id),
+                "batch_job_id": str(tracker.batch_job_id),
+                "organization_namespace": f"{organization.org_name}_{organization.id}"
+            })
+
+        for file in files:
+            if file.error:
+                file.item.fail(file.error, file.content_hash, save=False)
+            else:
+                file.item.succeed(file.candidate, file.content_hash, deduplicated=file.deduplicated, save=False)
+        ResumeUploadItem.save_results([file.item for file in files])
+
+    for file in files:
+        if file.candidate is not None and file.deduplicated:
+            print(f"♻️  {file.item.name} is the resume of candidate {file.candidate.name} (ID: {file.candidate.id}), not processed again")
+        elif file.candidate is not None:
+            print(f"✅ Created candidate: {file.candidate.name} (ID: {file.candidate.id})")
+        if file.new_candidate is not None and file.candidate is not file.new_candidate:
+            # Stored before another worker created the candidate of the same resume
+            file.new_candidate.resume.delete(save=False)
+
+
+def process_bulk_resume_files(tracker, items, organization, user, job):
+    """
+    Process a chunk of upload items: download, extract and store the files concurrently, then create the
+    candidates (and job scores) of the whole chunk with a few bulk queries and finish its items.
+    """
+    files = [BulkResumeFile(item, content_hash=item.content_hash) for item in items]
+    with ThreadPoolExecutor(max_workers=BULK_CHUNK_WORKERS) as executor:
+        # Hashed during the upload: a duplicate is attached without even downloading it
+        duplicates = _find_duplicate_candidates(organization, {file.content_hash for file in files if file.content_hash})
+        to_download = [file for file in files if file.content_hash not in duplicates]
+        list(executor.map(_download_bulk_file, to_download))
+
+        # Direct uploads are hashed now. A copy within the chunk is extracted and stored once.
+        duplicates.update(_find_duplicate_candidates(
+            organization, {file.content_hash for file in to_download if not file.error}
+        ))
+        to_extract = {}
+        for file in to_download:
+            if not file.error and file.content_hash not in duplicates:
+                to_extract.setdefault(file.content_hash, file)
+        # Parsed on the PDF parsing pool: as many files at once as it has worker processes
+        with ThreadPoolExecutor(max_workers=max(BULK_CHUNK_WORKERS, get_pdf_parsing_service().processes)) as extract_executor:
+            list(extract_executor.map(_extract_bulk_file, to_extract.values()))
+        _extract_bulk_contacts(list(to_extract.values()))
+        list(executor.map(lambda file: _store_bulk_resume(file, organization, user), to_extract.values()))
+
+    # Evaluations and embeddings read the text from the store instead of extracting it again
+    store_texts({file.content_hash: file.raw_text for file in to_extract.values() if file.new_candidate is not None})
+    for file in files:
+        # Not needed anymore, the chunk may be large
+        file.content = None
+
     try:
-        message = json.loads(message_body)
+        _persist_bulk_files(files, tracker, organization, user, job)
+    except Exception as chunk_error:
+        # One bad file must not fail the chunk: retry file by file
+        print(f"❌ Error persisting {len(files)} files of bulk upload {tracker.batch_job_id}, retrying one by one: {chunk_error}")
+        traceback.print_exc()
+        for file in files:
+            try:
+                _persist_bulk_files([file], tracker, organization, user, job)
+            except Exception as file_error:
+                print(f"❌ Error processing file {file.item.name}: {file_error}")
+                traceback.print_exc()
+                # Its candidate was rolled back with the transaction
+                file.item.candidate, file.item.deduplicated = None, False
+                file.item.fail(str(file_error), file.content_hash)
 
-        room_url = message.get("room_url")
-        transcript_url = message.get("s3_file_url")
 
-        type = message.get("type")
-        if type=='job_resume_matching_score':
-            print(f"SQS_Consumer :: process_message:: {type}",  message)
-            updateJobResumeMatchingScore(id= message["data"]["id"])
-            return
-        elif type=="proctor":
-            interview = Interview.objects.get(meeting_room=room_url)
-            if not interview :
-                print(f"SQS_Consumer :: process_message:: No matching interview found for meeting_room : {room_url}")
-                return
-            snapshot = Snapshots.objects.create(
-            interview=interview,
-            video=[message.get("video_url")])
-            if snapshot:
-                print(f"Snapshot details updated for {interview.id}")
-                return
-                
-                
-        elif type ==  'rank-resumes':
-            print('Ranking resumes, SQS consumer.py')
-            jobId = message['data']['jobId']
-            if not jobId:
-                print(f"SQS Consumer ::: Process message. type: {type} ::: message: {message} error: no JobId found")
-                return
-            print('record',reRankResumes(jobId=jobId))
-            return
-        elif type == 'ai_job_resume_evaluation':
-            print(f" ai_job_resume_evaluation SQS_Consumer :: process_message:: ",  message)
-            jobResumeMatchingScoreId = message["data"]["id"]
-            if not jobResumeMatchingScoreId:
-                print(f"SQS Consumer ::: Process message. type: {type} ::: message: {message} error: no JobResumeMatchingScoreId found")
-                return
-            evaluateJobResumeMatchingByAi(jobResumeMatchingScoreId, type=type)
-            return
-        elif type == "generate_candidate_suggestion":
-            print(f"generate_candidate_suggestion SQS_Consumer :: process_message:: ",  message)
-            jobId = message["data"]["jobId"]
-            candidateId = message["data"]["candidateId"]
-            if not jobId or not candidateId:
-                print(f"SQS Consumer ::: Process message. type: {type} ::: message: {message} error: no JobId or candidateId in message")
-                return
-            generate_candidate_suggestions(jobId, candidateId)
-            return
-        elif type == "process_bulk_resumes":
-            print(f"process_bulk_resumes SQS_Consumer :: process_message:: ",  message)
-            batch_job_id = message["data"].get("batch_job_id")
-            organization_id = message["data"].get("organization_id") 
-            user_id = message["data"].get("user_id")
-            job_id = message["data"].get("job_id")
-            file_count = message["data"].get("file_count")
-            
-            if not batch_job_id:
-                print(f"SQS Consumer ::: Process message. type: {type} ::: message: {message} error: no batch_job_id found")
+def queue_gemini_batch_jobs(tracker, data: dict) -> int:
+    """
+    Large uploads: queue gemini_batch_submit messages for the unfinished items that were not sent to a
+    batch job yet. Items of finished jobs go through the regular chunks, and the jobs still running are
+    polled again in case their poll was lost (resumed upload).
+    """
+    unfinished = ResumeUploadItem.unfinished().filter(tracker=tracker)
+    queued = queue_bulk_upload_items(tracker, data, unfinished.filter(gemini_batch_job__isnull=False))
+    items = list(unfinished.filter(gemini_batch_job__isnull=True).order_by('index').values('id', 'attempts'))
+    _queue_gemini_batch_submits(tracker, data, items)
+    for gemini_batch_job in tracker.gemini_batch_jobs.filter(state__in=GeminiBatchJob.ACTIVE_STATES):
+        _queue_gemini_batch_poll(gemini_batch_job, data, delay_seconds=0)
+    sqs_producer.flush()
+    return queued + len(items)
+
+
+def _queue_gemini_batch_submits(tracker, data: dict, items: list, delay_seconds: int = 0):
+    """One gemini_batch_submit message per batch job, sized by what the API key's quota allowed so far"""
+    batch_size = gemini_batch_service.calculate_optimal_batch_size(len(items))
+    for start in range(0, len(items), batch_size or 1):
+        chunk = items[start:start + batch_size]
+        add_message_to_sqs_queue(type='gemini_batch_submit', delay_seconds=delay_seconds, data={
+            "batch_job_id": str(tracker.batch_job_id),
+            "item_ids": [str(item['id']) for item in chunk],
+            "attempt": max(item['attempts'] for item in chunk),
+            "organization_id": data.get("organization_id"),
+            "user_id": data.get("user_id"),
+            "job_id": data.get("job_id"),
+        })
+
+
+def _queue_gemini_batch_poll(gemini_batch_job, data: dict, delay_seconds: int = GEMINI_BATCH_POLL_SECONDS):
+    add_message_to_sqs_queue(type='gemini_batch_poll', delay_seconds=delay_seconds, data={
+        "gemini_batch_job_id": str(gemini_batch_job.id),
+        # Every poll is a new payload, the earlier ones are in the message ledger
+        "poll": gemini_batch_job.polls,
+        "organization_id": data.get("organization_id"),
+        "user_id": data.get("user_id"),
+        "job_id": data.get("job_id"),
+    })
+
+
+# Downloads the files of a batch job's items and submits them as one Gemini batch job.
+# Duplicates are attached right away; the other items wait for the job, polled by gemini_batch_poll.
+@register_handler('gemini_batch_submit', max_concurrency=1, timeout_seconds=900, expected_duration_seconds=300,
+                  dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_gemini_batch_submit(message):
+    print(f"gemini_batch_submit SQS_Consumer :: process_message:: ",  message)
+    item_ids = message["data"].get("item_ids")
+    if not item_ids:
+        print(f"SQS Consumer ::: Process message. type: gemini_batch_submit ::: message: {message} error: no item_ids found")
+        return
+
+    items = ResumeUploadItem.claim_many(item_ids)
+    if not items:
+        print(f"SQS Consumer ::: upload items {item_ids} are finished or claimed by other workers, skipping")
+        return
+    tracker = ResumeUploadTracker.objects.select_related('job').get(pk=items[0].tracker_id)
+
+    claimed = [item for item in items if item.status == 'processing']
+    if claimed:
+        if tracker.status != 'processing':
+            for item in claimed:
+                item.fail(f"Upload is {tracker.status}", save=False)
+            ResumeUploadItem.save_results(claimed)
+        else:
+            organization = Organization.objects.get(id=message["data"].get("organization_id"))
+            user = Recruiter.objects.get(id=message["data"].get("user_id"))
+            submit_gemini_batch_job(tracker, claimed, organization, user, tracker.job, message["data"])
+
+    if tracker.refresh_file_totals():
+        _on_bulk_upload_files_done(tracker)
+
+
+def submit_gemini_batch_job(tracker, items, organization, user, job, data: dict):
+    """
+    Submit the files of the items as one Gemini batch extraction job (a copy within the items is sent
+    once), and hand the items over to it. Refused for quota, the items are submitted again later in
+    smaller jobs while they have attempts left; if the job can not be submitted otherwise, they are queued
+    for the regular chunks instead.
+    """
+    files = [BulkResumeFile(item, content_hash=item.content_hash) for item in items]
+    with ThreadPoolExecutor(max_workers=BULK_CHUNK_WORKERS) as executor:
+        duplicates = _find_duplicate_candidates(organization, {file.content_hash for file in files if file.content_hash})
+        to_download = [file for file in files if file.content_hash not in duplicates]
+        list(executor.map(_download_bulk_file, to_download))
+    duplicates.update(_find_duplicate_candidates(
+        organization, {file.content_hash for file in to_download if not file.error}
+    ))
+
+    resumes = {}
+    for file in to_download:
+        if not file.error and file.content_hash not in duplicates:
+            resumes.setdefault(file.content_hash, file.content)
+    batched = [file for file in files if not file.error and file.content_hash in resumes]
+    for file in files:
+        file.content = None
+
+    if batched:
+        retry_later = False
+        try:
+            job_name = gemini_batch_service.submit_batch_job(
+                gemini_batch_service.create_resume_extraction_file(resumes),
+                display_name=f"resumes_{tracker.batch_job_id}_{batched[0].item.index}"
+            )
+        except GeminiBatchQuotaError as e:
+            batch_size = gemini_batch_service.sizer.record_quota_error()
+            # The regular chunks need an attempt of their own
+            retry_later = max(file.item.attempts for file in batched) < ResumeUploadItem.MAX_ATTEMPTS - 1
+            print(f"❌ Gemini batch quota exceeded for bulk upload {tracker.batch_job_id}, "
+                  f"{f'submitting again in jobs of {batch_size}' if retry_later else 'processing its files directly'}: {e}")
+            job_name = None
+        except Exception as e:
+            print(f"❌ Error submitting Gemini batch job for bulk upload {tracker.batch_job_id}, processing its files directly: {e}")
+            traceback.print_exc()
+            job_name = None
+
+        now = timezone.now()
+        with transaction.atomic():
+            gemini_batch_job = None
+            if job_name:
+                gemini_batch_job = GeminiBatchJob.objects.create(
+                    tracker=tracker,
+                    name=job_name,
+                    request_count=len(resumes),
+                    created_by=user,
+                    modified_by=user
+                )
+                _queue_gemini_batch_poll(gemini_batch_job, data)
+            for file in batched:
+                # Back to pending: not claimable while the job runs, queued by its poll once it finished
+                file.item.status = 'pending'
+                file.item.started_at = None
+                file.item.content_hash = file.content_hash
+                file.item.gemini_batch_job = gemini_batch_job
+                file.item.modified_date = now
+            ResumeUploadItem.objects.bulk_update(
+                [file.item for file in batched], ['status', 'started_at', 'content_hash', 'gemini_batch_job', 'modified_date']
+            )
+            if retry_later:
+                _queue_gemini_batch_submits(
+                    tracker, data, [{'id': file.item.pk, 'attempts': file.item.attempts} for file in batched],
+                    delay_seconds=GEMINI_BATCH_POLL_SECONDS
+                )
+            elif gemini_batch_job is None:
+                queue_bulk_upload_items(tracker, data, ResumeUploadItem.objects.filter(pk__in=[file.item.pk for file in batched]))
+        if gemini_batch_job:
+            print(f"📦 Submitted Gemini batch job {job_name} for {len(resumes)} resumes of bulk upload {tracker.batch_job_id}")
+
+    # Duplicates are attached, files that could not be downloaded fail
+    finished = [file for file in files if file not in batched]
+    if finished:
+        _persist_bulk_files(finished, tracker, organization, user, job)
+
+
+# Checks a Gemini batch job without waiting for it: polled again later while it runs, and once it finished
+# its results are stored and its items queued for the regular chunks, which create the candidates.
+@register_handler('gemini_batch_poll', max_concurrency=2, timeout_seconds=600, expected_duration_seconds=60,
+                  dedup_by_payload=True, priority=BULK_PRIORITY)
+def handle_gemini_batch_poll(message):
+    print(f"gemini_batch_poll SQS_Consumer :: process_message:: ",  message)
+    data = message["data"]
+    gemini_batch_job = GeminiBatchJob.objects.select_related('tracker').filter(pk=data.get("gemini_batch_job_id")).first()
+    if gemini_batch_job is None or gemini_batch_job.state not in GeminiBatchJob.ACTIVE_STATES:
+        print(f"SQS Consumer ::: Gemini batch job {data.get('gemini_batch_job_id')} is not running, skipping")
+        return
+    tracker = gemini_batch_job.tracker
+
+    if tracker.status != 'processing':
+        gemini_batch_service.cancel_batch_job(gemini_batch_job.name)
+        _finish_gemini_batch_job(gemini_batch_job, 'failed', f"Upload is {tracker.status}")
+    else:
+        try:
+            job_status = gemini_batch_service.get_batch_job_status(gemini_batch_job.name)
+        except Exception as e:
+            print(f"SQS Consumer ::: Error polling Gemini batch job {gemini_batch_job.name}, polling again later: {e}")
+            job_status = {"status": "running"}
+
+        if job_status["status"] == "running":
+            if timezone.now() - gemini_batch_job.submitted_at < timedelta(hours=GEMINI_BATCH_MAX_WAIT_HOURS):
+                gemini_batch_job.polls += 1
+                gemini_batch_job.save(update_fields=['polls', 'modified_date'])
+                _queue_gemini_batch_poll(gemini_batch_job, data)
                 return
-                
-            # Process the bulk upload following single resume pattern
+            gemini_batch_service.cancel_batch_job(gemini_batch_job.name)
+            _finish_gemini_batch_job(gemini_batch_job, 'failed', f"Not finished after {GEMINI_BATCH_MAX_WAIT_HOURS} hours")
+            _record_gemini_batch_job(gemini_batch_job, succeeded=0, failed=True)
+        elif job_status["status"] == "completed":
             try:
-                # Find the tracker using batch_job_id
-                
-                
-                
-                tracker = ResumeUploadTracker.objects.get(batch_job_id=batch_job_id)
-                organization = Organization.objects.get(id=organization_id)
-                user = Recruiter.objects.get(id=user_id)
-                job = Job.objects.get(id=job_id) if job_id else None
-                
-                print(f"Processing bulk upload for tracker {tracker.id} with {file_count} files")
-                tracker.start_processing()
-                
-                # Get uploaded files from S3
-                
-                files_metadata = tracker.processing_details.get('files', [])
-                
-                if not files_metadata:
-                    print(f"❌ No uploaded files found in tracker {tracker.id}")
-                    tracker.fail_processing("No uploaded files found")
-                    return
-                
-                processed_count = 0
-                successful_count = 0
-                failed_count = 0
-                
-                for file_metadata in files_metadata:
-                    try:
-                        processed_count += 1
-                        
-                        # Extract file info from S3 metadata
-                        filename = file_metadata.get('name', f'resume_{processed_count}.pdf')
-                        s3_bucket = file_metadata.get('s3_bucket')
-                        s3_key = file_metadata.get('s3_key')
-                        content_type = file_metadata.get('content_type', 'application/pdf')
-                        
-                        # Download file content from S3
-                        s3_client = boto3.client(
-                            's3',
-                            endpoint_url=os.getenv("AWS_S3_ENDPOINT_URL"),
-                            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-                            region_name=os.getenv("AWS_REGION_NAME")
-                        )
-                        
-                        response = s3_client.get_object(Bucket=s3_bucket, Key=s3_key)
-                        file_content = response['Body'].read()
-                        
-                        # Create InMemoryUploadedFile like single resume upload
-                        file_obj = InMemoryUploadedFile(
-                            BytesIO(file_content),
-                            None,
-                            filename,
-                            content_type,
-                            len(file_content),
-                            None
-                        )
-                        
-                        # Extract candidate data from resume file using AI
-                        # Save file temporarily for AI extraction
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                            temp_file.write(file_content)
-                            temp_file_path = temp_file.name
-                        
-                        # Initialize candidate data with filename as fallback
-                        candidate_name = filename.replace('.pdf', '').replace('_', ' ').replace('-', ' ').title()
-                        candidate_email = None
-                        candidate_phone = None
-                        
-                        try:
-                            # Try to extract better data from resume
-                            
-                            extracted_data = extract_resume_data(temp_file_path)
-                            
-                            # Use extracted data if available, keep fallback otherwise
-                            if extracted_data and hasattr(extracted_data, 'name') and extracted_data.name:
-                                candidate_name = extracted_data.name
-                            if extracted_data and hasattr(extracted_data, 'email') and extracted_data.email:
-                                candidate_email = extracted_data.email
-                            if extracted_data and hasattr(extracted_data, 'phone') and extracted_data.phone:
-                                candidate_phone = extracted_data.phone
-                            
-                            print(f"📋 Using: name={candidate_name}, email={candidate_email}, phone={candidate_phone}")
-                            
-                        except Exception as extract_error:
-                            print(f"⚠️  AI extraction failed for {filename}, using filename fallback: {extract_error}")
-                        finally:
-                            # Clean up temporary file
-                            if os.path.exists(temp_file_path):
-                                os.unlink(temp_file_path)
-                        
-                        # Create candidate with available data (use phone_number field)
-                        candidate = Candidate.objects.create(
-                            organization=organization,
-                            name=candidate_name,
-                            email=candidate_email,
-                            phone_number=candidate_phone,  # Use correct field name
-                            resume=file_obj,  # Store file directly like single upload
-                            created_by=user,
-                            modified_by=user,
-                            recruiter=user
-                        )
-                        # Queue for Gemini embedding generation
-                        add_message_to_sqs_queue(type='generate_embedding', data={
-                            "candidate_id": str(candidate.id),
-                            "batch_job_id": str(tracker.batch_job_id),
-                            "organization_namespace": f"{organization.org_name}_{organization.id}"
-                        })
-                                    
-                        print(f"✅ Created candidate: {candidate.name} (ID: {candidate.id})")
-                        
-                        # Queue for embedding generation like single resume
-                        add_message_to_sqs_queue(type='generate_embedding', data={
-                            "candidate_id": str(candidate.id),
-                            "batch_job_id": str(tracker.batch_job_id),
-                            "organization_namespace": f"{organization.org_name}_{organization.id}"
-                        })
-                        
-                        # Create job matching score if job exists
-                        if job:
-                            job_matching_score = JobMatchingResumeScore.objects.create(
-                                job=job,
-                                candidate=candidate,
-                                score=0,  # Will be calculated after embedding
-                                created_by=user,
-                                modified_by=user
-                            )
-                            
-                            # Queue for AI evaluation
-                            add_message_to_sqs_queue(type='ai_job_resume_evaluation', data={
-                                "id": str(job_matching_score.id),
-                            })
-                            
-                            print(f"✅ Created job matching score for candidate {candidate.name}")
-                        
-                        successful_count += 1
-                        
-                        # Update progress
-                        tracker.update_progress(
-                            processed=processed_count, 
-                            successful=successful_count, 
-                            failed=failed_count
-                        )
-                        
-                    except Exception as file_error:
-                        print(f"❌ Error processing file {filename}: {file_error}")
-                        failed_count += 1
-                        tracker.update_progress(
-                            processed=processed_count,
-                            successful=successful_count, 
-                            failed=failed_count
-                        )
-                        continue
-                
-                # Complete processing
-                if failed_count == 0:
-                    tracker.complete_processing()
-                    print(f"✅ Successfully processed all {successful_count} candidates")
-                else:
-                    tracker.status = 'partially_failed'
-                    tracker.save()
-                    print(f"⚠️ Partially completed: {successful_count} successful, {failed_count} failed")
-                
-                # Queue for ranking update if job exists (like single resume)
-                if job:
-                    add_message_to_sqs_queue(type='rank-resumes', data={
-                        "jobId": str(job.id)
-                    })
-                
-                print(f"✅ Bulk upload processing completed for batch {batch_job_id}")
-                
+                succeeded = store_gemini_batch_results(gemini_batch_job, job_status["output_file"])
             except Exception as e:
-                print(f"❌ Error processing bulk resumes for batch {batch_job_id}: {e}")
-                
+                print(f"❌ Error storing the results of Gemini batch job {gemini_batch_job.name}: {e}")
                 traceback.print_exc()
-                
-                # Update tracker with failure
-                try:
-                    tracker = ResumeUploadTracker.objects.get(batch_job_id=batch_job_id)
-                    tracker.fail_processing(str(e))
-                except:
-                    pass
-                    
-            return
-        # {"s3_file_url":"http://elexis-random.s3.us-east-1.localhost.localstack.cloud:4566/transcript01.txt","room_url":"https://bohot-wickets.com"}
-        # {"type":"proctor","video":"http://commondatastorage.googleapis.com/gtv-videos-bucket/sample/ElephantsDream.mp4","room_url":"https://google.com"}
-        elif not room_url or not transcript_url:
-            print(f"Invalid data in message: meeting_room={room_url}, transcript_url={transcript_url}")
+                _finish_gemini_batch_job(gemini_batch_job, 'failed', f"Could not read the results: {e}")
+            else:
+                _record_gemini_batch_job(gemini_batch_job, succeeded)
+        else:
+            _finish_gemini_batch_job(gemini_batch_job, 'failed', job_status.get("error"))
+            if is_quota_error(Exception(job_status.get("error"))):
+                gemini_batch_service.sizer.record_quota_error()
+            else:
+                _record_gemini_batch_job(gemini_batch_job, succeeded=0, failed=True)
+
+    # Without a stored extraction (failed job or request) the chunk worker extracts the file itself
+    queued = queue_bulk_upload_items(tracker, data, ResumeUploadItem.unfinished().filter(gemini_batch_job=gemini_batch_job))
+    print(f"✅ Gemini batch job {gemini_batch_job.name} {gemini_batch_job.state}, queued its {queued} files")
+
+
+def _finish_gemini_batch_job(gemini_batch_job, state: str, error_message: str = None):
+    gemini_batch_job.state = state
+    gemini_batch_job.error_message = error_message
+    gemini_batch_job.completed_at = timezone.now()
+    gemini_batch_job.save(update_fields=['state', 'error_message', 'completed_at', 'modified_date'])
+    if state == 'failed':
+        print(f"❌ Gemini batch job {gemini_batch_job.name} failed: {error_message}")
+
+
+def _record_gemini_batch_job(gemini_batch_job, succeeded: int, failed: bool = False):
+    """Let the batch sizer learn from a finished job"""
+    try:
+        gemini_batch_service.sizer.record_job(
+            gemini_batch_job.request_count, succeeded,
+            (gemini_batch_job.completed_at - gemini_batch_job.submitted_at).total_seconds(), failed=failed
+        )
+    except Exception as e:
+        print(f"SQS Consumer ::: Error recording Gemini batch job {gemini_batch_job.name} for batch sizing: {e}")
+
+
+def store_gemini_batch_results(gemini_batch_job, output_file: str) -> int:
+    """
+    Store the texts of a finished batch job in the text store, and the contact details on its items.
+    Returns the number of requests that returned a resume.
+    """
+    responses = gemini_batch_service.process_batch_results(output_file)
+    extracted = {
+        response.request_id: extracted_resume_data_from_batch(response.data)
+        for response in responses if response.success
+    }
+    store_texts({content_hash: data.raw_text for content_hash, data in extracted.items()})
+
+    items = list(gemini_batch_job.items.all())
+    now = timezone.now()
+    for item in items:
+        data = extracted.get(item.content_hash)
+        item.extraction = {"name": data.name, "email": data.email, "phone": data.phone} if data and data.raw_text else None
+        item.modified_date = now
+    failed = gemini_batch_job.request_count - len([data for data in extracted.values() if data.raw_text])
+    with transaction.atomic():
+        ResumeUploadItem.objects.bulk_update(items, ['extraction', 'modified_date'])
+        _finish_gemini_batch_job(
+            gemini_batch_job, 'succeeded', f"{failed} of {gemini_batch_job.request_count} requests failed" if failed else None
+        )
+    return gemini_batch_job.request_count - failed
+
+
+# {"s3_file_url":"http://elexis-random.s3.us-east-1.localhost.localstack.cloud:4566/transcript01.txt","room_url":"https://bohot-wickets.com"}
+# {"type":"proctor","video":"http://commondatastorage.googleapis.com/gtv-videos-bucket/sample/ElephantsDream.mp4","room_url":"https://google.com"}
+@register_handler(TRANSCRIPT_MESSAGE_TYPE, max_concurrency=4, timeout_seconds=900, expected_duration_seconds=300,
+                  dedup_by_payload=True, priority=INTERACTIVE_PRIORITY)
+def handle_transcript(message):
+    room_url = message.get("room_url")
+    transcript_url = message.get("s3_file_url")
+    if not room_url or not transcript_url:
+        print(f"Invalid data in message: meeting_room={room_url}, transcript_url={transcript_url}")
+        return
+
+    # Fetch transcript data from S3
+    try:
+        full_s3_url = transcript_url
+        raw_transcript = get_file_data_from_s3(AWS_TRANSCRIPT_BUCKET_NAME,transcript_url.split('/')[-1])
+        qa_data = convert(raw_transcript)
+        if not qa_data:
+            print(f"Empty or invalid conversion for transcript: {transcript_url}")
             return
+        transcript_url = transcript_url.split('/')[-1] + ".json"
+        put_dict_as_json_to_s3(
+            AWS_TRANSCRIPT_BUCKET_NAME,
+            transcript_url,
+            qa_data
+        )
+        transcript_data = raw_transcript
+    except Exception as e:
+        print(f"Error fetching transcript data from S3: {e}")
+        raise
 
-        # Fetch transcript data from S3
-        try:
-            full_s3_url = transcript_url
-            raw_transcript = get_file_data_from_s3(AWS_TRANSCRIPT_BUCKET_NAME,transcript_url.split('/')[-1])
-            qa_data = convert(raw_transcript)
-            if not qa_data:
-                print(f"Empty or invalid conversion for transcript: {transcript_url}")
-                return
-            transcript_url = transcript_url.split('/')[-1] + ".json"
-            put_dict_as_json_to_s3(
-                AWS_TRANSCRIPT_BUCKET_NAME,
-                transcript_url,
-                qa_data
-            )
-            transcript_data = raw_transcript
-        except Exception as e:
-            print(f"Error fetching transcript data from S3: {e}")
+    # Update the Interview instance with the transcript and summary
+    try:
+        interview = Interview.objects.filter(meeting_room=room_url).first()
+        if not interview:
+            print(f"Interview ID {room_url} not found. No update performed.")
             return
 
-        # Update the Interview instance with the transcript and summary
-        try:
-            interview = Interview.objects.get(meeting_room=room_url)
-
-            # Access job_id before update , later 
-            jobId = interview.job.id
-            # I need all the requirements for this job id
-            requirementQuerySet = JobRequirement.objects.filter(job_id = jobId)
-            specialEvaluationMetrics = JobRequirementSerializer(requirementQuerySet, many = True).data
-            summary_json = None
-            # Retry summary generation up to 3 times on error
-            retries = 3
-            for attempt in range(retries):
-                try:
-                    summary_json = generate_summary(transcript_data, specialEvaluationMetrics)
-                    break
-                except Exception as e:
-                    traceback.print_exc()
-                    print(f"Error generating summary (attempt {attempt+1}/{retries}): {e}")
-                    if attempt == retries - 1:
-                        print("Max retries reached. Skipping summary generation.")
-                        return
-                    time.sleep(2)
-            
-            # Retry fetching experience up to 3 times on error
-            retries = 3
-            experience = None
-            for attempt in range(retries):
-                try:
-                    experience =  experience_information_generation(interview.candidate.resume.url)
-                    break
-                except Exception as e:
-                    traceback.print_exc()
-                    print(f"Error fetching experience (attempt {attempt+1}/{retries}): {e}")
-                    if attempt == retries - 1:
-                        print("Max retries reached. Skipping experience fetching.")
-                        return
-                    time.sleep(2)
-
-
-            # Update fields
-            interview.transcript = full_s3_url + ".json"
-            interview.summary = summary_json
-            interview.status = 'ended'
-            interview.skills = summary_json['skills']
-            interview.experience = summary_json['experience']
-            if experience is not None:
-                interview.experience = experience
-            interview.save()
-            
-            evaluations_to_create=[]
-            candidate = interview.candidate
+        # Access job_id before update , later 
+        jobId = interview.job.id
+        # I need all the requirements for this job id
+        requirementQuerySet = JobRequirement.objects.filter(job_id = jobId)
+        specialEvaluationMetrics = JobRequirementSerializer(requirementQuerySet, many = True).data
+        summary_json = None
+        # Retry summary generation up to 3 times on error
+        retries = 3
+        for attempt in range(retries):
             try:
-                # create a new row in JobResumeMatchingScore table, Completed stage
-                # get the JobResumeMatchingScore row from the interview scheduled stage
-                existingData = JobMatchingResumeScore.objects.filter(candidate=candidate, job=interview.job, stage='scheduled_interview')
-                existingData = existingData.first() if existingData.exists() else None
-                existingData.is_archived=True
-                existingData.save()
-                # create a new row in JobResumeMatchingScore table, Completed stage
-                jobResumeScoreinstance = JobMatchingResumeScore.objects.create(
-                    candidate=candidate,
-                    job=interview.job,
-                    score=existingData.score if existingData else 0,
-                    stage='completed_interview',
-                    created_by=existingData.created_by if existingData else None,
-                )
-                interview.job_matching_resume_score = jobResumeScoreinstance
-                interview.save()
-            except JobMatchingResumeScore.DoesNotExist:
-                print(f"SQS_consumer.py ::: JobMatchingResumeScore in scheduled_interview stage does not exist for candidate {candidate.id} and job {interview.job.id}")
+                summary_json = generate_summary(transcript_data, specialEvaluationMetrics)
+                break
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Error generating summary (attempt {attempt+1}/{retries}): {e}")
+                if attempt == retries - 1:
+                    print("Max retries reached. Skipping summary generation.")
+                    raise
+                time.sleep(2)
         
-            for item in summary_json['requirements_evaluation']:
-                print("item",item)
-                try:
-                   evaluations_to_create.append(
-                       JobRequirementEvaluation(
-                            interview=interview,
-                            candidate=candidate,
-                            job_requirement_id=item['id'],
-                            rating = item['evaluation'],
-                            remarks = item['remarks']
-                        )
-                   )
-                except JobRequirementEvaluation.DoesNotExist:
-                    continue
-            JobRequirementEvaluation.objects.bulk_create(evaluations_to_create)
-            if interview:
-                print(f"Transcript and summary updated for meeting_room: {room_url}: summaryjson::: Evaaalu{(summary_json)}")
-            else:
-                print(f"Interview ID {room_url} not found. No update performed.")
-        except Exception as e:
-            print(f"Error updating database for room {room_url}: {e}")
+        # Retry fetching experience up to 3 times on error
+        retries = 3
+        experience = None
+        for attempt in range(retries):
+            try:
+                experience =  get_resume_experience(interview.candidate)
+                break
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Error fetching experience (attempt {attempt+1}/{retries}): {e}")
+                if attempt == retries - 1:
+                    print("Max retries reached. Skipping experience fetching.")
+                    raise
+                time.sleep(2)
 
-    except json.JSONDecodeError:
-        print(f"Invalid message format: {message_body}")
+
+        # Written together, so a retry or a re-sent transcript does not find half of them
+        with transaction.atomic():
+            _save_transcript_results(interview, full_s3_url, summary_json, experience)
+        print(f"Transcript and summary updated for meeting_room: {room_url}: summaryjson::: Evaaalu{(summary_json)}")
     except Exception as e:
-        print(f"Unexpected error processing message: {e}")
+        print(f"Error updating database for room {room_url}: {e}")
+        raise
 
 
+def _save_transcript_results(interview, full_s3_url: str, summary_json: dict, experience):
+    # Update fields
+    interview.transcript = full_s3_url + ".json"
+    interview.summary = summary_json
+    interview.status = 'ended'
+    interview.skills = summary_json['skills']
+    interview.experience = summary_json['experience']
+    if experience is not None:
+        interview.experience = experience
+    interview.save()
+    
+    evaluations_to_create=[]
+    candidate = interview.candidate
+    try:
+        # create a new row in JobResumeMatchingScore table, Completed stage
+        # get the JobResumeMatchingScore row from the interview scheduled stage
+        existingData = JobMatchingResumeScore.objects.filter(candidate=candidate, job=interview.job, stage='scheduled_interview')
+        existingData = existingData.first() if existingData.exists() else None
+        if existingData:
+            existingData.is_archived=True
+            existingData.save()
+        # create a new row in JobResumeMatchingScore table, Completed stage
+        jobResumeScoreinstance = JobMatchingResumeScore.objects.create(
+            candidate=candidate,
+            job=interview.job,
+            score=existingData.score if existingData else 0,
+            stage='completed_interview',
+            created_by=existingData.created_by if existingData else None,
+        )
+        interview.job_matching_resume_score = jobResumeScoreinstance
+        interview.save()
+    except JobMatchingResumeScore.DoesNotExist:
+        print(f"SQS_consumer.py ::: JobMatchingResumeScore in scheduled_interview stage does not exist for candidate {candidate.id} and job {interview.job.id}")
+
+    for item in summary_json['requirements_evaluation']:
+        print("item",item)
+        try:
+           evaluations_to_create.append(
+               JobRequirementEvaluation(
+                    interview=interview,
+                    candidate=candidate,
+                    job_requirement_id=item['id'],
+                    rating = item['evaluation'],
+                    remarks = item['remarks']
+                )
+           )
+        except JobRequirementEvaluation.DoesNotExist:
+            continue
+    JobRequirementEvaluation.objects.bulk_create(evaluations_to_create)
+
 def updateJobResumeMatchingScore(id: str):
     try:
-        jobMatchingResumeInstance = JobMatchingResumeScore.objects.get(id=id)
+        jobMatchingResumeInstance = JobMatchingResumeScore.objects.filter(id=id).first()
+        if not jobMatchingResumeInstance:
+            print('SQS_consumer ::: score calculation ::: JobResumeMatchingScore not found ::: id', id)
+            return
         jobInstance = Job.objects.get(id=jobMatchingResumeInstance.job_id)
         candidateinstance = Candidate.objects.get(id = jobMatchingResumeInstance.candidate_id)
 
@@ -498,6 +1019,7 @@ def updateJobResumeMatchingScore(id: str):
                 print('SQS_consumer ::: SQS_consumer ::: resume embedding id not found ::: id', id)
     except Exception as e:
         print(f"SQS_consumer ::: upsertJobResumeMatchingScore::: Async Queue for adding bulk jdResume records::: id: {id}. error: ", e)
+        raise
 
 
 def reRankResumes(jobId: str):
@@ -520,131 +1042,149 @@ def reRankResumes(jobId: str):
         raise 
 
 
-def evaluateJobResumeMatchingByAi(jobResumeMatchingScoreId: str, type: str):
+rank_scheduler = RankScheduler(lambda jobId: reRankResumes(jobId=jobId))
+
+
+def rerank_after_embedding(result: EmbeddingBatchResult):
+    for jobId in result.job_ids:
+        rank_scheduler.request(jobId)
+
+
+embedding_batcher = EmbeddingBatcher(on_batch_done=rerank_after_embedding)
+
+
+def _get_ai_evaluation_context(jobResumeMatchingScoreId: str, type: str, tracker_id: str = None):
+    """
+    Returns (jobResumeMatchingScore, job, candidate, tracker), or None if there is nothing to evaluate.
+    `tracker` is the bulk upload the evaluation counts for (tracker_id of the message), if still processing.
+    """
+    jobResumeMatchingScore = JobMatchingResumeScore.objects.select_related('job', 'candidate').filter(id=jobResumeMatchingScoreId).first()
+    if not jobResumeMatchingScore:
+        print(f"SQS Consumer, Async Job :{type} JobResumeMatchingScore with ID {jobResumeMatchingScoreId} not found.")
+        return None
+    job = jobResumeMatchingScore.job
+    candidate = jobResumeMatchingScore.candidate
+    if not job or not candidate:
+        print(f"Job or Candidate not found for JobResumeMatchingScore ID: {jobResumeMatchingScoreId}")
+        return None
+    
+    # Set by the bulk upload that created the candidate; the candidate may be in other uploads too
+    tracker = ResumeUploadTracker.objects.filter(pk=tracker_id, status='processing').first() if tracker_id else None
+    return jobResumeMatchingScore, job, candidate, tracker
+
+
+def _get_ai_evaluation_prompt(job, resumeContext: str) -> str:
+    jobContext = job.job_description if job.job_description else ""
+    return getJobResumeMatchingPrompt(aditionalContext=job.job_name, jobContext=jobContext, resumeContext=resumeContext)
+
+
+def _save_ai_evaluation(jobResumeMatchingScore, tracker, aiEvaluationResponseDict, type: str):
+    """Saves the evaluation and counts it for the bulk upload; raises GeminiResponseError if it is unusable"""
+    # Check if response is valid before processing
+    if isinstance(aiEvaluationResponseDict, str):
+        raise GeminiResponseError(f"Gemini returned error string: {aiEvaluationResponseDict}")
+    
+    if not hasattr(aiEvaluationResponseDict, 'model_dump'):
+        raise GeminiResponseError("Invalid response object from Gemini")
+
+    # If aiEvaluationResponse is valid response object
+    serializer_data = aiEvaluationResponseDict.model_dump()
+    serializer = AiJdResumeMatchingResponseSerializer(data={
+        "job_matching_resume_score": jobResumeMatchingScore.id,
+        **serializer_data})
+    if serializer.is_valid():
+        serializer.save()
+        print(f"Ai Evaluation for JobResumeMatchingScoreRecord : {jobResumeMatchingScore.id}  Saved successfully")
+        
+        # Update tracker for AI success if this is bulk upload
+        if tracker:
+            tracker.increment_ai_progress(succeeded=True)
+            print(f"📊 Updated bulk tracker: AI successful {tracker.ai_successful_files}, processed {tracker.ai_processed_files}/{tracker.successful_files}")
+    else:
+        raise GeminiResponseError(f"Invalid Ai Evaluation for JobResumeMatchingScoreRecord :{jobResumeMatchingScore.id}, error: {serializer.errors}")
+
+
+def _record_ai_evaluation_error(tracker):
+    # Update tracker for AI failure if this is bulk upload
     try:
-        jobResumeMatchingScore = JobMatchingResumeScore.objects.get(id=jobResumeMatchingScoreId)
-        if not jobResumeMatchingScore:
-            print(f"SQS Consumer, Async Job :{type} JobResumeMatchingScore with ID {jobResumeMatchingScoreId} not found.")
-            return
-        job = jobResumeMatchingScore.job
-        candidate = jobResumeMatchingScore.candidate
-        if not job or not candidate:
-            print(f"Job or Candidate not found for JobResumeMatchingScore ID: {jobResumeMatchingScoreId}")
+        if tracker:
+            tracker.increment_ai_progress(succeeded=False)
+            print(f"📊 Updated bulk tracker: AI failed {tracker.ai_failed_files}, processed {tracker.ai_processed_files}/{tracker.successful_files}")
+    except:
+        pass
+
+
+def evaluateJobResumeMatchingByAi(jobResumeMatchingScoreId: str, type: str, tracker_id: str = None):
+    tracker = None
+    try:
+        context = _get_ai_evaluation_context(jobResumeMatchingScoreId, type, tracker_id)
+        if not context:
             return
-        
-        # Check if this is part of a bulk upload by looking for a tracker with this candidate
-        tracker = None
-        try:
-            
-            tracker = ResumeUploadTracker.objects.filter(
-                status__in=['processing', 'pending'],
-                job=job,
-                upload_type='bulk'
-            ).order_by('-created_date').first()
-        except:
-            pass  # Not part of bulk upload
+        jobResumeMatchingScore, job, candidate, tracker = context
             
         # Prepare the context for AI evaluation
-        resumeContext = extract_text_from_pdf(candidate.resume.url) if candidate.resume else ""
-        jobContext = job.job_description if job.job_description else ""
-        prompt = getJobResumeMatchingPrompt(aditionalContext=job.job_name, jobContext=jobContext, resumeContext=resumeContext)
+        resumeContext = get_resume_text(candidate) if candidate.resume else ""
+        prompt = _get_ai_evaluation_prompt(job, resumeContext)
         aiEvaluationResponseDict =GeminiClient.query(
             prompt=prompt,
             responseSchema= AiJdResumeMatchingResponse,
             logIdentifier=f"SQS Consumer, Async Job :{type} JobResumeMatchingByAI ID: {jobResumeMatchingScoreId}, "
         )
-    
-        # Check if response is valid before processing
-        if isinstance(aiEvaluationResponseDict, str):
-            print(f"SQS Consumer, Async Job :{type} Error: Gemini returned error string: {aiEvaluationResponseDict}")
-            
-            # Update tracker for AI failure if this is bulk upload
-            if tracker:
-                current_failed = tracker.ai_failed_files + 1
-                current_processed = tracker.ai_processed_files + 1
-                tracker.update_ai_progress(
-                    ai_processed=current_processed,
-                    ai_failed=current_failed
-                )
-                print(f"📊 Updated bulk tracker: AI failed {current_failed}, processed {current_processed}/{tracker.successful_files}")
-            return
-        
-        if not hasattr(aiEvaluationResponseDict, 'model_dump'):
-            print(f"SQS Consumer, Async Job :{type} Error: Invalid response object from Gemini")
-            
-            # Update tracker for AI failure if this is bulk upload
-            if tracker:
-                current_failed = tracker.ai_failed_files + 1
-                current_processed = tracker.ai_processed_files + 1
-                tracker.update_ai_progress(
-                    ai_processed=current_processed,
-                    ai_failed=current_failed
-                )
-            return
-    
-        # If aiEvaluationResponse is valid response object
-        serializer_data = aiEvaluationResponseDict.model_dump()
-        serializer = AiJdResumeMatchingResponseSerializer(data={
-            "job_matching_resume_score": jobResumeMatchingScore.id,
-            **serializer_data})
-        if serializer.is_valid():
-            serializer.save()
-            print(f"Ai Evaluation for JobResumeMatchingScoreRecord : {jobResumeMatchingScore.id}  Saved successfully")
-            
-            # Update tracker for AI success if this is bulk upload
-            if tracker:
-                current_successful = tracker.ai_successful_files + 1
-                current_processed = tracker.ai_processed_files + 1
-                tracker.update_ai_progress(
-                    ai_processed=current_processed,
-                    ai_successful=current_successful
-                )
-                print(f"📊 Updated bulk tracker: AI successful {current_successful}, processed {current_processed}/{tracker.successful_files}")
-        else:
-            print(f"Error in Ai Evaluation for JobResumeMatchingScoreRecord :{jobResumeMatchingScore.id}, error: {serializer.errors}", )
-            
-            # Update tracker for AI failure if this is bulk upload
-            if tracker:
-                current_failed = tracker.ai_failed_files + 1
-                current_processed = tracker.ai_processed_files + 1
-                tracker.update_ai_progress(
-                    ai_processed=current_processed,
-                    ai_failed=current_failed
-                )
-        
+        _save_ai_evaluation(jobResumeMatchingScore, tracker, aiEvaluationResponseDict, type)
         return 
     except Exception as e:
         print(f"SQS Consumer, Async Job :{type} Error evaluating JobResumeMatchingByAI: {e}")
         traceback.print_exc()
-        
-        # Update tracker for AI failure if this is bulk upload and we can find the tracker
-        try:
-            tracker = ResumeUploadTracker.objects.filter(
-                status__in=['processing', 'pending'],
-                upload_type='bulk'
-            ).order_by('-created_date').first()
-            if tracker:
-                current_failed = tracker.ai_failed_files + 1
-                current_processed = tracker.ai_processed_files + 1
-                tracker.update_ai_progress(
-                    ai_processed=current_processed,
-                    ai_failed=current_failed
-                )
-        except:
-            pass
-        return ''
+        # Counted once, when the message is given up on
+        if is_final_attempt():
+            _record_ai_evaluation_error(tracker)
+        raise
+
+
+async def aevaluateJobResumeMatchingByAi(jobResumeMatchingScoreId: str, type: str, tracker_id: str = None):
+    """
+    Same as evaluateJobResumeMatchingByAi for the asyncio runtime: the download and the Gemini calls
+    are awaited on the loop, only the ORM work runs in the executor.
+    """
+    tracker = None
+    try:
+        context = await run_orm(_get_ai_evaluation_context, jobResumeMatchingScoreId, type, tracker_id)
+        if not context:
+            return
+        jobResumeMatchingScore, job, candidate, tracker = context
+
+        # Prepare the context for AI evaluation
+        resumeContext = await aget_resume_text(candidate) if candidate.resume else ""
+        prompt = _get_ai_evaluation_prompt(job, resumeContext)
+        async with dependency_limit(GEMINI):
+            aiEvaluationResponseDict = await GeminiClient.aquery(
+                prompt=prompt,
+                responseSchema= AiJdResumeMatchingResponse,
+                logIdentifier=f"SQS Consumer, Async Job :{type} JobResumeMatchingByAI ID: {jobResumeMatchingScoreId}, "
+            )
+        await run_orm(_save_ai_evaluation, jobResumeMatchingScore, tracker, aiEvaluationResponseDict, type)
+        return
+    except Exception as e:
+        print(f"SQS Consumer, Async Job :{type} Error evaluating JobResumeMatchingByAI: {e}")
+        traceback.print_exc()
+        if is_final_attempt():
+            await run_orm(_record_ai_evaluation_error, tracker)
+        raise
 
 def generate_candidate_suggestions(jobId: str , candidateId: str):
     try:
-        job = Job.objects.get(id=jobId)
-        candidate = Candidate.objects.get(id=candidateId)
+        job = Job.objects.filter(id=jobId).first()
+        candidate = Candidate.objects.filter(id=candidateId).first()
 
         if not job or not candidate:
             print(f"Job or Candidate not found for Job ID: {jobId} or Candidate ID: {candidateId}")
             return
+        if SuggestedCandidates.objects.filter(job=job, candidate=candidate).exists():
+            print(f"Candidate suggestions for Job ID: {jobId} and Candidate ID: {candidateId} already exist, skipping")
+            return
 
         # Prepare the context for AI evaluation
-        resumeContext = extract_text_from_pdf(candidate.resume.url) if candidate.resume else ""
+        resumeContext = get_resume_text(candidate) if candidate.resume else ""
         jobContext = job.job_description if job.job_description else ""
         prompt = getJobResumeMatchingPrompt(aditionalContext=job.job_name, jobContext=jobContext, resumeContext=resumeContext)
 
@@ -656,12 +1196,10 @@ def generate_candidate_suggestions(jobId: str , candidateId: str):
 
         # Check if response is valid before processing
         if isinstance(aiEvaluationResponseDict, str):
-            print(f"SQS Consumer, generate_candidate_suggestions Error: Gemini returned error string: {aiEvaluationResponseDict}")
-            return
+            raise GeminiResponseError(f"Gemini returned error string: {aiEvaluationResponseDict}")
         
         if not hasattr(aiEvaluationResponseDict, 'model_dump'):
-            print(f"SQS Consumer, generate_candidate_suggestions Error: Invalid response object from Gemini")
-            return
+            raise GeminiResponseError("Invalid response object from Gemini")
 
         serializer_data = aiEvaluationResponseDict.model_dump()
         serializer = AiJdResumeMatchingResponseSerializer(data={
@@ -677,8 +1215,8 @@ def generate_candidate_suggestions(jobId: str , candidateId: str):
             )
             print(f"Candidate suggestions for Job ID: {jobId} and Candidate ID: {candidateId} saved successfully.")
         else:
-            print(f"Error in saving candidate suggestions for Job ID: {jobId} and Candidate ID: {candidateId}, error: {serializer.errors}")
+            raise GeminiResponseError(f"Invalid candidate suggestions for Job ID: {jobId} and Candidate ID: {candidateId}, error: {serializer.errors}")
     except Exception as e:
         print(f"SQS Consumer, Async Job :generate_candidate_suggestions Error generating candidate suggestions: {e}")
         traceback.print_exc()
-        return ''
\ No newline at end of file
+        raise
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Small builders for the rows most tests need"""
+
+import uuid
+
+from elexis.models import Candidate, Job, JobMatchingResumeScore, Organization, Recruiter, ResumeUploadItem, ResumeUploadTracker
+
+
+def create_recruiter(org_name="Acme"):
+    organization = Organization.objects.create(org_name=org_name)
+    return Recruiter.objects.create_user(
+        email=f"{uuid.uuid4().hex[:8]}@example.com", organization=organization, name="Recruiter"
+    )
+
+
+def create_job(user):
+    return Job.objects.create(
+        recruiter=user, organization=user.organization, job_name="Backend engineer", job_description="Python"
+    )
+
+
+def create_candidate(user, **fields):
+    return Candidate.objects.create(
+        recruiter=user, organization=user.organization, name=fields.pop('name', "Jane Doe"),
+        email=fields.pop('email', "jane@example.com"), **fields
+    )
+
+
+def create_score(job, candidate):
+    return JobMatchingResumeScore.objects.create(job=job, candidate=candidate, score=0)
+
+
+def create_bulk_tracker(user, files=0, job=None, status='processing'):
+    tracker = ResumeUploadTracker.objects.create(
+        organization=user.organization, upload_type='bulk', status=status, total_files=files, job=job,
+        created_by=user, modified_by=user
+    )
+    for index in range(files):
+        ResumeUploadItem.objects.create(
+            tracker=tracker, index=index, name=f"resume_{index}.pdf", s3_bucket="bucket",
+            s3_key=f"bulk_uploads/{tracker.batch_job_id}/{index:05d}_resume_{index}.pdf"
+        )
+    return tracker
@@ -0,0 +1,105 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from elexis import sqs_consumer
+from elexis.models import SuggestedCandidates
+from elexis.services.sqs_handler_registry import resolve_handler, run_handler
+from elexis.tests.factories import create_bulk_tracker, create_candidate, create_job, create_recruiter, create_score
+
+
+class AiEvaluationProgressTests(TestCase):
+    def setUp(self):
+        self.user = create_recruiter()
+        self.job = create_job(self.user)
+        self.candidate = create_candidate(self.user)
+        # The candidate was created by an earlier upload, and a later one attached a copy of its resume
+        self.first_upload = create_bulk_tracker(self.user, files=1, job=self.job)
+        self.first_upload.items.get().succeed(self.candidate)
+        self.second_upload = create_bulk_tracker(self.user, files=1, job=self.job)
+        self.score = create_score(self.job, self.candidate)
+
+    def _evaluate(self, tracker_id):
+        with mock.patch.object(sqs_consumer.GeminiClient, 'query', return_value="Gemini error"):
+            with self.assertRaises(sqs_consumer.GeminiResponseError):
+                sqs_consumer.evaluateJobResumeMatchingByAi(str(self.score.id), type='ai_job_resume_evaluation', tracker_id=tracker_id)
+
+    def test_counts_for_the_tracker_of_the_message(self):
+        self._evaluate(str(self.second_upload.id))
+
+        self.first_upload.refresh_from_db()
+        self.second_upload.refresh_from_db()
+        self.assertEqual((self.second_upload.ai_processed_files, self.second_upload.ai_failed_files), (1, 1))
+        self.assertEqual(self.first_upload.ai_processed_files, 0)
+
+    def test_without_tracker_counts_for_no_upload(self):
+        self._evaluate(None)
+
+        self.first_upload.refresh_from_db()
+        self.assertEqual(self.first_upload.ai_processed_files, 0)
+
+    def test_finished_tracker_is_not_counted(self):
+        self.second_upload.status = 'completed'
+        self.second_upload.save()
+
+        self._evaluate(str(self.second_upload.id))
+
+        self.second_upload.refresh_from_db()
+        self.assertEqual(self.second_upload.ai_processed_files, 0)
+
+
+class AiEvaluationRetryTests(TestCase):
+    def setUp(self):
+        user = create_recruiter()
+        job = create_job(user)
+        self.upload = create_bulk_tracker(user, files=1, job=job)
+        self.upload.items.get().succeed(create_candidate(user))
+        self.message = {"type": "ai_job_resume_evaluation",
+                        "data": {"id": str(create_score(job, self.upload.items.get().candidate).id),
+                                 "tracker_id": str(self.upload.id)}}
+        self.handler = resolve_handler(self.message)
+
+    def test_failure_is_counted_once_when_retries_are_exhausted(self):
+        with mock.patch.object(sqs_consumer.GeminiClient, 'query', return_value="Gemini error"), \
+                mock.patch('elexis.services.sqs_handler_registry.time.sleep'):
+            with self.assertRaises(sqs_consumer.GeminiResponseError):
+                run_handler(self.handler, self.message)
+
+        self.upload.refresh_from_db()
+        self.assertEqual((self.upload.ai_processed_files, self.upload.ai_failed_files), (1, 1))
+
+    def test_success_on_retry_is_not_counted_as_failure(self):
+        answers = iter(["Gemini error", "evaluation"])
+
+        def save(score, tracker, response, type):
+            if response == "Gemini error":
+                raise sqs_consumer.GeminiResponseError(response)
+            tracker.increment_ai_progress(succeeded=True)
+
+        with mock.patch.object(sqs_consumer.GeminiClient, 'query', side_effect=lambda **kwargs: next(answers)), \
+                mock.patch.object(sqs_consumer, '_save_ai_evaluation', side_effect=save), \
+                mock.patch('elexis.services.sqs_handler_registry.time.sleep'):
+            run_handler(self.handler, self.message)
+
+        self.upload.refresh_from_db()
+        self.assertEqual((self.upload.ai_processed_files, self.upload.ai_successful_files, self.upload.ai_failed_files), (1, 1, 0))
+
+
+class CandidateSuggestionTests(TestCase):
+    def setUp(self):
+        user = create_recruiter()
+        self.job = create_job(user)
+        self.candidate = create_candidate(user)
+
+    def test_existing_suggestion_is_not_generated_again(self):
+        SuggestedCandidates.objects.create(job=self.job, candidate=self.candidate)
+
+        with mock.patch.object(sqs_consumer.GeminiClient, 'query') as query:
+            sqs_consumer.generate_candidate_suggestions(str(self.job.id), str(self.candidate.id))
+        query.assert_not_called()
+
+    def test_gemini_error_is_raised(self):
+        with mock.patch.object(sqs_consumer.GeminiClient, 'query', return_value="Gemini error"):
+            with self.assertRaises(sqs_consumer.GeminiResponseError):
+                sqs_consumer.generate_candidate_suggestions(str(self.job.id), str(self.candidate.id))
+        self.assertFalse(SuggestedCandidates.objects.exists())
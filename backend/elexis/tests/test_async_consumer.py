@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.services import sqs_message_ledger as ledger
+from elexis.services.sqs_async_consumer import AsyncSQSConsumer, _AsyncHandlerLane, _AsyncInFlightMessage, _AsyncQueuePoller
+from elexis.services.sqs_handler_registry import MessageHandler
+from elexis.services.sqs_queues import STANDARD_PRIORITY, SQSQueue
+
+
+def _blocking_handler(release: threading.Event):
+    def func(message):
+        release.wait(5)
+    return MessageHandler(message_type='test', func=func, max_concurrency=1, timeout_seconds=0.1)
+
+
+class AsyncSyncHandlerTimeoutTests(SimpleTestCase):
+    def test_sync_handler_is_given_up_after_its_timeout(self):
+        release = threading.Event()
+        handler = _blocking_handler(release)
+
+        async def main():
+            consumer = AsyncSQSConsumer([])
+            consumer._delete = mock.AsyncMock()
+            poller = _AsyncQueuePoller(SQSQueue(STANDARD_PRIORITY, 'https://sqs/standard', 1), slots=1, batch_size=1)
+            poller.capacity = asyncio.Semaphore(0)
+            lane = _AsyncHandlerLane(handler)
+            lane.pending = 1
+            record = _AsyncInFlightMessage({'MessageId': 'm1', 'Body': '{}'}, handler, poller, visibility_timeout=30)
+
+            with mock.patch.object(ledger, 'claim_message', return_value=(ledger.CLAIMED, None)):
+                await asyncio.wait_for(consumer._handle(record, {}, lane), 2)
+
+            consumer._delete.assert_awaited_once()
+            self.assertEqual(lane.pending, 0)
+            # The handler's thread is still running and keeps its lane slot
+            self.assertTrue(lane.semaphore.locked())
+            release.set()
+            for _ in range(100):
+                if not lane.semaphore.locked():
+                    break
+                await asyncio.sleep(0.01)
+            self.assertFalse(lane.semaphore.locked())
+
+        try:
+            asyncio.run(main())
+        finally:
+            release.set()
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from elexis.models import GeminiBatchSizing
+from elexis.services.gemini_batch_service import (
+    AdaptiveBatchSizer, GEMINI_BATCH_JOB_SIZE, GEMINI_BATCH_MAX_JOB_SIZE, GEMINI_BATCH_MIN_JOB_SIZE,
+    GEMINI_BATCH_QUOTA_COOLDOWN, GEMINI_BATCH_TARGET_LATENCY_SECONDS,
+)
+
+FAST = GEMINI_BATCH_TARGET_LATENCY_SECONDS / 2
+
+
+class AdaptiveBatchSizerTests(TestCase):
+    def setUp(self):
+        self.sizer = AdaptiveBatchSizer("api-key")
+
+    def _set_batch_size(self, batch_size, sizer=None):
+        sizer = sizer or self.sizer
+        sizer.batch_size()
+        GeminiBatchSizing.objects.filter(api_key_hash=sizer.api_key_hash).update(batch_size=batch_size)
+        return sizer
+
+    def test_new_api_key_starts_at_the_default_size(self):
+        self.assertEqual(self.sizer.batch_size(), GEMINI_BATCH_JOB_SIZE)
+        self.assertNotIn("api-key", GeminiBatchSizing.objects.get().api_key_hash)
+
+    def test_plan_fills_the_jobs_evenly(self):
+        self._set_batch_size(100)
+
+        self.assertEqual(self.sizer.plan(0), 0)
+        self.assertEqual(self.sizer.plan(80), 80)
+        # Two jobs of 76 rather than 100 and 52
+        self.assertEqual(self.sizer.plan(152), 76)
+
+    def test_quota_error_halves_the_size_down_to_the_minimum(self):
+        self._set_batch_size(100)
+
+        self.assertEqual(self.sizer.record_quota_error(), 50)
+        for _ in range(10):
+            self.sizer.record_quota_error()
+        self.assertEqual(self.sizer.batch_size(), GEMINI_BATCH_MIN_JOB_SIZE)
+        self.assertEqual(GeminiBatchSizing.objects.get().quota_errors, 11)
+
+    def test_full_healthy_job_grows_the_size_up_to_the_maximum(self):
+        self._set_batch_size(100)
+
+        self.assertEqual(self.sizer.record_job(100, 100, FAST), 150)
+        for _ in range(20):
+            self.sizer.record_job(self.sizer.batch_size(), self.sizer.batch_size(), FAST)
+        self.assertEqual(self.sizer.batch_size(), GEMINI_BATCH_MAX_JOB_SIZE)
+
+    def test_partial_job_does_not_grow_the_size(self):
+        self._set_batch_size(100)
+
+        self.assertEqual(self.sizer.record_job(40, 40, FAST), 100)
+
+    def test_no_growth_during_quota_cooldown(self):
+        self.sizer.record_quota_error()
+        batch_size = self.sizer.batch_size()
+
+        self.assertEqual(self.sizer.record_job(batch_size, batch_size, FAST), batch_size)
+        GeminiBatchSizing.objects.update(last_quota_error_at=timezone.now() - GEMINI_BATCH_QUOTA_COOLDOWN - timedelta(minutes=1))
+        self.assertGreater(self.sizer.record_job(batch_size, batch_size, FAST), batch_size)
+
+    def test_failed_slow_or_failing_jobs_shrink_the_size(self):
+        self._set_batch_size(100)
+        self.assertEqual(self.sizer.record_job(100, 0, FAST, failed=True), 75)
+
+        sizer = self._set_batch_size(100, AdaptiveBatchSizer("slow-key"))
+        self.assertEqual(sizer.record_job(100, 100, GEMINI_BATCH_TARGET_LATENCY_SECONDS * 3), 75)
+
+        sizer = self._set_batch_size(100, AdaptiveBatchSizer("failing-key"))
+        # A moving average: one mostly failing job brings it below 0.8
+        self.assertEqual(sizer.record_job(100, 10, FAST), 75)
+
+    def test_api_keys_are_sized_separately(self):
+        self.sizer.record_quota_error()
+
+        self.assertEqual(AdaptiveBatchSizer("other-key").batch_size(), GEMINI_BATCH_JOB_SIZE)
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.services import sqs_consumer_pool
+from elexis.services import sqs_message_ledger as ledger
+from elexis.services.sqs_consumer_pool import (
+    LANE_FULL_REDELIVERY_DELAY_SECONDS, VISIBILITY_EXTENSION_SECONDS, VISIBILITY_HEARTBEAT_LEAD_SECONDS,
+    SQSConsumerPool, _InFlightMessage,
+)
+from elexis.services.sqs_handler_registry import MESSAGE_HANDLERS, MessageHandler
+from elexis.services.sqs_queues import STANDARD_PRIORITY, SQSQueue
+
+QUEUE = SQSQueue(STANDARD_PRIORITY, 'https://sqs/standard', 1)
+
+
+def _message(number: int, message_type: str = 'slow') -> dict:
+    return {'MessageId': f"m{number}", 'ReceiptHandle': f"r{number}", 'Body': json.dumps({"type": message_type, "data": {"n": number}})}
+
+
+class ConsumerPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.handler = MessageHandler(message_type='slow', func=lambda message: self.release.wait(5), max_concurrency=1)
+        sqs_client = mock.MagicMock()
+        sqs_client.get_queue_attributes.return_value = {'Attributes': {'VisibilityTimeout': '30'}}
+        for patcher in (
+            mock.patch.dict(MESSAGE_HANDLERS, {'slow': self.handler}),
+            mock.patch.object(sqs_consumer_pool, '_build_sqs_client', return_value=sqs_client),
+            mock.patch.object(ledger, 'claim_message', return_value=(ledger.CLAIMED, None)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sqs_client = sqs_client
+        self.pool = SQSConsumerPool([QUEUE], workers=8)
+        self.poller = self.pool._pollers[0]
+
+    def _dispatch(self, number: int, message_type: str = 'slow'):
+        self.poller.capacity.acquire()
+        self.pool._dispatch(self.poller, _message(number, message_type))
+
+    def _wait_for_lane(self, message_type: str = 'slow'):
+        lane = self.pool._lanes[message_type]
+        for _ in range(200):
+            if not lane.pending:
+                break
+            time.sleep(0.01)
+        return lane
+
+
+class LaneBackpressureTests(ConsumerPoolTestCase):
+    def test_full_lane_hands_messages_back_to_the_queue(self):
+        # One running and one queued message fill a lane of max_concurrency 1
+        for number in range(3):
+            self._dispatch(number)
+
+        self.sqs_client.change_message_visibility.assert_called_once_with(
+            QueueUrl=QUEUE.url, ReceiptHandle='r2', VisibilityTimeout=LANE_FULL_REDELIVERY_DELAY_SECONDS)
+        self.assertEqual(self.pool._lanes['slow'].pending, 2)
+
+        self.release.set()
+        self.assertEqual(self._wait_for_lane().pending, 0)
+        deleted = sorted(call.kwargs['ReceiptHandle'] for call in self.sqs_client.delete_message.call_args_list)
+        self.assertEqual(deleted, ['r0', 'r1'])
+
+    def test_lane_accepts_messages_again_once_it_drains(self):
+        self.release.set()
+        for number in range(6):
+            self._dispatch(number)
+            self._wait_for_lane()
+
+        self.sqs_client.change_message_visibility.assert_not_called()
+        self.assertEqual(self.sqs_client.delete_message.call_count, 6)
+
+
+class VisibilityHeartbeatTests(ConsumerPoolTestCase):
+    def test_long_handler_gets_its_expected_duration_up_front(self):
+        self.release.set()
+        MESSAGE_HANDLERS['long'] = MessageHandler(message_type='long', func=lambda message: None, expected_duration_seconds=600)
+
+        self._dispatch(0, 'long')
+        self._wait_for_lane('long')
+
+        self.sqs_client.change_message_visibility.assert_called_once_with(
+            QueueUrl=QUEUE.url, ReceiptHandle='r0', VisibilityTimeout=600 + VISIBILITY_HEARTBEAT_LEAD_SECONDS)
+
+    def test_only_messages_about_to_become_visible_need_a_heartbeat(self):
+        record = _InFlightMessage(_message(0), self.handler, lane=None, poller=self.poller, visibility_timeout=30)
+        now = time.monotonic()
+
+        self.assertFalse(record.needs_heartbeat(now))
+        self.assertTrue(record.needs_heartbeat(now + 30 - VISIBILITY_HEARTBEAT_LEAD_SECONDS))
+
+    def test_heartbeat_extends_messages_ten_per_request(self):
+        self.sqs_client.change_message_visibility_batch.side_effect = lambda QueueUrl, Entries: {
+            'Successful': [{'Id': entry['Id']} for entry in Entries[1:]],
+            'Failed': [{'Id': Entries[0]['Id'], 'Code': 'ReceiptHandleIsInvalid'}],
+        }
+        records = [_InFlightMessage(_message(number), self.handler, lane=None, poller=self.poller, visibility_timeout=30) for number in range(12)]
+        before = time.monotonic()
+
+        self.pool._heartbeat(records)
+
+        batches = [call.kwargs['Entries'] for call in self.sqs_client.change_message_visibility_batch.call_args_list]
+        self.assertEqual([len(entries) for entries in batches], [10, 2])
+        self.assertEqual({entry['VisibilityTimeout'] for entries in batches for entry in entries}, {VISIBILITY_EXTENSION_SECONDS})
+        # The first message of each request could not be extended
+        extended = [record.visible_at >= before + VISIBILITY_EXTENSION_SECONDS for record in records]
+        self.assertEqual(extended, [False] + [True] * 9 + [False, True])
@@ -0,0 +1,36 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import elexis.sqs_consumer  # noqa: F401 (registers the handlers)
+from elexis.services.sqs_handler_registry import MESSAGE_HANDLERS, get_queue_slots
+from elexis.services.sqs_queues import BULK_PRIORITY, INTERACTIVE_PRIORITY, STANDARD_PRIORITY, get_consumer_queues
+
+QUEUE_URLS = {
+    "SQS_QUEUE_URL": "https://sqs/interactive",
+    "SQS_STANDARD_QUEUE_URL": "https://sqs/standard",
+    "SQS_BULK_QUEUE_URL": "https://sqs/bulk",
+}
+
+
+class QueueSlotTests(SimpleTestCase):
+    def _slots(self, workers):
+        with mock.patch.dict('os.environ', QUEUE_URLS):
+            queues = get_consumer_queues()
+            return {queue.priority: get_queue_slots(queue, queues, workers) for queue in queues}
+
+    def _max_concurrency(self, priority):
+        return max(h.max_concurrency for h in MESSAGE_HANDLERS.values() if h.priority == priority)
+
+    def test_every_queue_covers_the_concurrency_of_its_handlers(self):
+        slots = self._slots(workers=8)
+
+        for priority in (INTERACTIVE_PRIORITY, STANDARD_PRIORITY, BULK_PRIORITY):
+            self.assertGreaterEqual(slots[priority], self._max_concurrency(priority))
+        # A full embedding batch can be in flight on the bulk queue
+        self.assertGreaterEqual(slots[BULK_PRIORITY], MESSAGE_HANDLERS['generate_embedding'].max_concurrency)
+
+    def test_large_consumers_keep_the_poll_weights(self):
+        slots = self._slots(workers=1000)
+
+        self.assertEqual((slots[INTERACTIVE_PRIORITY], slots[STANDARD_PRIORITY], slots[BULK_PRIORITY]), (600, 300, 100))
@@ -0,0 +1,121 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from elexis import sqs_consumer
+from elexis.models import ResumeUploadItem, ResumeUploadTracker
+from elexis.services import unified_resume_processor
+from elexis.services.unified_resume_processor import UnifiedResumeProcessor
+from elexis.tests.factories import create_bulk_tracker, create_recruiter
+from elexis.views import CandidateViewSet
+
+
+def _presigned(bucket_name, object_key, *args, **kwargs):
+    return {"url": "https://s3/bucket", "fields": {"key": object_key}}
+
+
+@mock.patch('elexis.utils.get_file_data_from_s3.generate_presigned_upload', side_effect=_presigned)
+@mock.patch.object(sqs_consumer, 'add_message_to_sqs_queue')
+class PresignBulkUploadTests(TestCase):
+    def setUp(self):
+        self.user = create_recruiter()
+        self.view = CandidateViewSet.as_view({'post': 'presign_bulk_upload'}, **CandidateViewSet.presign_bulk_upload.kwargs)
+
+    def _presign(self, files):
+        request = APIRequestFactory().post('/candidates/bulk-upload/presign/', {"files": files}, format='json')
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_files_with_the_same_name_get_their_own_keys(self, add_message, presign):
+        response = self._presign([{"name": "cv.pdf", "size": 10}, {"name": "cv.pdf", "size": 20}])
+
+        self.assertEqual(response.status_code, 201)
+        keys = list(ResumeUploadItem.objects.order_by('index').values_list('s3_key', flat=True))
+        batch_job_id = response.data["batch_job_id"]
+        self.assertEqual(keys, [f"bulk_uploads/{batch_job_id}/00000_cv.pdf", f"bulk_uploads/{batch_job_id}/00001_cv.pdf"])
+
+    def test_invalid_entries_are_rejected_before_anything_is_created(self, add_message, presign):
+        response = self._presign([
+            {"name": "ok.pdf", "size": 10},
+            {"name": "string-size.pdf", "size": "10"},
+            {"name": 3, "size": 10},
+            {"name": "negative.pdf", "size": -1},
+            {"name": "no-size.pdf"},
+            "not an object",
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["invalid_indexes"], [1, 2, 3, 4, 5])
+        self.assertFalse(ResumeUploadTracker.objects.exists())
+        add_message.assert_not_called()
+
+    def test_failed_signing_leaves_no_tracker(self, add_message, presign):
+        presign.side_effect = [_presigned("bucket", "key"), None]
+
+        response = self._presign([{"name": "a.pdf", "size": 10}, {"name": "b.pdf", "size": 10}])
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(ResumeUploadTracker.objects.exists())
+        self.assertFalse(ResumeUploadItem.objects.exists())
+
+    def test_expiry_is_scheduled(self, add_message, presign):
+        self._presign([{"name": "a.pdf", "size": 10}])
+
+        add_message.assert_called_once()
+        self.assertEqual(add_message.call_args.kwargs["type"], 'expire_direct_bulk_upload')
+        self.assertEqual(add_message.call_args.kwargs["delay_seconds"], 900)
+
+
+class ApiBulkUploadKeyTests(TestCase):
+    @mock.patch.object(unified_resume_processor, 'add_message_to_sqs_queue')
+    @mock.patch('elexis.utils.get_file_data_from_s3.upload_file_to_s3', return_value=True)
+    def test_files_with_the_same_name_get_their_own_keys(self, upload, add_message):
+        user = create_recruiter()
+        files = [SimpleUploadedFile("cv.pdf", b"first"), SimpleUploadedFile("cv.pdf", b"second")]
+
+        tracker = UnifiedResumeProcessor.create_bulk_upload_job(user.organization, user, files)
+
+        keys = sorted(call.args[1] for call in upload.call_args_list)
+        self.assertEqual(keys, [f"bulk_uploads/{tracker.batch_job_id}/00000_cv.pdf",
+                                f"bulk_uploads/{tracker.batch_job_id}/00001_cv.pdf"])
+
+
+@mock.patch.object(sqs_consumer, 'add_message_to_sqs_queue')
+class ExpireDirectBulkUploadTests(TestCase):
+    def setUp(self):
+        self.user = create_recruiter()
+        self.tracker = create_bulk_tracker(self.user, files=2, status='pending')
+        self.tracker.processing_details = {'direct_upload': True}
+        self.tracker.save(update_fields=['processing_details'])
+
+    def _expire(self, expires_at, check=0):
+        sqs_consumer.handle_expire_direct_bulk_upload({"data": {
+            "batch_job_id": str(self.tracker.batch_job_id), "expires_at": expires_at.isoformat(), "check": check,
+        }})
+        self.tracker.refresh_from_db()
+
+    def test_waits_until_the_upload_expires(self, add_message):
+        self._expire(timezone.now() + timedelta(hours=1), check=2)
+
+        self.assertEqual(self.tracker.status, 'pending')
+        self.assertEqual(add_message.call_args.kwargs["delay_seconds"], 900)
+        self.assertEqual(add_message.call_args.kwargs["data"]["check"], 3)
+
+    def test_unfinalized_upload_is_failed(self, add_message):
+        self._expire(timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.tracker.status, 'failed')
+        self.assertFalse(self.tracker.items.exclude(status='failed').exists())
+        add_message.assert_not_called()
+
+    def test_finalized_upload_is_left_alone(self, add_message):
+        self.tracker.processing_details['finalized_at'] = timezone.now().isoformat()
+        self.tracker.save(update_fields=['processing_details'])
+
+        self._expire(timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.tracker.status, 'pending')
@@ -0,0 +1,66 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.services.sqs_handler_registry import MessageHandler, RetryPolicy, arun_handler, is_final_attempt, run_handler
+
+
+class TransientError(Exception):
+    pass
+
+
+def _flaky(failures: int, error=TransientError):
+    """Handler failing `failures` times before it succeeds; records is_final_attempt() of every call"""
+    calls = []
+
+    def func(message):
+        calls.append(is_final_attempt())
+        if len(calls) <= failures:
+            raise error("boom")
+        return "done"
+    return func, calls
+
+
+class RunHandlerTests(SimpleTestCase):
+    def _handler(self, func, **policy):
+        return MessageHandler(message_type='test', func=func, retry_policy=RetryPolicy(**policy))
+
+    def test_retries_until_the_handler_succeeds(self):
+        func, calls = _flaky(failures=2)
+        with mock.patch('elexis.services.sqs_handler_registry.time.sleep') as sleep:
+            result = run_handler(self._handler(func, max_attempts=3, backoff_seconds=1, backoff_factor=2), {})
+
+        self.assertEqual(result, "done")
+        self.assertEqual(calls, [False, False, True])
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+
+    def test_reraises_once_attempts_are_exhausted(self):
+        func, calls = _flaky(failures=5)
+        with mock.patch('elexis.services.sqs_handler_registry.time.sleep'):
+            with self.assertRaises(TransientError):
+                run_handler(self._handler(func, max_attempts=2), {})
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_outside_retry_on_are_not_retried(self):
+        func, calls = _flaky(failures=1, error=ValueError)
+        with mock.patch('elexis.services.sqs_handler_registry.time.sleep'):
+            with self.assertRaises(ValueError):
+                run_handler(self._handler(func, max_attempts=3, retry_on=(TransientError,)), {})
+        self.assertEqual(calls, [False])
+
+    def test_single_attempt_is_final(self):
+        func, calls = _flaky(failures=0)
+        run_handler(self._handler(func), {})
+        self.assertEqual(calls, [True])
+
+    def test_async_runner_retries_sync_handlers(self):
+        func, calls = _flaky(failures=1)
+
+        async def run_sync(f, message):
+            return f(message)
+
+        with mock.patch('elexis.services.sqs_handler_registry.asyncio.sleep', mock.AsyncMock()):
+            result = asyncio.run(arun_handler(self._handler(func, max_attempts=2), {}, run_sync))
+        self.assertEqual(result, "done")
+        self.assertEqual(calls, [False, True])
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from elexis.models import ProcessedSQSMessage
+from elexis.services import sqs_message_ledger as ledger
+from elexis.services.sqs_handler_registry import MessageHandler
+
+PAYLOAD = {"type": "test", "data": {"id": "1"}}
+
+
+def _handler(dedup_by_payload=False):
+    return MessageHandler(message_type='test', func=lambda message: None, timeout_seconds=60,
+                          dedup_by_payload=dedup_by_payload)
+
+
+class MessageLedgerTests(TestCase):
+    def test_new_message_is_claimed(self):
+        outcome, entry = ledger.claim_message(_handler(), 'm1', PAYLOAD)
+
+        self.assertEqual(outcome, ledger.CLAIMED)
+        self.assertEqual(entry.status, 'processing')
+
+    def test_redelivery_of_a_succeeded_message_is_skipped(self):
+        _, entry = ledger.claim_message(_handler(), 'm1', PAYLOAD)
+        ledger.record_outcome(entry, succeeded=True)
+
+        self.assertEqual(ledger.claim_message(_handler(), 'm1', PAYLOAD)[0], ledger.ALREADY_PROCESSED)
+        # Without payload dedup, another message with the same payload still runs
+        self.assertEqual(ledger.claim_message(_handler(), 'm2', PAYLOAD)[0], ledger.CLAIMED)
+
+    def test_payload_dedup_skips_other_messages_with_the_same_payload(self):
+        handler = _handler(dedup_by_payload=True)
+        _, entry = ledger.claim_message(handler, 'm1', PAYLOAD)
+        ledger.record_outcome(entry, succeeded=True)
+
+        self.assertEqual(ledger.claim_message(handler, 'm2', PAYLOAD)[0], ledger.ALREADY_PROCESSED)
+        self.assertEqual(ledger.claim_message(handler, 'm3', {**PAYLOAD, "data": {"id": "2"}})[0], ledger.CLAIMED)
+
+    def test_failed_payload_is_claimed_again(self):
+        handler = _handler(dedup_by_payload=True)
+        _, entry = ledger.claim_message(handler, 'm1', PAYLOAD)
+        ledger.record_outcome(entry, succeeded=False, error=RuntimeError("Gemini error"))
+
+        outcome, entry = ledger.claim_message(handler, 'm2', PAYLOAD)
+        self.assertEqual(outcome, ledger.CLAIMED)
+        self.assertEqual((entry.attempts, entry.message_id, entry.error_message), (2, 'm2', None))
+
+    def test_message_in_progress_elsewhere_is_not_claimed(self):
+        ledger.claim_message(_handler(), 'm1', PAYLOAD)
+
+        self.assertEqual(ledger.claim_message(_handler(), 'm1', PAYLOAD)[0], ledger.IN_PROGRESS)
+
+    def test_claim_of_a_dead_consumer_expires(self):
+        _, entry = ledger.claim_message(_handler(), 'm1', PAYLOAD)
+        ProcessedSQSMessage.objects.filter(pk=entry.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(ledger.claim_message(_handler(), 'm1', PAYLOAD)[0], ledger.CLAIMED)
+
+    def test_purge_removes_only_expired_entries(self):
+        _, expired = ledger.claim_message(_handler(), 'm1', PAYLOAD)
+        ledger.claim_message(_handler(), 'm2', PAYLOAD)
+        ProcessedSQSMessage.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(ledger.purge_expired_entries(), 1)
+        self.assertEqual(list(ProcessedSQSMessage.objects.values_list('message_id', flat=True)), ['m2'])
@@ -0,0 +1,88 @@
+import re
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.services import resume_parser
+from elexis.services.resume_parser import (
+    PackedExtraction, PackedResumeContact, extract_resumes_data_from_texts, extract_with_ai_packed, pack_resume_texts,
+)
+
+
+def answer_every_resume(prompt, **kwargs):
+    """A Gemini answer naming each resume of the prompt after its first line"""
+    return PackedExtraction(resumes=[
+        PackedResumeContact(id=resume_id, name=text.strip().splitlines()[0], email=f"{resume_id}@example.com")
+        for resume_id, text in re.findall(r'<resume id="(\d+)">(.*?)</resume>', prompt, re.S)
+    ])
+
+
+class PackResumeTextsTests(SimpleTestCase):
+    def test_small_texts_share_a_pack(self):
+        texts = {f"resume {index}": "short text" for index in range(5)}
+
+        self.assertEqual(pack_resume_texts(texts), [texts])
+
+    @mock.patch.object(resume_parser, 'PACKED_EXTRACTION_MAX_RESUMES', 2)
+    def test_pack_holds_at_most_max_resumes(self):
+        packs = pack_resume_texts({f"resume {index}": "short text" for index in range(5)})
+
+        self.assertEqual([len(pack) for pack in packs], [2, 2, 1])
+
+    @mock.patch.object(resume_parser, 'PACKED_EXTRACTION_TOKEN_BUDGET', 1000)
+    def test_pack_fits_the_token_budget(self):
+        # 500 tokens each with its overhead: only one fits next to the prompt
+        packs = pack_resume_texts({f"resume {index}": "x" * 1840 for index in range(3)})
+
+        self.assertEqual([len(pack) for pack in packs], [1, 1, 1])
+
+    def test_texts_are_truncated_and_keep_their_order(self):
+        texts = {"b": "y" * 5000, "a": "short text"}
+
+        (pack,) = pack_resume_texts(texts)
+
+        self.assertEqual(list(pack), ["b", "a"])
+        self.assertEqual(len(pack["b"]), resume_parser.RESUME_TEXT_LIMIT)
+
+
+class PackedExtractionTests(SimpleTestCase):
+    @mock.patch.object(resume_parser, 'PACKED_EXTRACTION_MAX_RESUMES', 2)
+    def test_answers_are_mapped_back_to_their_keys(self):
+        texts = {f"hash{index}": f"Person {index}\nPython developer" for index in range(3)}
+
+        with mock.patch.object(resume_parser.GeminiClient, 'query', side_effect=answer_every_resume) as query:
+            results = extract_with_ai_packed(texts)
+
+        self.assertEqual(query.call_count, 2)
+        self.assertEqual({key: data.name for key, data in results.items()},
+                         {"hash0": "Person 0", "hash1": "Person 1", "hash2": "Person 2"})
+        # Ids restart in every pack
+        self.assertEqual(results["hash2"].email, "0@example.com")
+
+    def test_unknown_ids_and_missing_resumes_get_empty_data(self):
+        answer = PackedExtraction(resumes=[PackedResumeContact(id="7", name="Nobody"), PackedResumeContact(id="1", name="Bob")])
+
+        with mock.patch.object(resume_parser.GeminiClient, 'query', return_value=answer):
+            results = extract_with_ai_packed({"a": "Alice", "b": "Bob"})
+
+        self.assertEqual((results["a"].name, results["b"].name), (None, "Bob"))
+
+    @mock.patch.object(resume_parser, 'PACKED_EXTRACTION_MAX_RESUMES', 1)
+    def test_failed_pack_does_not_fail_the_others(self):
+        with mock.patch.object(resume_parser.GeminiClient, 'query', side_effect=[Exception("503"), answer_every_resume('<resume id="0">Bob</resume>')]):
+            results = extract_with_ai_packed({"a": "Alice", "b": "Bob"})
+
+        self.assertEqual((results["a"].name, results["b"].name), (None, "Bob"))
+
+    def test_regex_fallback_and_short_texts(self):
+        texts = {"a": "Alice Smith\nalice@example.com\nPython developer", "b": "", "c": "tiny"}
+
+        with mock.patch.object(resume_parser.GeminiClient, 'query', return_value=PackedExtraction()) as query:
+            results = extract_resumes_data_from_texts(texts)
+
+        # Only the usable text is sent
+        self.assertEqual(query.call_count, 1)
+        self.assertNotIn("tiny", query.call_args.kwargs['prompt'])
+        self.assertEqual(results["a"].email, "alice@example.com")
+        self.assertEqual(results["a"].raw_text, texts["a"])
+        self.assertEqual((results["b"].name, results["c"].raw_text), (None, "tiny"))
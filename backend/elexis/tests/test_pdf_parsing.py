@@ -0,0 +1,53 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.services import pdf_parsing_service
+from elexis.utils.pdf_text import LocalPdfText
+
+
+class PdfParsingServiceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(pdf_parsing_service, '_service', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parses_in_the_calling_thread_unless_configured(self):
+        service = pdf_parsing_service.get_pdf_parsing_service()
+
+        with mock.patch.object(pdf_parsing_service, 'read_pdf_text_locally', return_value=LocalPdfText(pages=["text"])):
+            self.assertEqual(pdf_parsing_service.parse_pdf(b"%PDF").pages, ["text"])
+        self.assertEqual(service.processes, 0)
+        self.assertIsNone(service._executor)
+
+    def test_hung_parser_is_given_up_on_the_main_thread(self):
+        service = pdf_parsing_service.PdfParsingService(timeout_seconds=1)
+
+        with mock.patch.object(pdf_parsing_service, 'read_pdf_text_locally', side_effect=lambda content: time.sleep(10)):
+            started = time.monotonic()
+            self.assertEqual(service.parse(b"%PDF").pages, [])
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_other_threads_leave_the_file_to_the_llm(self):
+        results = []
+        with mock.patch.object(pdf_parsing_service, 'read_pdf_text_locally') as read_locally:
+            thread = threading.Thread(target=lambda: results.append(pdf_parsing_service.parse_pdf(b"%PDF")))
+            thread.start()
+            thread.join()
+
+        read_locally.assert_not_called()
+        self.assertEqual(results[0].pages, [])
+
+    def test_configure_replaces_the_service(self):
+        previous = pdf_parsing_service.get_pdf_parsing_service()
+
+        with mock.patch.object(previous, 'shutdown') as shutdown:
+            pdf_parsing_service.configure_pdf_parsing(3)
+
+        shutdown.assert_called_once()
+        service = pdf_parsing_service.get_pdf_parsing_service()
+        self.assertEqual(service.processes, 3)
+        # The pool is only started by the first file
+        self.assertIsNone(service._executor)
@@ -0,0 +1,92 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.utils import pdf_text
+
+TEXT_PAGE = ["Jane Doe - Senior Backend Engineer", "jane.doe@example.com  +1 555 0100",
+             "Python, Django, PostgreSQL, AWS SQS and S3"] * 4
+SCANNED_PAGE = None
+
+
+def make_pdf(pages) -> bytes:
+    """A PDF with a page per entry: lines of text, or SCANNED_PAGE for a page that is only an image"""
+    body = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+            4: b"<< /Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray /BitsPerComponent 8"
+               b" /Length 1 >>\nstream\n\x00\nendstream"}
+    kids = []
+    for index, lines in enumerate(pages):
+        page_id, content_id = 5 + 2 * index, 6 + 2 * index
+        kids.append(f"{page_id} 0 R")
+        if lines is SCANNED_PAGE:
+            resources, stream = "/XObject << /Im1 4 0 R >>", b"q 612 0 0 792 0 0 cm /Im1 Do Q"
+        else:
+            resources = "/Font << /F1 3 0 R >>"
+            stream = ("BT /F1 11 Tf 50 750 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET").encode()
+        body[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << {resources} >>"
+                         f" /Contents {content_id} 0 R >>").encode()
+        body[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    body[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    out, offsets = b"%PDF-1.4\n", {}
+    for number in sorted(body):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n" % number + body[number] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(body) + 1)
+    for number in sorted(body):
+        out += b"%010d 00000 n \n" % offsets[number]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(body) + 1, xref)
+    return out
+
+
+class LocalPdfTextTests(SimpleTestCase):
+    def _extract(self, pdf_content):
+        llm = mock.Mock(return_value="LLM TEXT")
+        return pdf_text.extract_pdf_text(pdf_content, llm), llm
+
+    def test_digital_pdf_is_read_locally(self):
+        text, llm = self._extract(make_pdf([TEXT_PAGE, TEXT_PAGE]))
+
+        llm.assert_not_called()
+        self.assertIn("jane.doe@example.com", text)
+
+    def test_blank_trailing_page_is_skipped(self):
+        local = pdf_text.read_pdf_text_locally(make_pdf([TEXT_PAGE, []]))
+        self.assertEqual((local.failed_pages, local.blank_pages), ([], [1]))
+
+        text, llm = self._extract(make_pdf([TEXT_PAGE, []]))
+        llm.assert_not_called()
+        self.assertIn("Senior Backend Engineer", text)
+
+    def test_short_page_without_images_is_read_locally(self):
+        local = pdf_text.read_pdf_text_locally(make_pdf([TEXT_PAGE * 2, ["References on request"]]))
+
+        self.assertEqual(local.failed_pages, [])
+        self.assertFalse(local.needs_whole_file)
+
+    def test_only_the_scanned_page_goes_to_the_llm(self):
+        text, llm = self._extract(make_pdf([TEXT_PAGE, SCANNED_PAGE, TEXT_PAGE]))
+
+        llm.assert_called_once()
+        sent = pdf_text.PyPDF2.PdfReader(pdf_text.BytesIO(llm.call_args.args[0]))
+        self.assertEqual(len(sent.pages), 1)
+        self.assertEqual(text.splitlines()[1], "LLM TEXT")
+
+    def test_scanned_pdf_goes_to_the_llm_whole(self):
+        pdf_content = make_pdf([SCANNED_PAGE, SCANNED_PAGE])
+
+        text, llm = self._extract(pdf_content)
+
+        llm.assert_called_once_with(pdf_content)
+        self.assertEqual(text, "LLM TEXT")
+
+    def test_unreadable_file_goes_to_the_llm_whole(self):
+        text, llm = self._extract(b"not a pdf")
+
+        llm.assert_called_once_with(b"not a pdf")
+        self.assertEqual(text, "LLM TEXT")
+
+    def test_garbage_ratio_counts_unmapped_glyphs(self):
+        self.assertGreater(pdf_text.garbage_ratio("(cid:12)(cid:13) ab"), pdf_text.PDF_MAX_GARBAGE_RATIO)
+        self.assertEqual(pdf_text.garbage_ratio("plain text"), 0)
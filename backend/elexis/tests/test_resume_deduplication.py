@@ -0,0 +1,112 @@
+import hashlib
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from elexis import sqs_consumer
+from elexis.models import Candidate, JobMatchingResumeScore
+from elexis.tests.factories import create_bulk_tracker, create_candidate, create_job, create_recruiter
+
+RESUME = b"%PDF-1.4 resume of Jane Doe"
+OTHER_RESUME = b"%PDF-1.4 resume of John Roe"
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def create_resume_candidate(user, content: bytes):
+    candidate = create_candidate(user)
+    # Candidate.save hashes the resume file; these candidates have none
+    Candidate.objects.filter(pk=candidate.pk).update(resume_content_hash=content_hash(content))
+    candidate.resume_content_hash = content_hash(content)
+    return candidate
+
+
+def extract_contacts(texts):
+    return {resume_hash: SimpleNamespace(name="Jane Doe", email="jane@example.com", phone=None) for resume_hash in texts}
+
+
+class BulkResumeDeduplicationTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        storage = override_settings(STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage", "OPTIONS": {"location": media_root}},
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        })
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        self.user = create_recruiter()
+        self.job = create_job(self.user)
+
+    def _process(self, tracker, contents):
+        """Process the items of the tracker as one chunk; the files of the items are `contents`"""
+        items = list(tracker.items.order_by('index'))
+        files_by_key = {item.s3_key: content for item, content in zip(items, contents)}
+        with mock.patch.object(sqs_consumer, 'get_file_bytes_from_s3', side_effect=lambda bucket, key: files_by_key[key]) as download, \
+                mock.patch.object(sqs_consumer, 'extract_text_from_local_pdf', return_value="resume text") as extract, \
+                mock.patch.object(sqs_consumer, 'extract_resumes_data_from_texts', side_effect=extract_contacts), \
+                mock.patch.object(sqs_consumer, 'add_message_to_sqs_queue'):
+            sqs_consumer.process_bulk_resume_files(tracker, items, self.user.organization, self.user, self.job)
+        for item in items:
+            item.refresh_from_db()
+        return items, download, extract
+
+    def test_file_hashed_during_upload_is_attached_without_download(self):
+        existing = create_resume_candidate(self.user, RESUME)
+        tracker = create_bulk_tracker(self.user, files=1, job=self.job)
+        tracker.items.update(content_hash=content_hash(RESUME))
+
+        (item,), download, _ = self._process(tracker, [RESUME])
+
+        download.assert_not_called()
+        self.assertEqual((item.status, item.candidate, item.deduplicated), ('succeeded', existing, True))
+        self.assertEqual(Candidate.objects.count(), 1)
+        self.assertTrue(JobMatchingResumeScore.objects.filter(job=self.job, candidate=existing).exists())
+
+    def test_copies_within_a_chunk_create_one_candidate(self):
+        tracker = create_bulk_tracker(self.user, files=3, job=self.job)
+
+        items, _, extract = self._process(tracker, [RESUME, RESUME, OTHER_RESUME])
+
+        self.assertEqual(extract.call_count, 2)
+        self.assertEqual(Candidate.objects.count(), 2)
+        self.assertEqual(items[0].candidate, items[1].candidate)
+        self.assertEqual([item.deduplicated for item in items], [False, True, False])
+        self.assertEqual(items[0].candidate.resume_content_hash, content_hash(RESUME))
+        self.assertEqual(JobMatchingResumeScore.objects.filter(job=self.job).count(), 2)
+
+    def test_duplicates_are_reported_separately(self):
+        create_resume_candidate(self.user, RESUME)
+        tracker = create_bulk_tracker(self.user, files=2, job=self.job)
+
+        self._process(tracker, [RESUME, OTHER_RESUME])
+        tracker.refresh_file_totals()
+
+        tracker.refresh_from_db()
+        self.assertEqual((tracker.successful_files, tracker.deduplicated_files), (1, 1))
+
+    def test_resume_of_another_organization_is_not_a_duplicate(self):
+        create_resume_candidate(create_recruiter(org_name="Other"), RESUME)
+        tracker = create_bulk_tracker(self.user, files=1, job=self.job)
+
+        (item,), _, _ = self._process(tracker, [RESUME])
+
+        self.assertFalse(item.deduplicated)
+        self.assertEqual(item.candidate.organization, self.user.organization)
+
+
+class FindDuplicateCandidatesTests(TestCase):
+    def test_oldest_candidate_per_hash(self):
+        user = create_recruiter()
+        first = create_resume_candidate(user, RESUME)
+        create_resume_candidate(user, RESUME)
+
+        duplicates = sqs_consumer._find_duplicate_candidates(user.organization, {content_hash(RESUME), content_hash(OTHER_RESUME)})
+
+        self.assertEqual(duplicates, {content_hash(RESUME): first})
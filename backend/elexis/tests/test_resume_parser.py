@@ -0,0 +1,47 @@
+import io
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.services import resume_parser
+from elexis.services.resume_parser import extract_text_from_local_pdf, read_resume_bytes
+
+PDF = b"%PDF-1.4 resume"
+
+
+class ReadResumeBytesTests(SimpleTestCase):
+    def test_buffers_are_read_as_bytes(self):
+        for source in (PDF, bytearray(PDF), memoryview(PDF)):
+            self.assertEqual(read_resume_bytes(source), PDF)
+
+    def test_path_is_read_and_missing_path_gives_none(self):
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+            pdf_file.write(PDF)
+            pdf_file.flush()
+            self.assertEqual(read_resume_bytes(pdf_file.name), PDF)
+        self.assertIsNone(read_resume_bytes("/nonexistent/resume.pdf"))
+
+    def test_file_like_is_read_whole_and_rewound(self):
+        upload = io.BytesIO(PDF)
+        upload.read(4)
+
+        self.assertEqual(read_resume_bytes(upload), PDF)
+        # Storage saves the upload after parsing
+        self.assertEqual(upload.tell(), 0)
+
+
+class ExtractTextFromBytesTests(SimpleTestCase):
+    def test_bytes_go_to_gemini_without_a_temp_file(self):
+        with mock.patch.object(resume_parser.genai, 'GenerativeModel') as model, \
+                mock.patch('tempfile.NamedTemporaryFile') as temp_file:
+            model.return_value.generate_content.return_value.text = "Jane Doe"
+            text = extract_text_from_local_pdf(io.BytesIO(PDF))
+
+        self.assertEqual(text, "Jane Doe")
+        prompt, blob = model.return_value.generate_content.call_args.args[0]
+        self.assertEqual(blob['data'], PDF)
+        temp_file.assert_not_called()
+
+    def test_unreadable_source_gives_empty_text(self):
+        self.assertEqual(extract_text_from_local_pdf("/nonexistent/resume.pdf"), "")
@@ -0,0 +1,29 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from elexis.services import resume_text_store
+
+
+def _candidate():
+    return mock.Mock(id=1, pk=1, resume=mock.Mock(url="https://s3/resume.pdf"), resume_content_hash=None)
+
+
+class ResumeTextTests(SimpleTestCase):
+    def test_failed_download_gives_empty_text(self):
+        with mock.patch.object(resume_text_store.requests, 'get', return_value=mock.Mock(status_code=403)):
+            self.assertEqual(resume_text_store.get_resume_text(_candidate()), "")
+
+    def test_failed_download_gives_empty_text_in_async_mode(self):
+        with mock.patch('elexis.services.async_dependencies.http_get', mock.AsyncMock(return_value=mock.Mock(status_code=403))):
+            self.assertEqual(asyncio.run(resume_text_store.aget_resume_text(_candidate())), "")
+
+    def test_unreadable_resume_gives_empty_text(self):
+        response = mock.Mock(status_code=200, content=b"%PDF")
+        with mock.patch.object(resume_text_store.requests, 'get', return_value=response), \
+                mock.patch.object(resume_text_store.Candidate.objects, 'filter'), \
+                mock.patch.object(resume_text_store, '_stored', return_value=None), \
+                mock.patch.object(resume_text_store, 'store_extraction'), \
+                mock.patch.object(resume_text_store, 'extract_text_from_pdf_bytes', return_value=None):
+            self.assertEqual(resume_text_store.get_resume_text(_candidate()), "")
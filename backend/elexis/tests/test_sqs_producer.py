@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from elexis.services import sqs_producer
+from elexis.services.sqs_producer import SQSProducer, SQSSendError
+
+
+# Not wrapped in a transaction, so messages are only deferred inside the tests' own atomic blocks
+class SQSProducerTests(TransactionTestCase):
+    def setUp(self):
+        # A producer of its own, not the process wide one
+        self.producer = object.__new__(SQSProducer)
+        self.producer._initialize()
+        self.producer._client = mock.Mock()
+        self.producer._client.send_message_batch.side_effect = self._accept
+        self.producer.flush_interval = 60
+        self.addCleanup(self.producer.flush)
+        patcher = mock.patch.object(sqs_producer.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _accept(self, QueueUrl, Entries):
+        return {'Successful': [{'Id': entry['Id'], 'MessageId': f"id-{entry['Id']}"} for entry in Entries]}
+
+    def _reject(self, QueueUrl, Entries):
+        return {'Failed': [{'Id': entry['Id'], 'Code': 'ServiceUnavailable', 'SenderFault': False} for entry in Entries]}
+
+    def test_failed_entries_are_retried_with_backoff(self):
+        responses = [self._reject, self._reject, self._accept]
+        self.producer._client.send_message_batch.side_effect = lambda **kwargs: responses.pop(0)(**kwargs)
+
+        future = self.producer.send('proctor', {}, queue_url='https://sqs/queue')
+        self.producer.flush()
+
+        self.assertTrue(future.result().startswith("id-"))
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.1, 0.2])
+
+    def test_message_is_failed_after_max_attempts(self):
+        self.producer._client.send_message_batch.side_effect = self._reject
+
+        future = self.producer.send('proctor', {}, queue_url='https://sqs/queue')
+        self.producer.flush()
+
+        self.assertIsInstance(future.exception(), SQSSendError)
+        self.assertEqual(self.producer._client.send_message_batch.call_count, self.producer.max_attempts)
+
+    def test_send_inside_a_transaction_returns_no_future(self):
+        with transaction.atomic():
+            self.assertIsNone(self.producer.send('proctor', {}, queue_url='https://sqs/queue'))
+            self.assertEqual(self.producer._buffer, [])
+
+        self.assertEqual(len(self.producer._buffer), 1)
+
+    def test_rolled_back_send_is_dropped(self):
+        try:
+            with transaction.atomic():
+                self.producer.send('proctor', {}, queue_url='https://sqs/queue')
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual(self.producer._buffer, [])
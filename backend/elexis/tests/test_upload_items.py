@@ -0,0 +1,93 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from elexis import sqs_consumer
+from elexis.models import GeminiBatchJob, ResumeUploadItem
+from elexis.tests.factories import create_bulk_tracker, create_candidate, create_recruiter
+
+
+class UploadItemClaimTests(TestCase):
+    def setUp(self):
+        self.user = create_recruiter()
+        self.tracker = create_bulk_tracker(self.user, files=3)
+        self.items = list(self.tracker.items.order_by('index'))
+
+    def _ids(self, items):
+        return [str(item.id) for item in items]
+
+    def test_pending_items_are_claimed_in_order(self):
+        claimed = ResumeUploadItem.claim_many(self._ids(reversed(self.items)))
+
+        self.assertEqual([item.index for item in claimed], [0, 1, 2])
+        self.assertTrue(all(item.status == 'processing' and item.attempts == 1 for item in claimed))
+        self.assertEqual(ResumeUploadItem.objects.filter(status='processing', started_at__isnull=False).count(), 3)
+
+    def test_claimed_and_finished_items_are_not_claimed_again(self):
+        ResumeUploadItem.claim(self.items[0].id)
+        self.items[1].succeed(create_candidate(self.user))
+
+        claimed = ResumeUploadItem.claim_many(self._ids(self.items))
+
+        self.assertEqual([item.index for item in claimed], [2])
+
+    def test_item_of_a_dead_worker_is_claimed_again(self):
+        ResumeUploadItem.claim(self.items[0].id)
+        ResumeUploadItem.objects.filter(pk=self.items[0].pk).update(
+            started_at=timezone.now() - ResumeUploadItem.CLAIM_TIMEOUT * 2)
+
+        item = ResumeUploadItem.claim(self.items[0].id)
+
+        self.assertEqual((item.status, item.attempts), ('processing', 2))
+
+    def test_item_is_failed_after_max_attempts(self):
+        ResumeUploadItem.objects.filter(pk=self.items[0].pk).update(attempts=ResumeUploadItem.MAX_ATTEMPTS)
+
+        item = ResumeUploadItem.claim(self.items[0].id)
+
+        self.assertEqual(item.status, 'failed')
+        self.assertEqual(ResumeUploadItem.objects.get(pk=item.pk).status, 'failed')
+
+    def test_items_waiting_for_a_gemini_batch_job_are_not_claimed(self):
+        job = GeminiBatchJob.objects.create(tracker=self.tracker, name="batches/1")
+        ResumeUploadItem.objects.filter(pk=self.items[0].pk).update(gemini_batch_job=job)
+
+        self.assertIsNone(ResumeUploadItem.claim(self.items[0].id))
+        GeminiBatchJob.objects.filter(pk=job.pk).update(state='succeeded')
+        self.assertIsNotNone(ResumeUploadItem.claim(self.items[0].id))
+
+
+class UploadResumeTests(TestCase):
+    def setUp(self):
+        self.user = create_recruiter()
+        self.tracker = create_bulk_tracker(self.user, files=3)
+        self.items = list(self.tracker.items.order_by('index'))
+
+    def _resume(self):
+        with mock.patch.object(sqs_consumer, 'add_message_to_sqs_queue') as add_message, \
+                mock.patch.object(sqs_consumer.sqs_producer, 'flush'):
+            sqs_consumer.handle_process_bulk_resumes({"type": "process_bulk_resumes", "data": {
+                "batch_job_id": str(self.tracker.batch_job_id), "organization_id": str(self.user.organization_id),
+                "user_id": str(self.user.id), "job_id": None,
+            }})
+        return [call.kwargs['data'] for call in add_message.call_args_list if call.kwargs['type'] == 'process_bulk_resume_file']
+
+    def test_resume_queues_only_unfinished_items(self):
+        self.items[0].succeed(create_candidate(self.user))
+        ResumeUploadItem.claim(self.items[1].id)
+
+        messages = self._resume()
+
+        self.assertEqual([data["item_ids"] for data in messages], [[str(self.items[2].id)]])
+
+    def test_resumed_chunk_gets_a_new_payload(self):
+        first = self._resume()
+        ResumeUploadItem.claim_many([str(item.id) for item in self.items])
+        ResumeUploadItem.objects.update(started_at=timezone.now() - ResumeUploadItem.CLAIM_TIMEOUT * 2)
+
+        second = self._resume()
+
+        # Same items, but not deduplicated away by the message ledger
+        self.assertEqual(first[0]["item_ids"], second[0]["item_ids"])
+        self.assertNotEqual(first[0]["attempt"], second[0]["attempt"])
@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from elexis.services import upload_progress
+from elexis.services.upload_progress import ProgressStream, progress_hub
+from elexis.tests.factories import create_bulk_tracker, create_recruiter
+from elexis.views import ResumeUploadTrackerViewSet
+
+
+@mock.patch.object(upload_progress, 'UPLOAD_PROGRESS_MAX_STREAMS', 2)
+class ProgressStreamTests(TestCase):
+    def setUp(self):
+        self.user = create_recruiter()
+        self.tracker = create_bulk_tracker(self.user, files=2)
+        # Would close the connection of the test's transaction
+        patcher = mock.patch.object(upload_progress.connection, 'close')
+        self.close_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.view = ResumeUploadTrackerViewSet.as_view({'get': 'stream_progress'}, **ResumeUploadTrackerViewSet.stream_progress.kwargs)
+
+    def tearDown(self):
+        self.assertFalse(progress_hub._subscriptions)
+
+    def _stream(self):
+        request = APIRequestFactory().get('/upload-tracker/stream/', HTTP_ACCEPT='text/event-stream')
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_streams_a_snapshot_then_the_changes(self):
+        response = self._stream()
+        events = iter(response.streaming_content)
+        self.assertIn(b"retry:", next(events))
+        self.assertIn(b"event: snapshot", next(events))
+
+        snapshot = upload_progress.tracker_snapshot(self.tracker)
+        progress_hub.dispatch({**snapshot, "processed_files": 1})
+        self.assertIn(b'"processed_files": 1', next(events))
+        # The connection is not held while waiting for updates
+        self.close_connection.assert_called_once()
+        response.close()
+
+    def test_response_closed_before_iterating_unsubscribes(self):
+        response = self._stream()
+        self.assertEqual(len(progress_hub._subscriptions), 1)
+
+        response.close()
+
+    def test_failing_snapshot_unsubscribes(self):
+        with mock.patch('elexis.views.tracker_snapshot', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self._stream()
+
+    def test_streams_over_the_cap_are_refused(self):
+        open_streams = [self._stream(), self._stream()]
+
+        response = self._stream()
+
+        self.assertEqual(response.status_code, 503)
+        for stream in open_streams:
+            stream.close()
+
+
+class ProgressStreamDisabledTests(TestCase):
+    def test_streaming_is_off_by_default(self):
+        self.assertIsNone(progress_hub.subscribe("org"))
+
+    def test_closing_an_unstarted_stream_unsubscribes(self):
+        subscription = progress_hub.subscribe("org", max_subscriptions=1)
+
+        ProgressStream(subscription, []).close()
+
+        self.assertFalse(progress_hub._subscriptions)
@@ -0,0 +1,56 @@
+from django.test import TestCase
+
+from elexis.tests.factories import create_bulk_tracker, create_candidate, create_job, create_recruiter
+
+
+class BulkUploadCompletionTests(TestCase):
+    def setUp(self):
+        self.user = create_recruiter()
+
+    def _finish_items(self, tracker, failed=0):
+        for item in tracker.items.order_by('index'):
+            if item.index < failed:
+                item.fail("Broken PDF")
+            else:
+                item.succeed(create_candidate(self.user, email=f"c{item.index}@example.com"))
+
+    def test_upload_without_job_completes_when_files_are_done(self):
+        tracker = create_bulk_tracker(self.user, files=2)
+        self._finish_items(tracker)
+
+        self.assertTrue(tracker.refresh_file_totals())
+
+        tracker.refresh_from_db()
+        self.assertEqual(tracker.status, 'completed')
+        self.assertEqual((tracker.processed_files, tracker.successful_files, tracker.ai_processed_files), (2, 2, 0))
+
+    def test_upload_to_job_waits_for_ai_evaluations(self):
+        tracker = create_bulk_tracker(self.user, files=2, job=create_job(self.user))
+        self._finish_items(tracker)
+
+        tracker.refresh_file_totals()
+        tracker.refresh_from_db()
+        self.assertEqual(tracker.status, 'processing')
+        self.assertIsNotNone(tracker.completed_at)
+
+        self.assertFalse(tracker.increment_ai_progress(succeeded=True))
+        self.assertTrue(tracker.increment_ai_progress(succeeded=False))
+        tracker.refresh_from_db()
+        self.assertEqual(tracker.status, 'partially_failed')
+        self.assertEqual(tracker.error_message, "AI processing failed for 1 out of 2 files")
+
+    def test_failed_files_are_not_waited_for(self):
+        tracker = create_bulk_tracker(self.user, files=2, job=create_job(self.user))
+        self._finish_items(tracker, failed=1)
+
+        tracker.refresh_file_totals()
+        self.assertTrue(tracker.increment_ai_progress(succeeded=True))
+        tracker.refresh_from_db()
+        self.assertEqual(tracker.status, 'partially_failed')
+
+    def test_file_stage_is_ended_once(self):
+        tracker = create_bulk_tracker(self.user, files=1)
+        self._finish_items(tracker)
+
+        self.assertTrue(tracker.refresh_file_totals())
+        self.assertFalse(tracker.refresh_file_totals())
@@ -14,6 +14,10 @@ def get_file_data_from_s3(bucket,key):
     response = s3.get_object(Bucket=bucket, Key=key)
     return response['Body'].read().decode('utf-8')
 
+def get_file_bytes_from_s3(bucket, key) -> bytes:
+    response = s3.get_object(Bucket=bucket, Key=key)
+    return response['Body'].read()
+
 def put_dict_as_json_to_s3(bucket, key, data):
     s3.put_object(
                 Bucket=bucket,
@@ -59,3 +63,25 @@ def generate_signed_url(bucket_name, object_key, expires_in=3600):
     except Exception as e:
         print("Error generating signed URL:", e)
         return None
+
+
+def generate_presigned_upload(bucket_name, object_key, content_type='application/pdf', max_size=None, expires_in=3600):
+    """
+    Presigned POST for uploading one object straight from the browser: returns {"url", "fields"}, the
+    fields go in the multipart form before the file. The object must have `content_type` and, with
+    `max_size`, at most that many bytes. Signed locally, no request to S3.
+    """
+    conditions = [{"Content-Type": content_type}]
+    if max_size:
+        conditions.append(["content-length-range", 1, max_size])
+    try:
+        return s3.generate_presigned_post(
+            Bucket=bucket_name,
+            Key=object_key,
+            Fields={"Content-Type": content_type},
+            Conditions=conditions,
+            ExpiresIn=expires_in
+        )
+    except Exception as e:
+        print("Error generating presigned upload:", e)
+        return None
@@ -0,0 +1,191 @@
+"""
+Local-first PDF text extraction
+Most resumes are digital PDFs that PyPDF2 reads in milliseconds. The local text is checked page by page
+(character density, garbage ratio) and for the whole file (page coverage); only the pages that fail are
+sent to the LLM, or the whole file when it looks scanned. Blank pages (no text and no images) are skipped.
+"""
+
+import asyncio
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Awaitable, Callable, List, Optional
+
+import PyPDF2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# A page is readable with at least this many visible characters ...
+PDF_MIN_PAGE_CHARS = int(os.getenv("PDF_MIN_PAGE_CHARS", 40))
+# ... of which at most this share is garbage (control, private use or replacement characters, (cid:NN) glyphs)
+PDF_MAX_GARBAGE_RATIO = float(os.getenv("PDF_MAX_GARBAGE_RATIO", 0.1))
+# Below this share of readable pages, or this many visible characters per page, the whole file is sent to the LLM
+PDF_MIN_PAGE_COVERAGE = float(os.getenv("PDF_MIN_PAGE_COVERAGE", 0.5))
+PDF_MIN_CHARS_PER_PAGE = int(os.getenv("PDF_MIN_CHARS_PER_PAGE", 200))
+
+_CID_GLYPH = re.compile(r"\(cid:\d+\)")
+_INLINE_IMAGE = re.compile(rb"\bBI\b")
+_GARBAGE_CATEGORIES = {'Cc', 'Co', 'Cn', 'Cs'}
+
+
+@dataclass
+class LocalPdfText:
+    """The local text of each page, the pages (0-based) the LLM has to read instead, and the blank pages"""
+    pages: List[str] = field(default_factory=list)
+    failed_pages: List[int] = field(default_factory=list)
+    blank_pages: List[int] = field(default_factory=list)
+
+    @property
+    def needs_whole_file(self) -> bool:
+        # Blank pages say nothing about whether the file is scanned
+        content_pages = len(self.pages) - len(self.blank_pages)
+        if not content_pages:
+            return True
+        readable = content_pages - len(self.failed_pages)
+        visible = sum(_visible_chars(text) for text in self.pages)
+        return readable / content_pages < PDF_MIN_PAGE_COVERAGE or visible / content_pages < PDF_MIN_CHARS_PER_PAGE
+
+
+def _visible_chars(text: str) -> int:
+    return sum(1 for char in text if not char.isspace())
+
+
+def garbage_ratio(text: str) -> float:
+    """Share of the visible characters of `text` that are not real text"""
+    visible = _visible_chars(text)
+    if not visible:
+        return 1.0
+    garbage = sum(len(glyph) for glyph in _CID_GLYPH.findall(text))
+    text = _CID_GLYPH.sub('', text)
+    garbage += sum(
+        1 for char in text
+        if not char.isspace() and (char == '\ufffd' or unicodedata.category(char) in _GARBAGE_CATEGORIES)
+    )
+    return garbage / visible
+
+
+def page_text_is_readable(text: str, has_images: bool = True) -> bool:
+    """
+    Whether the local text of a page can be used. A page without images has no text beyond what the
+    parser found, so a short text (a footer, a last line) is enough there.
+    """
+    if has_images and _visible_chars(text) < PDF_MIN_PAGE_CHARS:
+        return False
+    return garbage_ratio(text) <= PDF_MAX_GARBAGE_RATIO
+
+
+def page_has_images(page) -> bool:
+    """Whether the page draws images or other XObjects, which may hold text only the LLM can read"""
+    try:
+        resources = page.get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        xobjects = resources.get('/XObject')
+        if xobjects is not None and len(xobjects.get_object()):
+            return True
+        contents = page.get_contents()
+        return bool(contents is not None and _INLINE_IMAGE.search(contents.get_data()))
+    except Exception:
+        # When in doubt the page is not blank
+        return True
+
+
+def read_pdf_text_locally(pdf_content: bytes) -> LocalPdfText:
+    """Text of every page with PyPDF2; a PDF it can not open has no pages (the whole file goes to the LLM)"""
+    local = LocalPdfText()
+    try:
+        reader = PyPDF2.PdfReader(BytesIO(pdf_content))
+        for index, page in enumerate(reader.pages):
+            try:
+                text = page.extract_text() or ""
+            except Exception as e:
+                print(f"PDF text ::: could not read page {index + 1} locally: {e}")
+                text = ""
+            local.pages.append(text)
+            has_images = page_has_images(page)
+            if not _visible_chars(text) and not has_images:
+                local.blank_pages.append(index)
+            elif not page_text_is_readable(text, has_images):
+                local.failed_pages.append(index)
+    except Exception as e:
+        print(f"PDF text ::: could not open the PDF locally: {e}")
+        return LocalPdfText()
+    return local
+
+
+def pdf_with_pages(pdf_content: bytes, page_indexes: List[int]) -> bytes:
+    """A PDF with only the given pages of `pdf_content`"""
+    reader = PyPDF2.PdfReader(BytesIO(pdf_content))
+    writer = PyPDF2.PdfWriter()
+    for index in page_indexes:
+        writer.add_page(reader.pages[index])
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def _local_page_text(text: str) -> str:
+    return ' '.join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def _combine(local: LocalPdfText, llm_text: Optional[str]) -> str:
+    """The readable local pages in order, the LLM's text in place of the first failed page"""
+    parts = []
+    for index, text in enumerate(local.pages):
+        if index not in local.failed_pages:
+            parts.append(_local_page_text(text))
+        elif index == local.failed_pages[0] and llm_text:
+            parts.append(llm_text.strip())
+    return '\n'.join(part for part in parts if part)
+
+
+def _whole_file_text(local: LocalPdfText, llm_text: Optional[str]) -> str:
+    # Whatever the local parser found is still better than nothing when the LLM fails
+    return llm_text or '\n'.join(_local_page_text(text) for text in local.pages if text.strip())
+
+
+def _llm_input(pdf_content: bytes, local: LocalPdfText) -> Optional[bytes]:
+    """What the LLM has to read: None if the local text is enough, else the failed pages or the whole file"""
+    if local.needs_whole_file:
+        return pdf_content
+    if not local.failed_pages:
+        return None
+    try:
+        return pdf_with_pages(pdf_content, local.failed_pages)
+    except Exception as e:
+        print(f"PDF text ::: could not split the failed pages, sending the whole file: {e}")
+        return pdf_content
+
+
+def extract_pdf_text(pdf_content: bytes, llm_extract: Callable[[bytes], str],
+                     read_locally: Callable[[bytes], LocalPdfText] = read_pdf_text_locally) -> str:
+    """
+    Text of a PDF, read locally (by `read_locally`, e.g. on the PDF parsing pool) where the text is good
+    enough. `llm_extract` reads the rest: the failed pages as a smaller PDF, or the whole file when it
+    looks scanned.
+    """
+    local = read_locally(pdf_content)
+    llm_input = _llm_input(pdf_content, local)
+    if llm_input is None:
+        return _combine(local, None)
+    if llm_input is pdf_content:
+        print(f"PDF text ::: {len(local.pages)} pages, local text unusable, using the LLM for the whole file")
+        return _whole_file_text(local, llm_extract(pdf_content))
+    print(f"PDF text ::: using the LLM for {len(local.failed_pages)} of {len(local.pages)} pages")
+    return _combine(local, llm_extract(llm_input))
+
+
+async def aextract_pdf_text(pdf_content: bytes, llm_extract: Callable[[bytes], Awaitable[str]],
+                            read_locally: Callable[[bytes], LocalPdfText] = read_pdf_text_locally) -> str:
+    """Async version of `extract_pdf_text`; the local parsing runs in the executor"""
+    local = await asyncio.to_thread(read_locally, pdf_content)
+    llm_input = await asyncio.to_thread(_llm_input, pdf_content, local)
+    if llm_input is None:
+        return _combine(local, None)
+    if llm_input is pdf_content:
+        print(f"PDF text ::: {len(local.pages)} pages, local text unusable, using the LLM for the whole file")
+        return _whole_file_text(local, await llm_extract(pdf_content))
+    print(f"PDF text ::: using the LLM for {len(local.failed_pages)} of {len(local.pages)} pages")
+    return _combine(local, await llm_extract(llm_input))
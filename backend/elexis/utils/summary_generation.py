@@ -7,6 +7,8 @@ from google.generativeai.types import BlobDict
 import logging
 import requests
 from io import BytesIO
+from elexis.utils.pdf_text import extract_pdf_text, aextract_pdf_text
+from elexis.services.pdf_parsing_service import parse_pdf
 logger = logging.getLogger(__name__)
 
 
@@ -172,8 +174,11 @@ def experience_information_generation(signed_url):
     if response.status_code != 200:
         print("experience_information_generation::: Failed to download file from signed URL")
         return None
+    return experience_information_from_pdf_bytes(response.content)
 
-    pdf_blob = BlobDict(data=response.content, mime_type="application/pdf")
+
+def experience_information_from_pdf_bytes(pdf_content: bytes):
+    pdf_blob = BlobDict(data=pdf_content, mime_type="application/pdf")
 
     try:
         model = genai.GenerativeModel('gemini-2.0-flash')
@@ -205,8 +210,11 @@ def resume_summary_generator(signed_url):
     if response.status_code != 200:
         print("resume_summary_generator:::  Failed to download file from signed URL", signed_url)
         return None
+    return resume_summary_from_pdf_bytes(response.content)
+
 
-    pdf_blob = BlobDict(data=response.content, mime_type="application/pdf")
+def resume_summary_from_pdf_bytes(pdf_content: bytes):
+    pdf_blob = BlobDict(data=pdf_content, mime_type="application/pdf")
 
     try:
         model = genai.GenerativeModel('gemini-2.0-flash')
@@ -248,8 +256,19 @@ def extract_text_from_pdf(signed_url: str) -> str:
     if response.status_code != 200:
         print("extract_text_from_pdf ::: Failed to download file from signed URL", signed_url)
         return None
+    return extract_text_from_pdf_bytes(response.content)
+
+
+def extract_text_from_pdf_bytes(pdf_content: bytes) -> str:
+    """
+    `extract_text_from_pdf` for a PDF that was already downloaded: read locally, Gemini only reads the
+    pages (or scanned files) the local parser could not
+    """
+    return extract_pdf_text(pdf_content, _extract_text_with_gemini, read_locally=parse_pdf)
 
-    pdf_blob = BlobDict(data=response.content, mime_type="application/pdf")
+
+def _extract_text_with_gemini(pdf_content: bytes) -> str:
+    pdf_blob = BlobDict(data=pdf_content, mime_type="application/pdf")
     try:
         model = genai.GenerativeModel('gemini-2.0-flash')
         prompt = (
@@ -265,6 +284,34 @@ def extract_text_from_pdf(signed_url: str) -> str:
         resume_full_text = ''.join(response.text.splitlines()).strip()
         return  resume_full_text # Join lines and strip whitespace
 
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}", exc_info=True)
+        return ""
+
+
+async def aextract_text_from_pdf_bytes(pdf_content: bytes) -> str:
+    return await aextract_pdf_text(pdf_content, _aextract_text_with_gemini, read_locally=parse_pdf)
+
+
+async def _aextract_text_with_gemini(pdf_content: bytes) -> str:
+    from elexis.services.async_dependencies import dependency_limit, GEMINI
+
+    pdf_blob = BlobDict(data=pdf_content, mime_type="application/pdf")
+    try:
+        model = genai.GenerativeModel('gemini-2.0-flash')
+        prompt = (
+            "Extract all the etxt content from the candidates resume please."
+        )
+        async with dependency_limit(GEMINI):
+            response = await model.generate_content_async(
+                [prompt, pdf_blob],
+                generation_config={
+                    "response_mime_type": "text/plain",
+                }
+            )
+        resume_full_text = ''.join(response.text.splitlines()).strip()
+        return  resume_full_text # Join lines and strip whitespace
+
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}", exc_info=True)
         return ""
\ No newline at end of file
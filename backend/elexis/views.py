@@ -1,14 +1,23 @@
+import json
 import traceback
+import uuid
 from django.contrib.auth import authenticate
 from django.db.models import Q
 from elexis.utils.general import upsert_jd_vector, upsert_resume_vector
 from elexis.services.ecs_task import ECSAIBotTaskService, ECSInterviewLanguages, ECSInterviewTaskContext
 from elexis.services.daily import DailyMeetingService
 from elexis.services.questions_generator import generate_questions, GeneratedQuestionsDto
-from elexis.utils.summary_generation import resume_summary_generator , extract_text_from_pdf
+from elexis.services.resume_text_store import get_resume_text, get_resume_summary
 from elexis.services.resume_parser import extract_resume_data, extract_resumes_batch
-from elexis.services.unified_resume_processor import UnifiedResumeProcessor
+from elexis.services.unified_resume_processor import (
+    UnifiedResumeProcessor,
+    BULK_UPLOAD_MAX_FILES,
+    BULK_UPLOAD_MAX_FILE_BYTES,
+    BULK_UPLOAD_URL_EXPIRES_SECONDS,
+)
+from elexis.services.upload_progress import ProgressStream, progress_hub, tracker_snapshot
 from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 # from elexis.utils.get_file_data_from_s3 import generate_signed_url
 from django.core.mail import send_mail
 from collections import defaultdict
@@ -18,6 +27,8 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import Recruiter, Candidate, Job, Interview, InterviewQuestions ,JobMatchingResumeScore, JobRequirementEvaluation, JobQuestions, SuggestedCandidates, AiJdResumeMatchingResponse, ECSApplicationAutoScalingSchedule, ResumeUploadTracker
@@ -40,6 +51,7 @@ from .serializers import (
     ResumeUploadTrackerSerializer
 )
 from elexis.sqs_consumer import add_message_to_sqs_queue
+from elexis.services.sqs_producer import sqs_producer
 from datetime import datetime, timedelta
 from django.utils.timezone import make_aware, now
 from django.shortcuts import redirect
@@ -303,26 +315,8 @@ class CandidateViewSet(viewsets.ModelViewSet):
             
             resume_file = request.FILES['resume']
             
-            # Save temporarily to extract data
-            import tempfile
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                for chunk in resume_file.chunks():
-                    temp_file.write(chunk)
-                temp_file_path = temp_file.name
-            
-            # Use Gemini batch service for consistency (single file batch)
-            from elexis.services.gemini_batch_service import GeminiBatchService
-            try:
-                batch_service = GeminiBatchService()
-                batch_results = batch_service.process_resume_batch([temp_file_path])
-                extracted_data = batch_results.get(temp_file_path) if batch_results else None
-            except Exception as e:
-                # Fallback to original extraction method
-                print(f"Gemini batch extraction failed, falling back to original method: {e}")
-                extracted_data = extract_resume_data(temp_file_path)
-            
-            # Clean up
-            os.unlink(temp_file_path)
+            # Interactive: extracted directly, Gemini batch jobs are only for large bulk uploads
+            extracted_data = extract_resume_data(resume_file)
             
             # Check if extraction was successful
             has_data = extracted_data and (extracted_data.name or extracted_data.email or extracted_data.phone)
@@ -403,6 +397,125 @@ class CandidateViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated], url_path="bulk-upload/presign")
+    def presign_bulk_upload(self, request):
+        """
+        Start a bulk upload the client sends straight to S3: one presigned POST per file.
+        Body: {"files": [{"name", "content_type", "size"}], "job_id"}. Upload every file with its
+        `url` and `fields` (multipart form, file last), then call bulk-upload/<batch_job_id>/finalize/.
+        """
+        files = request.data.get('files')
+        if not files or not isinstance(files, list):
+            return Response(
+                {"error": "No resume files provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(files) > BULK_UPLOAD_MAX_FILES:
+            return Response(
+                {"error": f"Maximum {BULK_UPLOAD_MAX_FILES} files allowed per bulk upload"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Checked before anything is created, a bad entry would otherwise fail halfway through the upload
+        invalid = [
+            index for index, file in enumerate(files)
+            if not isinstance(file, dict)
+            or not isinstance(file.get('name'), str) or not file['name'].strip()
+            or not isinstance(file.get('size'), int) or isinstance(file['size'], bool) or file['size'] < 0
+            or not isinstance(file.get('content_type') or '', str)
+        ]
+        if invalid:
+            return Response(
+                {"error": "Each file must be an object with a name, a size in bytes and an optional content_type",
+                 "invalid_indexes": invalid},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        too_large = [file['name'] for file in files if file['size'] > BULK_UPLOAD_MAX_FILE_BYTES]
+        if too_large:
+            return Response(
+                {"error": f"Files larger than {BULK_UPLOAD_MAX_FILE_BYTES} bytes: {', '.join(too_large)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job_id = request.data.get('job_id')
+        if job_id and not Job.objects.filter(id=job_id, organization=request.user.organization).exists():
+            return Response(
+                {"error": "Job not found"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            tracker, uploads = UnifiedResumeProcessor.create_direct_bulk_upload_job(
+                organization=request.user.organization,
+                user=request.user,
+                files=files,
+                job_id=job_id
+            )
+        except Exception as e:
+            print(f"Error in bulk upload presign: {e}")
+            return Response(
+                {"error": "Bulk upload failed"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response({
+            "success": True,
+            "batch_job_id": str(tracker.batch_job_id),
+            "upload_type": tracker.upload_type,
+            "status": tracker.status,
+            "uploads": uploads,
+            "expires_in": BULK_UPLOAD_URL_EXPIRES_SECONDS,
+            "finalize_endpoint": f"/candidates/bulk-upload/{tracker.batch_job_id}/finalize/"
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated],
+            url_path="bulk-upload/(?P<batch_job_id>[^/.]+)/finalize")
+    def finalize_bulk_upload(self, request, batch_job_id=None):
+        """
+        Queue the processing of a presigned bulk upload.
+        Body (optional): {"failed_indexes": [...]} for files the client could not upload.
+        """
+        try:
+            tracker = ResumeUploadTracker.objects.get(
+                batch_job_id=batch_job_id, organization=request.user.organization
+            )
+        except (ResumeUploadTracker.DoesNotExist, ValueError, DjangoValidationError):
+            return Response(
+                {"error": "Upload job not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        details = tracker.processing_details or {}
+        if not details.get('direct_upload'):
+            return Response(
+                {"error": "Upload job was not created for direct upload"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if details.get('finalized_at') or tracker.status != 'pending':
+            return Response(
+                {"error": "Upload job is already finalized"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        failed_indexes = request.data.get('failed_indexes') or []
+        if not isinstance(failed_indexes, list) or not all(isinstance(index, int) for index in failed_indexes):
+            return Response(
+                {"error": "failed_indexes must be a list of file indexes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        UnifiedResumeProcessor.finalize_direct_bulk_upload(tracker, request.user, failed_indexes)
+        return Response({
+            "success": True,
+            "message": f"Bulk upload initiated for {tracker.total_files} files",
+            "batch_job_id": str(tracker.batch_job_id),
+            "upload_type": tracker.upload_type,
+            "status": tracker.status,
+            "processing_details": {
+                "total_files": tracker.total_files,
+                "is_async": True,
+                "status_endpoint": f"/upload-tracker/status/{tracker.batch_job_id}/"
+            }
+        }, status=status.HTTP_202_ACCEPTED)
+
 
 class InterviewViewSet(viewsets.ModelViewSet):
         queryset = Interview.objects.all()
@@ -494,7 +607,7 @@ class InterviewViewSet(viewsets.ModelViewSet):
 
                     # TODO : check if the cosine similarity for this candidate's resume and jd is already present in DB , if not , get the cosine similarity and add it to the DB 
                     if not resume_embedding_id:
-                        resume_text = extract_text_from_pdf(candidate.resume.url) if candidate.resume else ""
+                        resume_text = get_resume_text(candidate) if candidate.resume else ""
                         resume_embedding_id = upsert_resume_vector(candiate_name=candidate.name,
                                                 candidate_id=candidate.id,
                                                 resume_full_text=resume_text,
@@ -911,9 +1024,8 @@ class QuestionsGeneratorAPIView(APIView):
             # If interview_id is provided, fetch the interview object
             try:
                 interview = Interview.objects.get(id=interview_id)
-                resume_url = interview.candidate.resume.url
-                if resume_url:
-                    resume = resume_summary_generator(resume_url)
+                if interview.candidate.resume:
+                    resume = get_resume_summary(interview.candidate)
                     print("Resume Summary Generated:", resume)
             except Interview.DoesNotExist:
                 return Response({"error": "Interview not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -1085,6 +1197,8 @@ class JobMatchingResumeScoreViewSet(viewsets.ModelViewSet):
                             add_message_to_sqs_queue(type='rank-resumes', data ={
                                     "jobId":str(item)
                             })
+                    # send the 2N+1 messages now, in batches of 10
+                    sqs_producer.flush()
                 transaction.on_commit(after_commit)
                 return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         except Exception as e:
@@ -1160,6 +1274,15 @@ class SuggestedCandidatesViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for text/event-stream; the stream itself is a StreamingHttpResponse"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode('utf-8')
+
+
 # Upload Status Tracking ViewSet
 class ResumeUploadTrackerViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -1193,6 +1316,43 @@ class ResumeUploadTrackerViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=["get"], url_path="stream", renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def stream_progress(self, request):
+        """
+        Server-sent events with the progress of the organization's active uploads (or of the
+        comma separated `batch_job_id`s): a snapshot per upload, then only the fields that changed.
+        Replaces polling status/, active/ and recent/ while an import runs.
+        """
+        try:
+            batch_job_ids = [str(uuid.UUID(batch_job_id)) for batch_job_id in request.query_params.get('batch_job_id', '').split(',') if batch_job_id]
+        except ValueError:
+            return Response({"error": "Invalid batch_job_id"}, status=status.HTTP_400_BAD_REQUEST)
+        # Subscribe before reading the snapshots, so no change made in between is missed
+        subscription = progress_hub.subscribe(request.user.organization_id, batch_job_ids)
+        if subscription is None:
+            response = Response({"error": "Too many progress streams, poll status/ instead"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '30'
+            return response
+        stream = None
+        try:
+            trackers = ResumeUploadTracker.objects.filter(organization=request.user.organization)
+            if batch_job_ids:
+                trackers = trackers.filter(batch_job_id__in=batch_job_ids)
+            else:
+                trackers = trackers.filter(status__in=['pending', 'processing'])
+            initial = [tracker_snapshot(tracker) for tracker in trackers.order_by('-created_date')]
+            stream = ProgressStream(subscription, initial)
+        finally:
+            # From here on the response closes the stream, which unsubscribes
+            if stream is None:
+                progress_hub.unsubscribe(subscription)
+
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
     @action(detail=False, methods=["get"], url_path="recent")
     def get_recent_uploads(self, request):
         """
@@ -267,3 +267,14 @@ PINECONE_REGION = os.environ.get('PINECONE_REGION','us-east-1')
 PINECONE_CLOUD= os.environ.get('PINECONE_CLOUD','aws')
 PINECONE_ENVIRONMENT = os.environ.get('PINECONE_ENVIRONMENT') # e.g., 'gcp-starter' or 'us-west1-gcp'
 PINECONE_INDEX_NAME = os.environ.get('PINECONE_INDEX_NAME', 'talk-to-resume')  # Default index name if not set
+
+# SQS consumer runtime (python manage.py run_consumer)
+SQS_CONSUMER_MODE = os.getenv("SQS_CONSUMER_MODE", "thread")  # 'thread', 'process' or 'async'
+SQS_CONSUMER_WORKERS = int(os.getenv("SQS_CONSUMER_WORKERS", 8))  # threads (per process in 'process' mode)
+SQS_CONSUMER_PROCESSES = int(os.getenv("SQS_CONSUMER_PROCESSES", 2))
+SQS_CONSUMER_BATCH_SIZE = int(os.getenv("SQS_CONSUMER_BATCH_SIZE", 10))
+SQS_CONSUMER_CONCURRENCY = int(os.getenv("SQS_CONSUMER_CONCURRENCY", 200))  # messages in flight in 'async' mode
+SQS_CONSUMER_SYNC_THREADS = int(os.getenv("SQS_CONSUMER_SYNC_THREADS", 32))  # executor for ORM and sync handlers in 'async' mode
+PDF_PARSER_PROCESSES = int(os.getenv("PDF_PARSER_PROCESSES") or max((os.cpu_count() or 2) - 1, 1))  # PDF parsing processes per consumer (split across the processes in 'process' mode)
+# Legacy mode: also run a consumer thread inside every web worker
+SQS_CONSUMER_IN_WEB = True if os.getenv("SQS_CONSUMER_IN_WEB", "False") == "True" else False
@@ -14,8 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'elexis_dashboard.settings')
 application = get_wsgi_application()
 
+from django.conf import settings
 
-from elexis.sqs_consumer import start_sqs_consumer
-threading.Thread(target=start_sqs_consumer, daemon=True).start()
+# The consumer normally runs on its own (`python manage.py run_consumer`);
+# SQS_CONSUMER_IN_WEB keeps the old in-process daemon thread for local setups.
+if settings.SQS_CONSUMER_IN_WEB:
+    from elexis.sqs_consumer import start_sqs_consumer
+    threading.Thread(target=start_sqs_consumer, daemon=True).start()
 
 